@@ -0,0 +1,111 @@
+# apps/api.py
+"""
+Lean read-only API base.
+
+``ValuesReadOnlyViewSet`` serializes rows straight from ``values()``:
+the query selects only the requested columns (joined columns included)
+and each row becomes a dict, with no model instances and no serializer
+fields in between. Subclasses declare ``api_fields``, which maps each
+output name to a lookup (``'category__name'``) or an expression, and
+``default_fields``. Clients choose columns with ``?fields=a,b,c``.
+
+Decimal, date and datetime columns are turned into strings up front
+(decimals exactly, as ModelSerializer renders them), so the JSON encoder
+never falls back to Python code for a value.
+
+Lists use cursor pagination on the primary key, so a page costs the same
+however deep the client has read and rows inserted meanwhile are neither
+skipped nor repeated. Responses over 200 bytes are gzipped when the
+client accepts it.
+"""
+from datetime import date
+
+from django.db.models import F
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def encode_datetime(value):
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+ENCODERS = {
+    'DecimalField': str,
+    'DateField': date.isoformat,
+    'DateTimeField': encode_datetime,
+}
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ValuesReadOnlyViewSet(viewsets.GenericViewSet):
+    api_fields = {}
+    default_fields = ()
+    pagination_class = PrimaryKeyCursorPagination
+    # Primary keys are integers; anything else is a 404 from the router, not a query error
+    lookup_value_regex = r'\d+'
+
+    def get_field_names(self):
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return list(self.default_fields)
+        names = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+        if unknown := [name for name in names if name not in self.api_fields]:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.api_fields)}"})
+        return names
+
+    def get_rows(self, queryset, names):
+        """``values()`` queryset with one column per field, plus ``id`` for the cursor."""
+        columns = {}
+        for name in names:
+            source = self.api_fields[name]
+            # Aliases keep output names free of clashes with model field names
+            columns[f'_{name}'] = F(source) if isinstance(source, str) else source
+        return queryset.values('id', **columns)
+
+    def get_encoders(self, rows, names):
+        """``(name, encoder)`` for the columns whose values JSON cannot represent as is."""
+        encoders = []
+        for name in names:
+            field = rows.query.annotations[f'_{name}'].output_field
+            if encoder := ENCODERS.get(field.get_internal_type()):
+                encoders.append((name, encoder))
+        return encoders
+
+    def to_representation(self, rows, names, encoders):
+        keys = [(name, f'_{name}') for name in names]
+        data = [{name: row[key] for name, key in keys} for row in rows]
+        for name, encoder in encoders:
+            for item in data:
+                if item[name] is not None:
+                    item[name] = encoder(item[name])
+        self.add_related(data, rows, names)
+        return data
+
+    def add_related(self, data, rows, names):
+        """Hook for fields filled by a second query over the page (e.g. nested lists)."""
+
+    def list(self, request, *args, **kwargs):
+        names = self.get_field_names()
+        rows = self.get_rows(self.filter_queryset(self.get_queryset()), names)
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(self.to_representation(page, names, self.get_encoders(rows, names)))
+
+    def retrieve(self, request, *args, **kwargs):
+        names = self.get_field_names()
+        rows = self.get_rows(self.get_queryset().filter(pk=kwargs['pk']), names)
+        row = rows.first()
+        if row is None:
+            raise Http404
+        return Response(self.to_representation([row], names, self.get_encoders(rows, names))[0])
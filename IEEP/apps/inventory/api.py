@@ -0,0 +1,175 @@
+# inventory/api.py
+import time
+from datetime import timedelta
+
+import django_filters
+from django.core.cache import cache
+from django.db.models import BooleanField, ExpressionWrapper, F
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.api import ValuesReadOnlyViewSet
+from apps.polling import AsyncJsonView, watcher
+from apps.products.models import Product
+from apps.reports.cache import data_version_key
+from .models import LOW_STOCK, StockItem, Warehouse
+
+# Bumped after commit on every stock item write (reports/signals.py)
+STOCK_VERSION_KEY = data_version_key('inventory.StockItem')
+# Re-read this far back so rows stamped before a slower transaction committed are not missed
+DELTA_OVERLAP = timedelta(seconds=10)
+DELTA_LIMIT = 500
+DELTA_FIELDS = {
+    'sku': F('product__sku'),
+    'warehouse_code': F('warehouse__code'),
+    'is_low_stock': ExpressionWrapper(LOW_STOCK, output_field=BooleanField()),
+}
+
+
+class WarehouseViewSet(ValuesReadOnlyViewSet):
+    queryset = Warehouse.objects.all()
+    filterset_fields = ['is_active']
+    api_fields = {
+        'id': 'id',
+        'code': 'code',
+        'name': 'name',
+        'location': 'location',
+        'capacity': 'capacity',
+        'description': 'description',
+        'manager_id': 'manager_id',
+        'manager': 'manager__username',
+        'is_active': 'is_active',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    default_fields = ('id', 'code', 'name', 'location', 'is_active')
+
+
+class StockItemFilter(django_filters.FilterSet):
+    product_type = django_filters.CharFilter(field_name='product__product_type')
+    low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+
+    class Meta:
+        model = StockItem
+        fields = ['product', 'warehouse', 'procurement_status']
+
+    def filter_low_stock(self, queryset, name, value):
+        return queryset.filter(LOW_STOCK) if value else queryset.exclude(LOW_STOCK)
+
+
+class StockItemViewSet(ValuesReadOnlyViewSet):
+    queryset = StockItem.objects.all()
+    filterset_class = StockItemFilter
+    api_fields = {
+        'id': 'id',
+        'product_id': 'product_id',
+        'sku': 'product__sku',
+        'product': 'product__name',
+        'warehouse_id': 'warehouse_id',
+        'warehouse': 'warehouse__code',
+        'quantity': 'quantity',
+        'unit': 'product__unit_of_measure__symbol',
+        'unit_cost': 'unit_cost',
+        'reorder_threshold': 'reorder_threshold',
+        'is_low_stock': ExpressionWrapper(LOW_STOCK, output_field=BooleanField()),
+        'batch_number': 'batch_number',
+        'location': 'location',
+        'expiry_date': 'expiry_date',
+        'manufactured_date': 'manufactured_date',
+        'procurement_status': 'procurement_status',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    default_fields = ('id', 'sku', 'warehouse', 'quantity', 'unit', 'reorder_threshold', 'is_low_stock', 'batch_number')
+
+
+async def stock_version():
+    version = await cache.aget(STOCK_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a flushed cache never reissues an old version
+        await cache.aadd(STOCK_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(STOCK_VERSION_KEY)
+    return version
+
+
+class StockDeltaView(AsyncJsonView):
+    """
+    Stock items changed since the last poll.
+
+    The first request (no parameters) returns the current ``version`` and
+    a ``cursor``. Passing both back holds the request until a stock item is
+    written (or the long-poll timeout passes), then returns the changed
+    rows, a new version and a new cursor. Rows are current state, so a
+    client applies them as upserts; one may be sent twice. Deletions only
+    move the version. When more than ``DELTA_LIMIT`` rows changed the
+    response asks for a ``reload`` instead.
+    """
+    async def get(self, request):
+        since = request.GET.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return JsonResponse({'error': "Invalid 'since' cursor"}, status=400)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        version = await stock_version()
+        if str(version) == request.GET.get('version'):
+            if not await watcher.wait(STOCK_VERSION_KEY, version):
+                return JsonResponse({
+                    'version': str(version), 'cursor': request.GET.get('since') or timezone.now(),
+                    'items': [], 'reload': False,
+                })
+            version = await stock_version()
+
+        cursor = timezone.now()
+        items = []
+        if since is not None:
+            rows = (
+                StockItem.objects.filter(updated_at__gt=since - DELTA_OVERLAP)
+                .order_by('updated_at', 'id')
+                .values('id', 'product_id', 'warehouse_id', 'quantity', 'reorder_threshold',
+                        'procurement_status', 'updated_at', **DELTA_FIELDS)
+            )
+            items = [row async for row in rows[:DELTA_LIMIT + 1]]
+        reload = len(items) > DELTA_LIMIT
+        return JsonResponse({
+            'version': str(version), 'cursor': cursor, 'items': [] if reload else items, 'reload': reload,
+        })
+
+
+class StockLookupView(AsyncJsonView):
+    """
+    Scanned-code lookup: the product whose SKU, product code or stock batch
+    number matches ``code``, with its stock per warehouse (only the
+    matching batch for a batch number).
+    """
+    async def get(self, request, code):
+        products = Product.objects.values('id', 'sku', 'name', 'product_type', unit=F('unit_of_measure__symbol'))
+        stock = StockItem.objects.order_by('warehouse__code', 'id').values(
+            'id', 'warehouse_id', 'quantity', 'batch_number', 'location', 'expiry_date',
+            warehouse_code=F('warehouse__code'),
+        )
+        # One lookup per column, the unique SKU first, so no query ORs an indexed column with unindexed ones
+        match = 'sku'
+        product = await products.filter(sku=code).afirst()
+        if product is None:
+            match = 'product_code'
+            product = await products.filter(product_code=code).afirst()
+        if product is None:
+            match = 'batch_number'
+            batch = await StockItem.objects.filter(batch_number=code).values_list('product_id', flat=True).afirst()
+            if batch is not None:
+                product = await products.filter(pk=batch).afirst()
+                stock = stock.filter(batch_number=code)
+        if product is None:
+            return JsonResponse({'error': f"No product or batch matches '{code}'"}, status=404)
+
+        items = [row async for row in stock.filter(product_id=product['id'])]
+        return JsonResponse({
+            'match': match,
+            'product': product,
+            'stock': items,
+            'total_quantity': sum(item['quantity'] for item in items),
+        })
@@ -5,3 +5,6 @@ class InventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.inventory'
 
+    def ready(self):
+        from .handlers import register_handlers
+        register_handlers()
@@ -0,0 +1,27 @@
+from django import forms
+from .models import StockItem, StockTransaction
+
+class StockAdjustmentForm(forms.ModelForm):
+    """Set a stock item's balance to a counted quantity, recorded as an adjustment in its ledger."""
+
+    class Meta:
+        model = StockTransaction
+        fields = ['stock_item', 'quantity', 'reference', 'notes']
+        labels = {'quantity': 'New Quantity'}
+        widgets = {
+            'stock_item': forms.Select(attrs={'class': 'w-full rounded-md border-gray-300 shadow-sm'}),
+            'quantity': forms.NumberInput(attrs={'class': 'w-full rounded-md border-gray-300 shadow-sm', 'step': '0.01', 'min': '0'}),
+            'reference': forms.TextInput(attrs={'class': 'w-full rounded-md border-gray-300 shadow-sm'}),
+            'notes': forms.Textarea(attrs={'class': 'w-full rounded-md border-gray-300 shadow-sm', 'rows': 3}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['stock_item'].queryset = StockItem.objects.select_related('product', 'warehouse')
+        self.instance.transaction_type = 'adjustment'
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data['quantity']
+        if quantity < 0:
+            raise forms.ValidationError("A counted quantity cannot be negative.")
+        return quantity
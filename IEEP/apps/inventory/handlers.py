@@ -0,0 +1,57 @@
+# inventory/handlers.py
+"""Outbox handlers for stock events (see outbox.py), registered by InventoryConfig.ready."""
+from django.urls import NoReverseMatch, reverse
+
+from apps.notifications.services import notify
+from . import outbox
+from .models import LOW_STOCK, ReorderAlert, StockEvent, StockItem
+
+
+def raise_reorder_alerts(events):
+    """
+    Open a reorder alert for each stock item posted to that is now low on
+    stock (``LOW_STOCK``), unless one is already active, and notify the
+    item's alert recipients. The current balance decides, not the event's,
+    so a late or redelivered event cannot alert on a balance that has since
+    changed, and a repeated batch opens nothing twice.
+    """
+    latest = {}
+    for event in events:
+        if event.pk > getattr(latest.get(event.stock_item_id), 'pk', 0):
+            latest[event.stock_item_id] = event
+    # Items deleted since the posting drop out here
+    low = set(StockItem.objects.filter(LOW_STOCK, pk__in=latest).values_list('pk', flat=True))
+    if not low:
+        return
+    alerted = set(
+        ReorderAlert.objects.filter(stock_item_id__in=low, status='active').values_list('stock_item_id', flat=True)
+    )
+    opened = [item_id for item_id in latest if item_id in low and item_id not in alerted]
+    ReorderAlert.objects.bulk_create([
+        ReorderAlert(
+            stock_item_id=item_id,
+            triggered_by_id=latest[item_id].payload['created_by_id'],
+            notes=f"Balance {latest[item_id].payload['balance']} after transaction {latest[item_id].payload['transaction_id']}",
+        )
+        for item_id in opened
+    ])
+    # Runs in the relay's transaction, so a failed batch rolls the notifications back with the alerts
+    for item in StockItem.objects.filter(pk__in=opened).select_related('product', 'warehouse__manager'):
+        notify(
+            item.alert_recipients,
+            f"Reorder {item.product.sku} at {item.warehouse.code}",
+            f"{item.quantity} left, reorder threshold {item.reorder_threshold}.",
+            kind='reorder',
+            url=_item_url(item.pk),
+        )
+
+
+def _item_url(item_id):
+    try:
+        return reverse('stock-item-detail', args=[item_id])
+    except NoReverseMatch:
+        return ''
+
+
+def register_handlers():
+    outbox.register('reorder-alerts', raise_reorder_alerts, topics=[StockEvent.POSTED])
@@ -0,0 +1,114 @@
+# inventory/management/commands/reconcile_stock.py
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from apps.inventory import reconcile
+from apps.inventory.models import StockItem
+from apps.reports.cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = "Check stock balances against the transaction ledger in parallel chunks, report drift and optionally repair it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=reconcile.CHUNK_SIZE,
+                            help=f"Stock item ids per chunk (default: {reconcile.CHUNK_SIZE})")
+        parser.add_argument('--workers', type=int,
+                            help="Worker processes (default: one per CPU; 1 runs in this process)")
+        parser.add_argument('--from-id', type=int, help="First stock item id to check")
+        parser.add_argument('--to-id', type=int, help="Last stock item id to check")
+        parser.add_argument('--repair', action='store_true',
+                            help="Set drifted balances to the ledger balance")
+        parser.add_argument('--state', default='reconcile_stock.json',
+                            help="Progress file, written after each chunk (default: reconcile_stock.json)")
+        parser.add_argument('--resume', action='store_true',
+                            help="Skip the chunks already recorded in --state by an interrupted run")
+        parser.add_argument('--report', help="Write every drifted item to this CSV file")
+        parser.add_argument('--show', type=int, default=20,
+                            help="Drifted items to list on stdout (default: 20)")
+
+    def handle(self, *args, **options):
+        state = self.load_state(options) if options['resume'] else None
+        if state is None:
+            bounds = StockItem.objects.aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['first'] is None:
+                self.stdout.write("No stock items")
+                return
+            state = {
+                'from_id': bounds['first'] if options['from_id'] is None else options['from_id'],
+                'to_id': bounds['last'] if options['to_id'] is None else options['to_id'],
+                'chunk_size': options['chunk_size'],
+                'repair': options['repair'],
+                'completed': [],
+                'checked': 0,
+                'repaired': 0,
+                'drift': [],
+            }
+        ranges = reconcile.chunk_ranges(state['from_id'], state['to_id'], state['chunk_size'])
+        done = {tuple(chunk) for chunk in state['completed']}
+        pending = [chunk for chunk in ranges if chunk not in done]
+        self.stdout.write(
+            f"Checking ids {state['from_id']}-{state['to_id']}: {len(pending)} of {len(ranges)} chunks"
+            f"{' (resumed)' if done else ''}"
+        )
+
+        started = time.monotonic()
+        repaired = 0
+        try:
+            for result in reconcile.reconcile(pending, workers=options['workers'], repair=state['repair']):
+                state['completed'].append([result['start'], result['end']])
+                state['checked'] += result['checked']
+                state['repaired'] += result['repaired']
+                state['drift'].extend(result['drift'])
+                repaired += result['repaired']
+                self.save_state(options['state'], state)
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f"  {result['start']}-{result['end'] - 1}: {result['checked']} checked, "
+                        f"{len(result['drift'])} drifted"
+                    )
+        finally:
+            if repaired:
+                bump_data_version('inventory.StockItem')
+
+        self.report(state, options, time.monotonic() - started)
+        os.remove(options['state'])
+
+    def load_state(self, options):
+        try:
+            with open(options['state']) as fh:
+                state = json.load(fh)
+        except FileNotFoundError:
+            raise CommandError(f"Nothing to resume: {options['state']} does not exist")
+        if options['repair'] != state['repair']:
+            raise CommandError(f"The interrupted run was {'' if state['repair'] else 'not '}repairing; "
+                               f"resume it with the same --repair setting")
+        return state
+
+    def save_state(self, path, state):
+        # Write then rename, so an interrupted write never leaves a truncated file
+        with open(f'{path}.tmp', 'w') as fh:
+            json.dump(state, fh)
+        os.replace(f'{path}.tmp', path)
+
+    def report(self, state, options, elapsed):
+        drift = sorted(state['drift'])
+        self.stdout.write(
+            f"{state['checked']} items checked in {elapsed:.1f}s, {len(drift)} drifted"
+            + (f", {state['repaired']} repaired" if state['repair'] else "")
+        )
+        for item_id, balance, ledger in drift[:options['show']]:
+            self.stdout.write(f"  stock item {item_id}: balance {balance}, ledger {ledger}")
+        if len(drift) > options['show']:
+            self.stdout.write(f"  ... and {len(drift) - options['show']} more")
+        if options['report']:
+            with open(options['report'], 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['stock_item_id', 'balance', 'ledger_balance'])
+                writer.writerows(drift)
+            self.stdout.write(f"Drift written to {options['report']}")
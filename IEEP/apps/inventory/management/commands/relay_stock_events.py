@@ -0,0 +1,28 @@
+# inventory/management/commands/relay_stock_events.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.inventory import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver pending stock events to the outbox handlers, once or continuously"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep relaying, for a dedicated low-latency relay process")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds between runs with --loop when nothing was pending (default: 1)")
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE,
+                            help=f"Events read per query (default: {outbox.BATCH_SIZE})")
+
+    def handle(self, *args, **options):
+        while True:
+            dispatched = outbox.relay(batch_size=options['batch_size'])
+            if dispatched or not options['loop']:
+                self.stdout.write(f"{dispatched} events dispatched")
+            if not options['loop']:
+                return
+            if not dispatched:
+                time.sleep(options['interval'])
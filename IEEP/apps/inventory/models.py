@@ -1,9 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.conf import settings
 from django.utils import timezone
 from apps.products.models import Product
+from apps.users.capture import AuditedModel
 
-class Warehouse(models.Model):
+# Low stock as the list views and the low stock report define it; see StockItem.is_low_stock
+LOW_STOCK = Q(quantity__gt=0, quantity__lte=F('reorder_threshold'))
+
+class Warehouse(AuditedModel):
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
@@ -38,7 +43,7 @@ class Warehouse(models.Model):
             return (self.total_items / self._capacity_numeric) * 100
         return 0
 
-class StockItem(models.Model):
+class StockItem(AuditedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_items')
     warehouse = models.ForeignKey('Warehouse', on_delete=models.CASCADE, related_name='stock_items')
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -59,6 +64,7 @@ class StockItem(models.Model):
     last_low_stock_alert = models.DateTimeField(null=True, blank=True)
     alert_cooldown_days = models.PositiveSmallIntegerField(default=1)
     ALERT_COOLDOWN_HOURS = 24
+    audit_exclude = ('created_at', 'updated_at', 'last_low_stock_alert')
     
     @property
     def total_value(self):
@@ -89,18 +95,15 @@ class StockItem(models.Model):
     @property
     def alert_recipients(self):
         """Get users who should receive alerts for this stock item"""
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
+        from apps.users.permissions import users_in_groups
         
         recipients = set()
         
         if self.warehouse.manager:
             recipients.add(self.warehouse.manager)
         
-        inventory_users = User.objects.filter(
-            groups__name__in=['Inventory Manager', 'Procurement Manager']
-        )
-        recipients.update(inventory_users)
+        # Cached until group membership changes, so bulk alerting does not query per item
+        recipients.update(users_in_groups(['Inventory Manager', 'Procurement Manager']))
         
         return list(recipients)
     
@@ -128,6 +131,9 @@ class StockItem(models.Model):
     def __str__(self):
         return f"{self.product.sku} at {self.warehouse.code} (Batch: {self.batch_number or '-'})"
 
+    def audit_repr(self):
+        return f"Stock item {self.pk} (Batch: {self.batch_number or '-'})"
+
     def save(self, *args, **kwargs):
         if not self.pk and self.reorder_threshold == 0:
             if self.product.reorder_threshold > 0:
@@ -194,20 +200,70 @@ class StockTransaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['stock_item', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.stock_item.product.sku} - {self.get_transaction_type_display()}"
     
     def save(self, *args, **kwargs):
-        if self.transaction_type == 'in':
-            self.stock_item.quantity += self.quantity
-        elif self.transaction_type == 'out':
-            self.stock_item.quantity -= self.quantity
-        elif self.transaction_type == 'adjustment':
-            self.stock_item.quantity = self.quantity
-        
-        self.stock_item.save()
-        super().save(*args, **kwargs)
+        posting = self._state.adding
+        # The balance, the ledger row and its outbox event commit together or not at all
+        with transaction.atomic():
+            if self.transaction_type == 'in':
+                self.stock_item.quantity += self.quantity
+            elif self.transaction_type == 'out':
+                self.stock_item.quantity -= self.quantity
+            elif self.transaction_type == 'adjustment':
+                self.stock_item.quantity = self.quantity
+
+            self.stock_item.save()
+            super().save(*args, **kwargs)
+            if posting:
+                StockEvent.objects.create(
+                    topic=StockEvent.POSTED, stock_item_id=self.stock_item_id, payload=self.event_payload()
+                )
+
+    def event_payload(self):
+        item = self.stock_item
+        return {
+            'transaction_id': self.pk,
+            'transaction_type': self.transaction_type,
+            'quantity': str(self.quantity),
+            'balance': str(item.quantity),
+            'reorder_threshold': str(item.reorder_threshold),
+            'product_id': item.product_id,
+            'warehouse_id': item.warehouse_id,
+            'created_by_id': self.created_by_id,
+        }
+
+class StockEvent(models.Model):
+    """
+    Transactional outbox: one row per ledger posting, written in the
+    posting's transaction and delivered to handlers by inventory/outbox.py.
+    """
+    POSTED = 'stock.posted'
+
+    topic = models.CharField(max_length=50)
+    # No foreign key: events outlive their stock item and never lock it
+    stock_item_id = models.BigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set once every handler has processed the event
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Failed deliveries; after STOCK_EVENT_MAX_ATTEMPTS the event is set aside
+    # (failed_at) and no longer relayed until failed_at is cleared
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['dispatched_at', 'id'])]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk} (stock item {self.stock_item_id})"
 
 class ReorderAlert(models.Model):
     stock_item = models.ForeignKey(StockItem, on_delete=models.CASCADE, related_name='reorder_alerts')
@@ -231,7 +287,7 @@ class ReorderAlert(models.Model):
     def __str__(self):
         return f"Reorder Alert for {self.stock_item.product.sku} at {self.stock_item.warehouse.code}"
 
-class Order(models.Model):
+class Order(AuditedModel):
     ORDER_STATUS = (
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
@@ -277,7 +333,7 @@ class Order(models.Model):
                 created_by=self.created_by
             )
 
-class OrderItem(models.Model):
+class OrderItem(AuditedModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='order_items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
@@ -289,3 +345,6 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity} x {self.product.sku} for Order {self.order.order_number}"
+
+    def audit_repr(self):
+        return f"{self.quantity} x product {self.product_id} for order {self.order_id}"
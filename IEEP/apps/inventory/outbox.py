@@ -0,0 +1,140 @@
+# inventory/outbox.py
+"""
+Stock event relay.
+
+Every ledger posting writes one ``StockEvent`` row in its own transaction
+(see ``StockTransaction.save``), so a posting costs one insert however
+many consumers react to it. ``relay`` hands undelivered events to every
+registered handler a batch at a time, oldest first, and marks them
+dispatched.
+
+Delivery is at least once. A batch is claimed with ``SELECT ... FOR
+UPDATE SKIP LOCKED``, handled and marked in one transaction, so
+concurrent relays never take the same events. If a handler raises, the
+batch rolls back and its events are delivered again one at a time, each
+in its own transaction, so one bad event does not hold up the rest. A
+failing event counts an attempt and keeps the error in ``last_error``;
+it is retried by later runs until ``STOCK_EVENT_MAX_ATTEMPTS``, then set
+aside with ``failed_at`` and skipped until that is cleared. Handlers see
+an event again on every retry and must therefore be idempotent.
+
+An event only becomes visible when its posting commits. A slow posting's
+event is therefore picked up by the first run after its commit, even if
+later events were delivered first. A posting that rolls back leaves no
+event and holds nothing up. Handlers must not assume events arrive in id
+order across batches.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StockEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+_handlers = {}
+
+
+def register(name, handler, topics=None):
+    """
+    Deliver events to ``handler(events)``, a list of ``StockEvent``. With
+    ``topics``, only events of those topics.
+    """
+    _handlers[name] = (handler, frozenset(topics) if topics else None)
+
+
+class HandlerError(Exception):
+    def __init__(self, name, error):
+        super().__init__(f"{name}: {type(error).__name__}: {error}")
+        self.name = name
+
+
+def _pending():
+    return (
+        StockEvent.objects.select_for_update(skip_locked=True)
+        .filter(dispatched_at__isnull=True, failed_at__isnull=True).order_by('pk')
+    )
+
+
+def _deliver(events):
+    """Hand ``events`` to every handler and mark them dispatched, in the caller's transaction."""
+    for name, (handler, topics) in _handlers.items():
+        pending = [event for event in events if topics is None or event.topic in topics]
+        if pending:
+            try:
+                handler(pending)
+            except Exception as exc:
+                raise HandlerError(name, exc) from exc
+    StockEvent.objects.filter(pk__in=[event.pk for event in events]).update(dispatched_at=timezone.now())
+
+
+def _record_failure(event, error):
+    attempts = event.attempts + 1
+    set_aside = attempts >= getattr(settings, 'STOCK_EVENT_MAX_ATTEMPTS', 5)
+    StockEvent.objects.filter(pk=event.pk).update(
+        attempts=attempts, last_error=str(error), failed_at=timezone.now() if set_aside else None,
+    )
+    if set_aside:
+        logger.error("Stock event %s failed %s times and is set aside: %s", event.pk, attempts, error)
+
+
+def _deliver_each(events):
+    """Deliver a failed batch one event at a time; returns ``(dispatched, failed ids)``."""
+    dispatched, failed = 0, []
+    for event in events:
+        try:
+            with transaction.atomic():
+                # Locks were released by the rollback; another relay may have taken the event since
+                claimed = list(_pending().filter(pk=event.pk))
+                if claimed:
+                    _deliver(claimed)
+                    dispatched += 1
+        except Exception as exc:
+            logger.warning("Stock event %s failed: %s", event.pk, exc, exc_info=True)
+            failed.append(event.pk)
+            _record_failure(event, exc)
+    return dispatched, failed
+
+
+def relay(batch_size=BATCH_SIZE, max_batches=None):
+    """Deliver pending events to every handler; returns the number of events dispatched."""
+    dispatched = 0
+    batches = 0
+    # Events that failed in this run wait for the next one
+    failed = set()
+    while max_batches is None or batches < max_batches:
+        events = []
+        try:
+            with transaction.atomic():
+                events = list(_pending().exclude(pk__in=failed)[:batch_size])
+                if not events:
+                    break
+                _deliver(events)
+            dispatched += len(events)
+        except Exception as exc:
+            if not events:
+                logger.exception("Stock event relay failed; pending events will be retried")
+                break
+            logger.error("Stock event batch failed (%s); delivering its events one at a time", exc)
+            try:
+                delivered, failures = _deliver_each(events)
+            except Exception:
+                logger.exception("Stock event relay failed; pending events will be retried")
+                break
+            dispatched += delivered
+            failed.update(failures)
+        batches += 1
+        if len(events) < batch_size:
+            break
+    return dispatched
+
+
+def prune(older_than):
+    """Delete dispatched events older than ``older_than``; returns the count."""
+    cutoff = timezone.now() - older_than
+    deleted, _ = StockEvent.objects.filter(dispatched_at__isnull=False, created_at__lt=cutoff).delete()
+    return deleted
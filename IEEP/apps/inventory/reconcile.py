@@ -0,0 +1,137 @@
+# inventory/reconcile.py
+"""
+Ledger-to-balance reconciliation.
+
+``StockItem.quantity`` is a running balance kept by
+``StockTransaction.save``: ``in`` adds, ``out`` subtracts and
+``adjustment`` overwrites. The balance the ledger implies is therefore
+the latest adjustment (zero if none) plus the net of the ``in``/``out``
+postings after it, in posting (id) order. Transfers do not move the
+balance.
+
+Items are checked in chunks of consecutive ids. A chunk costs four
+queries whatever its size: the balances, the latest adjustment per item
+(grouped), those adjustments' quantities, and the net movements after
+them (grouped). The reads share one transaction, so balances and ledger
+come from the same snapshot on MySQL. Chunks are independent, so
+``reconcile`` spreads them over a process pool.
+
+A repair sets each drifted balance to the ledger value in one UPDATE per
+chunk. The UPDATE only touches a row whose balance is still the one that
+was read, so a posting that lands meanwhile is never overwritten.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+import django
+from django.db import connections, transaction
+from django.db.models import Case, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+CHUNK_SIZE = 5000
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def chunk_ranges(first_id, last_id, size=CHUNK_SIZE):
+    """``(start, end)`` id ranges, end exclusive, covering ``first_id`` to ``last_id``."""
+    return [(start, min(start + size, last_id + 1)) for start in range(first_id, last_id + 1, size)]
+
+
+def _signed_movement():
+    return Sum(Case(
+        When(transaction_type='in', then=F('quantity')),
+        When(transaction_type='out', then=-F('quantity')),
+        default=Value(0), output_field=DecimalField(max_digits=14, decimal_places=2),
+    ))
+
+
+def ledger_balances(start, end):
+    """``{stock_item_id: ledger balance}`` for the items with ledger rows in ``[start, end)``."""
+    from .models import StockTransaction
+
+    ledger = StockTransaction.objects.filter(stock_item_id__gte=start, stock_item_id__lt=end).order_by()
+    latest = dict(
+        ledger.filter(transaction_type='adjustment')
+        .values('stock_item_id').annotate(last_id=Max('id')).values_list('stock_item_id', 'last_id')
+    )
+    balances = dict(
+        StockTransaction.objects.filter(pk__in=latest.values()).values_list('stock_item_id', 'quantity')
+    )
+    last_adjustment = (
+        StockTransaction.objects.filter(stock_item_id=OuterRef('stock_item_id'), transaction_type='adjustment')
+        .order_by().values('stock_item_id').annotate(last_id=Max('id')).values('last_id')
+    )
+    movements = (
+        ledger.filter(transaction_type__in=['in', 'out'])
+        .alias(last_adjustment=Subquery(last_adjustment))
+        .filter(Q(last_adjustment__isnull=True) | Q(id__gt=F('last_adjustment')))
+        .values('stock_item_id').annotate(net=_signed_movement()).values_list('stock_item_id', 'net')
+    )
+    for item_id, net in movements:
+        balances[item_id] = balances.get(item_id, Decimal('0')) + net
+    return {item_id: balance.quantize(CENT) for item_id, balance in balances.items()}
+
+
+def reconcile_chunk(start, end, repair=False):
+    """
+    Compare the balances of the items in ``[start, end)`` with the ledger.
+    Returns ``{'start', 'end', 'checked', 'drift', 'repaired'}``, where
+    ``drift`` lists ``(item_id, balance, ledger_balance)`` as strings.
+    """
+    from .models import StockItem
+
+    with transaction.atomic():
+        stored = dict(StockItem.objects.filter(pk__gte=start, pk__lt=end).values_list('pk', 'quantity'))
+        expected = ledger_balances(start, end)
+        drift = [
+            (item_id, quantity, expected.get(item_id, ZERO))
+            for item_id, quantity in sorted(stored.items())
+            if quantity != expected.get(item_id, ZERO)
+        ]
+        repaired = 0
+        if repair and drift:
+            # Each row is only set if its balance is still the one read above
+            repaired = StockItem.objects.filter(
+                pk__in=[item_id for item_id, _, _ in drift]
+            ).filter(
+                Q(*[Q(pk=item_id, quantity=quantity) for item_id, quantity, _ in drift], _connector=Q.OR)
+            ).update(
+                quantity=Case(
+                    *[When(pk=item_id, then=Value(ledger)) for item_id, _, ledger in drift],
+                    output_field=StockItem._meta.get_field('quantity'),
+                ),
+                updated_at=timezone.now(),
+            )
+    return {
+        'start': start,
+        'end': end,
+        'checked': len(stored),
+        'drift': [(item_id, str(quantity), str(ledger)) for item_id, quantity, ledger in drift],
+        'repaired': repaired,
+    }
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database sockets; spawned ones need Django set up
+    django.setup()
+    connections.close_all()
+
+
+def reconcile(ranges, workers=None, repair=False):
+    """
+    Reconcile each ``(start, end)`` range, over ``workers`` processes (one
+    per CPU by default; 1 runs in this process). Yields chunk results as
+    they finish.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(ranges) == 1:
+        for start, end in ranges:
+            yield reconcile_chunk(start, end, repair)
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(reconcile_chunk, start, end, repair) for start, end in ranges]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,19 @@
+# inventory/tasks.py
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+
+from . import outbox
+
+
+@shared_task
+def relay_stock_events():
+    """Deliver pending stock events to the outbox handlers."""
+    return outbox.relay()
+
+
+@shared_task
+def prune_stock_events():
+    """Delete delivered stock events older than STOCK_EVENT_RETENTION_DAYS."""
+    return outbox.prune(timedelta(days=getattr(settings, 'STOCK_EVENT_RETENTION_DAYS', 7)))
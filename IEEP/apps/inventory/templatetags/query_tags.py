@@ -0,0 +1,19 @@
+# inventory/templatetags/query_tags.py
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def query_string(context, key, value):
+    """
+    The current query string with ``key`` set to ``value``, for sort and
+    filter links that keep the other filters. Setting the value a sort key
+    already has flips its direction, and the page is reset.
+    """
+    params = context['request'].GET.copy()
+    if key == 'sort' and params.get(key) == value:
+        value = f'-{value}'
+    params[key] = value
+    params.pop('page', None)
+    return params.urlencode()
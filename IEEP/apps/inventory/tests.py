@@ -1,3 +1,372 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from apps.notifications.models import InboxEntry
+from apps.products.models import Product, UnitOfMeasure
+from apps.users.models import User
+from . import outbox, reconcile
+from .handlers import raise_reorder_alerts
+from .models import ReorderAlert, StockEvent, StockItem, StockTransaction, Warehouse
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_stock_item(sku='P-1', code='W1', **fields):
+    uom, _ = UnitOfMeasure.objects.get_or_create(name='Litre', symbol='L')
+    product, _ = Product.objects.get_or_create(
+        sku=sku, defaults={'name': sku, 'product_type': 'finished_good', 'unit_of_measure': uom}
+    )
+    warehouse, _ = Warehouse.objects.get_or_create(code=code, defaults={'name': code, 'location': 'Site'})
+    fields.setdefault('batch_number', f'{sku}-{code}')
+    fields.setdefault('unit_cost', 1)
+    return StockItem.objects.create(product=product, warehouse=warehouse, **fields)
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class StockOutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('clerk', password='x')
+        self.item = create_stock_item(quantity=100, reorder_threshold=10)
+        self.delivered = []
+        patcher = mock.patch.dict(outbox._handlers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        outbox.register('spy', lambda events: self.delivered.extend(event.pk for event in events))
+
+    def post(self, kind='out', quantity=1, item=None):
+        return StockTransaction.objects.create(
+            stock_item=item or self.item, transaction_type=kind, quantity=quantity, created_by=self.user
+        )
+
+    def test_posting_writes_one_event_with_the_new_balance(self, enqueue):
+        transaction = self.post('out', 30)
+        event = StockEvent.objects.get()
+        self.assertEqual((event.topic, event.stock_item_id), (StockEvent.POSTED, self.item.pk))
+        self.assertEqual(event.payload['transaction_id'], transaction.pk)
+        self.assertEqual(Decimal(event.payload['balance']), Decimal('70'))
+        transaction.reference = 'corrected'
+        transaction.save()
+        self.assertEqual(StockEvent.objects.count(), 1)
+
+    def test_relay_delivers_in_id_order_once(self, enqueue):
+        for _ in range(5):
+            self.post()
+        self.assertEqual(outbox.relay(batch_size=2), 5)
+        self.assertEqual(self.delivered, list(StockEvent.objects.values_list('pk', flat=True)))
+        self.assertFalse(StockEvent.objects.filter(dispatched_at__isnull=True).exists())
+        self.assertEqual(outbox.relay(), 0)
+        self.assertEqual(len(self.delivered), 5)
+
+    def test_late_commit_below_delivered_ids_is_still_delivered(self, enqueue):
+        self.post()
+        self.post()
+        late_id = StockEvent.objects.order_by('pk').first().pk
+        # Hide the first event while the rest are relayed, as if its posting had not committed yet
+        hidden = StockEvent.objects.get(pk=late_id)
+        hidden.delete()
+        outbox.relay()
+        StockEvent.objects.create(
+            pk=late_id, topic=hidden.topic, stock_item_id=hidden.stock_item_id, payload=hidden.payload
+        )
+        self.assertEqual(outbox.relay(), 1)
+        self.assertEqual(self.delivered[-1], late_id)
+
+    def test_failing_handler_rolls_the_batch_back_for_retry(self, enqueue):
+        # Fails for the batch and again for the event on its own
+        outbox.register('flaky', mock.Mock(side_effect=[RuntimeError('down'), RuntimeError('down'), None]))
+        outbox.register('alerts', raise_reorder_alerts)
+        self.post('out', 95)
+        with self.assertLogs('apps.inventory.outbox', 'WARNING'):
+            self.assertEqual(outbox.relay(), 0)
+        self.assertFalse(ReorderAlert.objects.exists())
+        event = StockEvent.objects.get()
+        self.assertEqual((event.dispatched_at, event.attempts, event.last_error), (None, 1, 'flaky: RuntimeError: down'))
+
+        self.assertEqual(outbox.relay(), 1)
+        self.assertEqual(ReorderAlert.objects.count(), 1)
+        self.assertEqual(len(self.delivered), 3)
+
+    def test_failing_event_does_not_block_later_ones(self, enqueue):
+        for _ in range(4):
+            self.post()
+        poison = StockEvent.objects.order_by('pk').first().pk
+
+        def picky(events):
+            if any(event.pk == poison for event in events):
+                raise ValueError('bad payload')
+
+        outbox.register('picky', picky)
+        with self.assertLogs('apps.inventory.outbox', 'WARNING'):
+            self.assertEqual(outbox.relay(batch_size=2), 3)
+        self.assertEqual(
+            list(StockEvent.objects.filter(dispatched_at__isnull=True).values_list('pk', 'attempts')), [(poison, 1)]
+        )
+
+    @override_settings(STOCK_EVENT_MAX_ATTEMPTS=2)
+    def test_event_is_set_aside_after_max_attempts(self, enqueue):
+        outbox.register('broken', mock.Mock(side_effect=RuntimeError('down')))
+        self.post()
+        with self.assertLogs('apps.inventory.outbox', 'WARNING'):
+            outbox.relay()
+        self.assertIsNone(StockEvent.objects.get().failed_at)
+        with self.assertLogs('apps.inventory.outbox', 'ERROR') as logs:
+            outbox.relay()
+        self.assertIn('set aside', logs.output[-1])
+        self.assertIsNotNone(StockEvent.objects.get().failed_at)
+
+        del outbox._handlers['broken']
+        self.assertEqual(outbox.relay(), 0)
+        self.post()
+        self.assertEqual(outbox.relay(), 1)
+
+    def test_topics_filter_what_a_handler_receives(self, enqueue):
+        received = []
+        outbox.register('other', received.extend, topics=['stock.other'])
+        self.post()
+        outbox.relay()
+        self.assertEqual(received, [])
+
+    def test_prune_keeps_undelivered_and_recent_events(self, enqueue):
+        for _ in range(3):
+            self.post()
+        outbox.relay()
+        self.post()
+        StockEvent.objects.update(created_at=timezone.now() - timedelta(days=10))
+        self.post()
+        self.assertEqual(outbox.prune(timedelta(days=7)), 3)
+        self.assertEqual(StockEvent.objects.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class ReorderAlertHandlerTests(TestCase):
+    def setUp(self):
+        # Cached group members would otherwise outlive the users of an earlier test
+        cache.clear()
+        self.user = User.objects.create_user('clerk', password='x')
+        self.manager = User.objects.create_user('manager', password='x')
+        self.manager.groups.add(Group.objects.create(name='Inventory Manager'))
+
+    def post(self, item, kind, quantity):
+        StockTransaction.objects.create(stock_item=item, transaction_type=kind, quantity=quantity, created_by=self.user)
+
+    def deliver(self):
+        raise_reorder_alerts(list(StockEvent.objects.all()))
+
+    def test_alerts_follow_the_low_stock_rule(self, enqueue):
+        low = create_stock_item(sku='LOW', quantity=100, reorder_threshold=10)
+        empty = create_stock_item(sku='EMPTY', quantity=100, reorder_threshold=10)
+        unset = create_stock_item(sku='UNSET', quantity=100, reorder_threshold=0)
+        self.post(low, 'out', 95)
+        self.post(empty, 'out', 100)
+        self.post(unset, 'out', 99)
+        self.deliver()
+        self.assertEqual(list(ReorderAlert.objects.values_list('stock_item_id', flat=True)), [low.pk])
+
+    def test_current_balance_decides_not_the_event(self, enqueue):
+        item = create_stock_item(quantity=100, reorder_threshold=10)
+        self.post(item, 'out', 95)
+        self.post(item, 'in', 50)
+        self.deliver()
+        self.assertFalse(ReorderAlert.objects.exists())
+
+    def test_redelivery_opens_no_second_alert_or_notification(self, enqueue):
+        item = create_stock_item(quantity=100, reorder_threshold=10)
+        self.post(item, 'out', 95)
+        self.deliver()
+        self.deliver()
+        self.assertEqual(ReorderAlert.objects.filter(stock_item=item, status='active').count(), 1)
+        self.assertEqual(InboxEntry.objects.filter(user=self.manager).count(), 1)
+        self.assertEqual(InboxEntry.objects.get().notification.kind, 'reorder')
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('auditor', password='x')
+        self.items = [create_stock_item(sku=f'P-{index}', quantity=0) for index in range(6)]
+        for index, item in enumerate(self.items):
+            self.post(item, 'in', 40 + index)
+            self.post(item, 'out', 5)
+        # A reset, movements after it, and a transfer that moves nothing
+        self.post(self.items[2], 'adjustment', 12)
+        self.post(self.items[2], 'in', 3)
+        self.post(self.items[2], 'transfer', 7)
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def post(self, item, kind, quantity):
+        StockTransaction.objects.create(stock_item=item, transaction_type=kind, quantity=quantity, created_by=self.user)
+
+    def drift(self, item, quantity):
+        StockItem.objects.filter(pk=item.pk).update(quantity=quantity)
+
+    def balance(self, item):
+        return StockItem.objects.get(pk=item.pk).quantity
+
+    def test_chunk_ranges_cover_the_ids_without_overlap(self, enqueue):
+        self.assertEqual(reconcile.chunk_ranges(1, 10, 4), [(1, 5), (5, 9), (9, 11)])
+        self.assertEqual(reconcile.chunk_ranges(0, 0, 4), [(0, 1)])
+
+    def test_ledger_balance_matches_postings(self, enqueue):
+        first, last = self.items[0].pk, self.items[-1].pk
+        balances = reconcile.ledger_balances(first, last + 1)
+        self.assertEqual(balances, {item.pk: self.balance(item) for item in self.items})
+        self.assertEqual(balances[self.items[2].pk], Decimal('15.00'))
+        self.assertEqual(reconcile.reconcile_chunk(first, last + 1)['drift'], [])
+
+    def test_drift_is_reported_and_repaired(self, enqueue):
+        self.drift(self.items[1], 999)
+        self.drift(self.items[2], 0)
+        untracked = create_stock_item(sku='OPENING', quantity=25)
+        result = reconcile.reconcile_chunk(self.items[0].pk, untracked.pk + 1, repair=True)
+        self.assertEqual(result['checked'], 7)
+        self.assertEqual(result['drift'], [
+            (self.items[1].pk, '999.00', '36.00'),
+            (self.items[2].pk, '0.00', '15.00'),
+            (untracked.pk, '25.00', '0.00'),
+        ])
+        self.assertEqual(result['repaired'], 3)
+        self.assertEqual((self.balance(self.items[1]), self.balance(untracked)), (Decimal('36'), Decimal('0')))
+
+    def test_repair_skips_balances_that_moved_after_the_read(self, enqueue):
+        self.drift(self.items[0], 999)
+        real = reconcile.ledger_balances
+
+        def concurrent_posting(start, end):
+            balances = real(start, end)
+            self.drift(self.items[0], 500)
+            return balances
+
+        with mock.patch.object(reconcile, 'ledger_balances', side_effect=concurrent_posting):
+            result = reconcile.reconcile_chunk(self.items[0].pk, self.items[0].pk + 1, repair=True)
+        self.assertEqual((len(result['drift']), result['repaired']), (1, 0))
+        self.assertEqual(self.balance(self.items[0]), Decimal('500'))
+
+    def test_command_reports_drift_and_resumes(self, enqueue):
+        self.drift(self.items[4], 1)
+        state = os.path.join(self.workdir, 'state.json')
+        report = os.path.join(self.workdir, 'drift.csv')
+        first = self.items[0].pk
+        options = {'chunk_size': 2, 'workers': 1, 'state': state, 'stdout': StringIO()}
+
+        call_command('reconcile_stock', report=report, **options)
+        self.assertIn('6 items checked', options['stdout'].getvalue())
+        with open(report) as fh:
+            self.assertEqual(fh.read().splitlines()[1], f'{self.items[4].pk},1.00,39.00')
+        self.assertFalse(os.path.exists(state))
+
+        # An interrupted run left the first two chunks done; resuming checks only the last
+        with open(state, 'w') as fh:
+            json.dump({
+                'from_id': first, 'to_id': self.items[-1].pk, 'chunk_size': 2, 'repair': True,
+                'completed': [[first, first + 2], [first + 2, first + 4]], 'checked': 4, 'repaired': 0, 'drift': [],
+            }, fh)
+        options['stdout'] = StringIO()
+        call_command('reconcile_stock', resume=True, repair=True, **options)
+        self.assertIn('1 of 3 chunks (resumed)', options['stdout'].getvalue())
+        self.assertEqual(self.balance(self.items[4]), Decimal('39'))
+
+
+@override_settings(CACHES=LOCMEM, MEDIA_ROOT=tempfile.mkdtemp())
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class StockExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('finance', password='x')
+        self.client.force_login(self.user)
+        self.low = create_stock_item(sku='P-1', quantity=4, reorder_threshold=10, unit_cost=3)
+        self.other = create_stock_item(sku='P-2', code='W2', quantity=50, reorder_threshold=10)
+
+    def export(self, export_format, **params):
+        response = self.client.get(reverse('stock-item-list'), {'export': export_format, **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_excel_export_has_typed_cells_and_a_frozen_header(self, enqueue):
+        sheet = load_workbook(BytesIO(self.export('excel'))).active
+        self.assertEqual(sheet.freeze_panes, 'A2')
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:3], ('SKU', 'Name', 'Batch Number'))
+        self.assertEqual([row[0] for row in rows[1:]], ['P-1', 'P-2'])
+        self.assertEqual(rows[1][5:9], (4, 'L', 12, 'Low Stock'))
+        self.assertIsInstance(rows[1][11], datetime)
+
+    def test_export_applies_the_list_filters(self, enqueue):
+        lines = self.export('csv', stock_status='low').decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('P-1,'))
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class StockApiTests(TestCase):
+    def setUp(self):
+        self.low = create_stock_item(quantity=4, reorder_threshold=10, expiry_date=date(2031, 5, 1))
+        self.ok = create_stock_item(sku='P-2', code='W2', quantity='120.50', reorder_threshold=10)
+        self.empty = create_stock_item(sku='P-3', quantity=0, reorder_threshold=10)
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_stock_item_fields_and_encoding(self, enqueue):
+        body = self.get('/api/v1/stock-items/')
+        self.assertEqual(body['results'][0], {
+            'id': self.low.pk, 'sku': 'P-1', 'warehouse': 'W1', 'quantity': '4.00', 'unit': 'L',
+            'reorder_threshold': '10.00', 'is_low_stock': True, 'batch_number': 'P-1-W1',
+        })
+        body = self.get('/api/v1/stock-items/', fields='quantity,expiry_date,manufactured_date')
+        self.assertEqual(body['results'][:2], [
+            {'quantity': '4.00', 'expiry_date': '2031-05-01', 'manufactured_date': None},
+            {'quantity': '120.50', 'expiry_date': None, 'manufactured_date': None},
+        ])
+
+    def test_unknown_fields_are_rejected(self, enqueue):
+        response = self.client.get('/api/v1/warehouses/', {'fields': 'code,secret,other'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: secret, other', response.json()['fields'])
+
+    def test_filters_and_cursor_paging(self, enqueue):
+        body = self.get('/api/v1/stock-items/', low_stock='true', fields='id')
+        self.assertEqual(body['results'], [{'id': self.low.pk}])
+        ids = []
+        body = self.get('/api/v1/stock-items/', page_size=1, fields='id')
+        while True:
+            ids += [row['id'] for row in body['results']]
+            if not body['next']:
+                break
+            body = self.client.get(body['next']).json()
+        self.assertEqual(ids, [self.low.pk, self.ok.pk, self.empty.pk])
+        previous = self.client.get(self.get('/api/v1/stock-items/', page_size=1, fields='id')['next']).json()
+        self.assertEqual(self.client.get(previous['previous']).json()['results'], [{'id': self.low.pk}])
+
+    def test_warehouses_are_gzipped_and_looked_up_by_numeric_id(self, enqueue):
+        response = self.client.get(
+            '/api/v1/warehouses/', {'fields': 'name,location,created_at,updated_at'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = json.loads(gzip.decompress(response.content))['results']
+        self.assertEqual([row['name'] for row in rows], ['W1', 'W2'])
+        warehouse = Warehouse.objects.get(code='W2')
+        self.assertEqual(self.get(f'/api/v1/warehouses/{warehouse.pk}/', fields='code'), {'code': 'W2'})
+        self.assertEqual(self.client.get('/api/v1/warehouses/W2/').status_code, 404)
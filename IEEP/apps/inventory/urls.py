@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('stock-items/', views.StockItemListView.as_view(), name='stock-item-list'),
+    path('stock-items/low/', views.LowStockListView.as_view(), name='low-stock-list'),
+    path('stock-items/adjust/', views.StockAdjustmentCreateView.as_view(), name='stock-adjustment-create'),
+    path('warehouses/', views.WarehouseListView.as_view(), name='warehouse-list'),
+]
@@ -1,12 +1,15 @@
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponse
-from django.views.generic import ListView
+from django.views.generic import CreateView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q, F, Sum, Count
+from django.db.models import Q, F, Sum, Count, DecimalField, Value
+from django.db.models.functions import Coalesce
+from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
 from .models import Order, OrderItem, Warehouse, StockItem, StockTransaction, ReorderAlert
 from apps.products.models import Product, Category
+from apps.reports.mixins import ReportExportMixin
 from .forms import StockAdjustmentForm
 from django.views import View
 from django import forms
@@ -16,6 +19,8 @@ import json
 import csv
 from django.urls import reverse_lazy
 
+EXPORT_CHUNK_SIZE = 2000
+
 class WarehouseListView(LoginRequiredMixin, ListView):
     model = Warehouse
     template_name = 'inventory/warehouse_list.html'
@@ -24,24 +29,26 @@ class WarehouseListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return Warehouse.objects.filter(is_active=True).prefetch_related('stock_items')
 
-class StockItemListView(LoginRequiredMixin, ListView):
+class StockItemListView(LoginRequiredMixin, ReportExportMixin, ListView):
     model = StockItem
     template_name = 'inventory/stock_item_list.html'
     context_object_name = 'stock_items'
     paginate_by = 20
+    report_type = 'inventory_status'
+    report_title = 'Stock Items'
+    export_filename = 'stock_items'
+    export_parameters = [
+        'warehouse', 'product_type', 'category', 'stock_status', 'procurement_status',
+        'expiry_status', 'search', 'sort',
+    ]
+    export_columns = [
+        ('SKU', 1.2), ('Name', 2.6), ('Batch Number', 1.4), ('Warehouse', 1.1), ('Location', 1.1),
+        ('Quantity', 1), ('Unit', 0.6), ('Value', 1.2), ('Status', 1.2), ('Procurement', 1.2),
+        ('Expiry', 1.2), ('Created At', 1.8), ('Updated At', 1.8),
+    ]
     
     def get_queryset(self):
         queryset = StockItem.objects.select_related('product__unit_of_measure', 'warehouse')
-        
-        # Fetch summary statistics
-        self.total_items = queryset.count()
-        self.total_value = sum(float(item.total_value) for item in queryset)
-        self.low_stock_count = queryset.filter(
-        quantity__gt=0,
-        quantity__lte=F('reorder_threshold')
-        ).count()
-        self.out_of_stock_count = queryset.filter(quantity__lte=0).count()
-        self.reorder_alert_count = ReorderAlert.objects.filter(status='active').count()
 
         # Apply filters
         warehouse = self.request.GET.get('warehouse')
@@ -97,34 +104,61 @@ class StockItemListView(LoginRequiredMixin, ListView):
         return queryset
     
     def get(self, request, *args, **kwargs):
-        if request.GET.get('export') == 'csv':
-            queryset = self.get_queryset()
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename="stock_items.csv"'
-            writer = csv.writer(response)
-            writer.writerow(['SKU', 'Name', 'Batch Number', 'Warehouse', 'Location', 'Quantity', 'Unit', 'Value', 'Status', 'Procurement', 'Expiry', 'Created At', 'Updated At'])
-            for item in queryset:
-                status = 'Out of Stock' if item.quantity <= 0 else 'Low Stock' if item.is_low_stock else 'In Stock'
-                expiry = 'Expired' if item.is_expired else 'Near Expiry' if item.expiry_date and item.expiry_date <= timezone.now().date() + timezone.timedelta(days=30) else item.expiry_date or '-'
-                writer.writerow([
-                    item.product.sku,
-                    item.product.name,
-                    item.batch_number or '-',
-                    item.warehouse.code,
-                    item.location or 'Main',
-                    item.quantity,
-                    item.product.unit_of_measure.symbol,
-                    item.total_value,
-                    status,
-                    item.get_procurement_status_display(),
-                    expiry,
-                    item.created_at,
-                    item.updated_at
-                ])
-            return response
+        if request.GET.get('export') in ('csv', 'excel'):
+            return self.export(request.GET['export'])
         return super().get(request, *args, **kwargs)
-    
+
+    def get_report_parameters(self):
+        parameters = super().get_report_parameters()
+        # Stock and expiry status are relative to today
+        parameters['as_of'] = timezone.now().date().isoformat()
+        return parameters
+
+    def iter_export_rows(self):
+        """Yield typed export rows from a chunked values() iterator instead of model instances."""
+        today = timezone.now().date()
+        near_expiry = today + timezone.timedelta(days=30)
+        procurement_labels = dict(StockItem._meta.get_field('procurement_status').choices)
+        rows = self.get_queryset().values_list(
+            'product__sku', 'product__name', 'batch_number', 'warehouse__code', 'location',
+            'quantity', 'product__unit_of_measure__symbol', 'unit_cost',
+            'reorder_threshold', 'product__reorder_threshold', 'procurement_status',
+            'expiry_date', 'created_at', 'updated_at',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for (sku, name, batch, warehouse, location, quantity, unit, unit_cost,
+             threshold, product_threshold, procurement, expiry_date, created_at, updated_at) in rows:
+            if quantity <= 0:
+                status = 'Out of Stock'
+            elif quantity <= (threshold or product_threshold or 0):
+                status = 'Low Stock'
+            else:
+                status = 'In Stock'
+            if expiry_date and expiry_date < today:
+                expiry = 'Expired'
+            elif expiry_date and expiry_date <= near_expiry:
+                expiry = 'Near Expiry'
+            else:
+                expiry = expiry_date or '-'
+            yield [
+                sku, name, batch or '-', warehouse, location or 'Main', quantity, unit,
+                quantity * unit_cost if unit_cost else 0, status,
+                procurement_labels.get(procurement, procurement), expiry, created_at, updated_at,
+            ]
+
     def get_context_data(self, **kwargs):
+        # Summary statistics cover all stock, independent of the active filters
+        summary = StockItem.objects.aggregate(
+            total_items=Count('id'),
+            total_value=Sum(F('quantity') * F('unit_cost')),
+            low_stock_count=Count('id', filter=Q(quantity__gt=0, quantity__lte=F('reorder_threshold'))),
+            out_of_stock_count=Count('id', filter=Q(quantity__lte=0)),
+        )
+        self.total_items = summary['total_items']
+        self.total_value = float(summary['total_value'] or 0)
+        self.low_stock_count = summary['low_stock_count']
+        self.out_of_stock_count = summary['out_of_stock_count']
+        self.reorder_alert_count = ReorderAlert.objects.filter(status='active').count()
+
         context = super().get_context_data(**kwargs)
         stock_items = self.get_queryset()
         stock_status = stock_items.aggregate(
@@ -150,6 +184,21 @@ class StockItemListView(LoginRequiredMixin, ListView):
         })
         return context
 
+class StockAdjustmentCreateView(LoginRequiredMixin, CreateView):
+    model = StockTransaction
+    form_class = StockAdjustmentForm
+    template_name = 'inventory/stock_adjustment_form.html'
+    success_url = reverse_lazy('stock-item-list')
+
+    def get_initial(self):
+        return {'stock_item': self.request.GET.get('stock_item')}
+
+    def form_valid(self, form):
+        form.instance.created_by = self.request.user
+        response = super().form_valid(form)
+        messages.success(self.request, f'{self.object.stock_item} set to {self.object.quantity}.')
+        return response
+
 class LowStockListView(LoginRequiredMixin, ListView):
     model = StockItem
     template_name = 'inventory/low_stock_list.html'
@@ -0,0 +1,103 @@
+# apps/jobs.py
+"""
+Sending Celery tasks.
+
+Tasks are routed to queues by name (``CELERY_TASK_ROUTES`` in settings):
+``alerts`` for the stock event relay, ``bulk`` for archiving and pruning,
+``default`` for the rest; ``reports`` has workers for report rendering
+but no task routed to it yet. Each queue has its own workers, so a long
+archive run never sits in front of a low-stock alert.
+
+- ``enqueue`` sends a task, optionally under a deduplication key: while a
+  task with the same key is still queued, sending it again is a no-op.
+  The key is released when the task starts, so a change arriving while
+  it runs queues a fresh run.
+- ``fan_out`` splits a long list of ids into chunks and sends one task
+  per chunk as a group.
+
+Web code should send tasks through these helpers. They load the
+project's Celery app on first use, which the ``shared_task`` proxies need
+to find the configured broker. Processes that never send a task do not
+import Celery at startup.
+"""
+import logging
+from itertools import islice
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEDUP_KEY = 'jobs:dedup:{}:{}'
+# Upper bound on how long a lost task can block its key
+DEDUP_TTL = 3600
+DEDUP_HEADER = 'dedup_key'
+CHUNK_SIZE = 500
+
+
+def get_app():
+    """The project's Celery app; loads it if this process has not yet."""
+    from ieep.celery import app
+    return app
+
+
+def enqueue(task, *args, dedup_key=None, dedup_ttl=DEDUP_TTL, options=None, **kwargs):
+    """
+    Send ``task(*args, **kwargs)``. With ``dedup_key``, return None instead
+    when an identical task is already waiting. ``options`` are passed to
+    ``apply_async`` (e.g. ``countdown``).
+    """
+    from celery.utils import uuid
+
+    get_app()
+    options = dict(options or {})
+    if dedup_key is not None:
+        task_id = options.setdefault('task_id', uuid())
+        key = DEDUP_KEY.format(task.name, dedup_key)
+        if not cache.add(key, task_id, timeout=dedup_ttl):
+            logger.debug("Skipped %s: already queued under %s", task.name, key)
+            return None
+        options['headers'] = {**options.get('headers', {}), DEDUP_HEADER: key}
+        try:
+            return task.apply_async(args, kwargs, **options)
+        except Exception:
+            # Nothing was queued, so the key must not block the next attempt for DEDUP_TTL
+            cache.delete(key)
+            raise
+    return task.apply_async(args, kwargs, **options)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def fan_out(task, ids, chunk_size=CHUNK_SIZE, options=None, **kwargs):
+    """
+    Run ``task(chunk, **kwargs)`` for each ``chunk_size`` slice of ``ids``
+    as one group. Returns the GroupResult, or None when ``ids`` is empty.
+    """
+    from celery import group
+
+    get_app()
+    signatures = [task.si(chunk, **kwargs) for chunk in chunked(ids, chunk_size)]
+    if not signatures:
+        return None
+    return group(signatures).apply_async(**(options or {}))
+
+
+def release_dedup_key(sender=None, task_id=None, task=None, **kwargs):
+    if task is None:
+        return
+    # Workers expose message headers as request attributes; eager runs only under ``headers``
+    key = getattr(task.request, DEDUP_HEADER, None) or (task.request.headers or {}).get(DEDUP_HEADER)
+    # Not atomic: the key can expire and be claimed by a new enqueue between the get and the delete,
+    # which then lets one duplicate through. That needs a task queued for over DEDUP_TTL, and a
+    # duplicate run is harmless, so a compare-and-delete script is not worth tying this to Redis.
+    if key and cache.get(key) == task_id:
+        cache.delete(key)
+
+
+def connect_job_signals():
+    from celery.signals import task_prerun
+    task_prerun.connect(release_dedup_key, dispatch_uid='jobs-release-dedup-key')
@@ -0,0 +1,35 @@
+# monitoring/admin.py
+from pathlib import Path
+
+from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'cpu_ms', 'sample_count', 'trigger', 'download']
+    list_filter = ['trigger', 'method', 'view_name']
+    search_fields = ['path', 'view_name', 'user__username']
+    readonly_fields = [field.name for field in RequestProfile._meta.fields] + ['download']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='Flame graph')
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">collapsed stacks</a> (open in speedscope.app)',
+            reverse('request-profile-download', args=[obj.pk]),
+        )
+
+    def delete_model(self, request, obj):
+        Path(obj.file_path).unlink(missing_ok=True)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for file_path in queryset.values_list('file_path', flat=True):
+            Path(file_path).unlink(missing_ok=True)
+        super().delete_queryset(request, queryset)
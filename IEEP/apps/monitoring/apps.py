@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.monitoring'
+
+    def ready(self):
+        from .instrumentation import connect_signals
+        connect_signals()
+        if getattr(settings, 'METRICS_ENABLED', True) and getattr(settings, 'METRICS_SHARED', False):
+            from .sharedmetrics import start
+            start()
@@ -0,0 +1,216 @@
+# monitoring/benchmarks.py
+"""
+View benchmarks.
+
+Each ``Case`` names a view class and the GET parameters to call it with.
+The URL is found by looking the class up in the URLconf, so cases do not
+depend on URL names. A ``CallCase`` instead times a function doing
+``calls`` units of work, for code paths no GET exercises (such as the
+audit capture on save). ``run_case`` records the median wall time, the
+query count and the peak traced memory (measured on a separate run,
+since tracing slows execution).
+``compare_to_baseline`` flags results that got slower or heavier than a
+stored baseline by more than a tolerance, or that issue more queries.
+"""
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils.module_loading import import_string
+
+Case = namedtuple('Case', ['name', 'view', 'params', 'kwargs'], defaults=[{}, None])
+CallCase = namedtuple('CallCase', ['name', 'function', 'kwargs', 'calls', 'before'], defaults=[{}, 100, None])
+
+# Timing differences below this are treated as noise whatever the tolerance
+MIN_TIME_DELTA_MS = 2.0
+
+
+def busiest_product():
+    from apps.products.models import Product
+    pk = (
+        Product.objects.annotate(items=Count('stock_items'))
+        .order_by('-items', 'pk').values_list('pk', flat=True).first()
+    )
+    return {'pk': pk}
+
+
+def settle_audit_log():
+    """Write queued audit entries, so the background writer is idle during the next timed run."""
+    from apps.users.audit import audit_sink
+    audit_sink.flush()
+
+
+def save_warehouse(calls, audited=True):
+    """Save one warehouse ``calls`` times, changing its location each time."""
+    from apps.inventory.models import Warehouse
+    from apps.users.capture import record_save
+
+    warehouse = Warehouse.objects.order_by('pk').first()
+    if warehouse is None:
+        raise BenchmarkError("No warehouse to save")
+    location = warehouse.location
+    dispatch_uid = f'audit-save-{Warehouse._meta.label}'
+    if not audited:
+        post_save.disconnect(sender=Warehouse, dispatch_uid=dispatch_uid)
+    try:
+        for number in range(calls):
+            warehouse.location = f'Benchmark {number}'
+            warehouse.save()
+    finally:
+        if not audited:
+            post_save.connect(record_save, sender=Warehouse, dispatch_uid=dispatch_uid)
+        # The base manager is not audited, so restoring the row records nothing
+        Warehouse._base_manager.filter(pk=warehouse.pk).update(location=location)
+
+
+CASES = [
+    Case('stock_item_list', 'apps.inventory.views.StockItemListView'),
+    Case('stock_item_list_filtered', 'apps.inventory.views.StockItemListView',
+         {'product_type': 'raw', 'stock_status': 'low', 'search': '1', 'sort': '-quantity'}),
+    Case('stock_item_export_csv', 'apps.inventory.views.StockItemListView', {'export': 'csv'}),
+    Case('low_stock_list', 'apps.inventory.views.LowStockListView'),
+    Case('low_stock_report', 'apps.reports.views.LowStockReportView'),
+    Case('low_stock_report_csv', 'apps.reports.views.LowStockReportView', {'format': 'csv'}),
+    Case('low_stock_report_pdf', 'apps.reports.views.LowStockReportView', {'format': 'pdf'}),
+    Case('warehouse_list', 'apps.inventory.views.WarehouseListView'),
+    Case('category_list', 'apps.products.views.CategoryListView'),
+    Case('bom_list', 'apps.products.views.BOMListView'),
+    Case('product_detail', 'apps.products.views.ProductDetailView', kwargs=busiest_product),
+    Case('dashboard', 'apps.reports.views.DashboardView'),
+    Case('api_products', 'apps.products.api.ProductViewSet'),
+    Case('api_stock_items', 'apps.inventory.api.StockItemViewSet', {'page_size': 500}),
+    Case('api_stock_items_low', 'apps.inventory.api.StockItemViewSet', {'low_stock': 'true', 'fields': 'id,sku,quantity'}),
+    Case('api_boms_components', 'apps.products.api.BOMViewSet', {'fields': 'id,bom_code,components'}),
+    # The difference between these two is the audit capture's cost per save
+    CallCase('warehouse_save', 'apps.monitoring.benchmarks.save_warehouse',
+             before='apps.monitoring.benchmarks.settle_audit_log'),
+    CallCase('warehouse_save_unaudited', 'apps.monitoring.benchmarks.save_warehouse', {'audited': False},
+             before='apps.monitoring.benchmarks.settle_audit_log'),
+]
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def _named_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _named_patterns(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern
+
+
+def url_for_view(view_class, kwargs=None):
+    """Reverse the first named URL pattern served by ``view_class`` (a viewset's is its list)."""
+    for pattern in _named_patterns(get_resolver().url_patterns):
+        # DRF viewsets expose their class as ``cls``
+        callback_class = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+        if callback_class is view_class:
+            return reverse(pattern.name, kwargs=kwargs)
+    raise BenchmarkError(f"No named URL pattern serves {view_class.__name__}")
+
+
+def fetch(client, url, params=None):
+    """GET ``url`` and read the whole body; returns its size in bytes."""
+    response = client.get(url, params)
+    try:
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+    finally:
+        response.close()
+    if response.status_code != 200:
+        raise BenchmarkError(f"HTTP {response.status_code}")
+    return len(body)
+
+
+def measure(call, repeat, before=None):
+    """Run ``call`` ``repeat`` times; returns its timings in ms, query counts, peak memory and last result."""
+    timings, queries = [], []
+    # The first run only warms imports, templates and connections
+    for run in range(repeat + 1):
+        if before is not None:
+            before()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            result = call()
+            elapsed = time.perf_counter() - start
+        if run:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+    if before is not None:
+        before()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, queries, peak, result
+
+
+def run_case(client, case, repeat=5, cold=True):
+    """
+    Benchmark one case; returns a result dict. With ``cold`` the cache is
+    cleared before every run, so cached reports and dashboards are rebuilt.
+    """
+    try:
+        if isinstance(case, CallCase):
+            function = import_string(case.function)
+            prepare = import_string(case.before) if case.before else None
+
+            def before():
+                if cold:
+                    cache.clear()
+                if prepare is not None:
+                    prepare()
+
+            details = {'function': case.function, 'params': case.kwargs, 'calls': case.calls}
+            timings, queries, peak, _ = measure(lambda: function(case.calls, **case.kwargs), repeat, before)
+            details['per_call_us'] = round(statistics.median(timings) * 1000 / case.calls, 1)
+        else:
+            view_class = import_string(case.view)
+            kwargs = case.kwargs() if callable(case.kwargs) else case.kwargs
+            url = url_for_view(view_class, kwargs)
+            timings, queries, peak, size = measure(
+                lambda: fetch(client, url, case.params), repeat, cache.clear if cold else None)
+            details = {'url': url, 'params': case.params, 'response_bytes': size}
+    except Exception as exc:
+        return {'case': case.name, 'status': 'error', 'error': f"{type(exc).__name__}: {exc}"}
+    return {
+        'case': case.name,
+        'status': 'ok',
+        **details,
+        'wall_ms': round(statistics.median(timings), 2),
+        'wall_ms_min': round(min(timings), 2),
+        'queries': int(statistics.median(queries)),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def result_key(result):
+    return f"{result['size']}/{result['case']}"
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of regression messages for ``results`` against ``baseline`` entries."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result_key(result))
+        if base is None or result['status'] != 'ok':
+            continue
+        key = result_key(result)
+        if result['queries'] > base['queries']:
+            regressions.append(f"{key}: queries {base['queries']} -> {result['queries']}")
+        limit = base['wall_ms'] * (1 + tolerance)
+        if result['wall_ms'] > limit and result['wall_ms'] - base['wall_ms'] > MIN_TIME_DELTA_MS:
+            regressions.append(f"{key}: wall time {base['wall_ms']}ms -> {result['wall_ms']}ms")
+        if result['peak_memory_kb'] > base['peak_memory_kb'] * (1 + tolerance):
+            regressions.append(f"{key}: peak memory {base['peak_memory_kb']}KB -> {result['peak_memory_kb']}KB")
+    return regressions
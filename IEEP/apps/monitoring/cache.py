@@ -0,0 +1,47 @@
+# monitoring/cache.py
+"""
+Cache backends that count hits and misses.
+
+Every ``get``/``get_many`` lookup increments ``ieep_cache_requests_total``
+under the key's namespace, the part before the first colon
+(``users:permissions:...`` counts as ``users``), so hit ratios can be read
+per feature. Session keys count as ``sessions``.
+"""
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from .metrics import CACHE_REQUESTS
+
+SESSION_PREFIX = 'django.contrib.sessions'
+_MISSING = object()
+
+
+def key_namespace(key):
+    if ':' in key:
+        return key.split(':', 1)[0]
+    if key.startswith(SESSION_PREFIX):
+        return 'sessions'
+    return 'other'
+
+
+class InstrumentedCacheMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        hit = value is not _MISSING
+        CACHE_REQUESTS.inc(namespace=key_namespace(key), result='hit' if hit else 'miss')
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        for key in keys:
+            CACHE_REQUESTS.inc(namespace=key_namespace(key), result='hit' if key in found else 'miss')
+        return found
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
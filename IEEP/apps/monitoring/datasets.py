@@ -0,0 +1,494 @@
+# monitoring/datasets.py
+"""
+Reproducible synthetic datasets for performance work.
+
+``generate_dataset`` fills the database with a seeded, production-shaped
+dataset: a three-level category tree, products with multi-level BOMs
+(finished goods built from intermediates built from raw materials),
+warehouses, stock items, a stock ledger, orders, reorder alerts and audit
+history. Popularity is skewed (Zipf) so a few products, warehouses and
+stock items carry most of the activity, as in production.
+
+Small tables go through ``bulk_create``; the large ones are written with
+``executemany`` on pre-adapted rows so no model instances are built. Rows
+get explicit primary keys, which keeps the output identical for a seed and
+lets related rows be generated without reading ids back. Model signals are
+muted during the load, and report and permission caches are invalidated
+once at the end. Each stock item's quantity equals the net of its ledger.
+"""
+import json
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, signals
+from django.utils import timezone
+
+from apps.inventory.models import Order, OrderItem, ReorderAlert, StockItem, StockTransaction, Warehouse
+from apps.products.models import BOM, BOMComponent, Category, Product, UnitOfMeasure
+from apps.users.models import AuditChange, AuditLog, User
+
+SIZES = {
+    'tiny': {
+        'users': 5, 'categories': 10, 'products': 100, 'boms': 20, 'warehouses': 5,
+        'stock_items': 500, 'transactions': 2000, 'orders': 100, 'reorder_alerts': 20, 'audit_logs': 500,
+    },
+    'small': {
+        'users': 20, 'categories': 50, 'products': 1000, 'boms': 200, 'warehouses': 20,
+        'stock_items': 10000, 'transactions': 100000, 'orders': 2000, 'reorder_alerts': 500, 'audit_logs': 20000,
+    },
+    'medium': {
+        'users': 50, 'categories': 200, 'products': 5000, 'boms': 1000, 'warehouses': 100,
+        'stock_items': 100000, 'transactions': 1000000, 'orders': 20000, 'reorder_alerts': 5000, 'audit_logs': 200000,
+    },
+    'large': {
+        'users': 200, 'categories': 500, 'products': 20000, 'boms': 4000, 'warehouses': 300,
+        'stock_items': 1000000, 'transactions': 10000000, 'orders': 100000, 'reorder_alerts': 20000, 'audit_logs': 1000000,
+    },
+}
+HISTORY_DAYS = 365
+BATCH_SIZE = 5000
+# Rows per transaction for the large tables; keeps MySQL undo logs bounded
+COMMIT_EVERY = 100000
+
+UNITS = [('Kilogram', 'kg'), ('Litre', 'L'), ('Piece', 'pcs'), ('Drum', 'drm'), ('Bag', 'bag')]
+PRODUCT_TYPES = [('raw', 50), ('packaging', 10), ('intermediate', 15), ('finished', 25)]
+CITIES = ['Addis Ababa', 'Adama', 'Bahir Dar', 'Dire Dawa', 'Hawassa', 'Mekelle', 'Jimma', 'Gondar']
+TRANSACTION_MIX = [('in', 35), ('out', 55), ('adjustment', 5), ('transfer', 5)]
+ORDER_STATUSES = [('pending', 15), ('confirmed', 20), ('shipped', 15), ('delivered', 45), ('cancelled', 5)]
+ALERT_STATUSES = [('active', 30), ('resolved', 60), ('cancelled', 10)]
+AUDIT_ACTIONS = [('update', 60), ('create', 20), ('delete', 5), ('login', 10), ('logout', 5)]
+AUDITED_MODELS = ['StockItem', 'Product', 'Order', 'Warehouse', 'BOM']
+
+MUTED_SIGNALS = (signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete, signals.m2m_changed)
+
+
+def _cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks ``1..n``."""
+    total, weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        weights.append(total)
+    return weights
+
+
+class Skewed:
+    """Zipf-distributed picks over ``items``, with popularity ranks shuffled by ``rng``."""
+
+    def __init__(self, rng, items, exponent=1.0):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.weights = _cum_weights(len(self.items), exponent)
+        self.ranks = range(len(self.items))
+
+    def pick(self, k, rng=None):
+        items = self.items
+        return [items[rank] for rank in (rng or self.rng).choices(self.ranks, cum_weights=self.weights, k=k)]
+
+
+def _mix(rng, choices, k):
+    names, weights = zip(*choices)
+    return rng.choices(names, weights=weights, k=k)
+
+
+def _money(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _next_id(model):
+    return (model._base_manager.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+@contextmanager
+def mute_signals():
+    """Disconnect all model signal receivers for the duration of the block."""
+    saved = [(signal, signal.receivers) for signal in MUTED_SIGNALS]
+    for signal, _ in saved:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+@contextmanager
+def fast_load():
+    """Relax per-statement durability and constraint checks on the current connection."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous = OFF')
+        elif connection.vendor == 'mysql':
+            cursor.execute('SET SESSION unique_checks = 0, foreign_key_checks = 0')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+            elif connection.vendor == 'mysql':
+                cursor.execute('SET SESSION unique_checks = 1, foreign_key_checks = 1')
+
+
+def insert_rows(model, fields, rows, batch_size=BATCH_SIZE):
+    """
+    Insert ``rows`` (tuples matching ``fields``, already in database form)
+    with ``executemany``; returns the number of rows written.
+    """
+    columns = [model._meta.get_field(name).column for name in fields]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table), ', '.join(quote(column) for column in columns), ', '.join(['%s'] * len(columns))
+    )
+    rows = iter(rows)
+    written = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for _ in range(max(1, COMMIT_EVERY // batch_size)):
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        return written
+                    cursor.executemany(sql, batch)
+                    written += len(batch)
+
+
+class DatasetGenerator:
+    def __init__(self, counts, seed=0, prefix='SYN', batch_size=BATCH_SIZE, log=None):
+        self.counts = counts
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+        self.end = timezone.now().replace(tzinfo=None, microsecond=0)
+        self.start = self.end - timedelta(days=HISTORY_DAYS)
+        self.written = {}
+
+    def moment(self, position, total):
+        """Naive UTC timestamp ``position/total`` of the way through the history window, as text."""
+        seconds = HISTORY_DAYS * 86400 * position / max(total, 1)
+        return str(self.start + timedelta(seconds=int(seconds), microseconds=self.rng.randrange(1000000)))
+
+    def run(self):
+        if Product.objects.filter(sku__startswith=f'{self.prefix}-').exists():
+            raise ValueError(
+                f"Synthetic data with prefix '{self.prefix}' already exists; use another prefix or an empty database"
+            )
+        steps = [
+            ('users', self.make_users),
+            ('categories', self.make_categories),
+            ('products', self.make_products),
+            ('boms', self.make_boms),
+            ('warehouses', self.make_warehouses),
+            ('stock', self.make_stock),
+            ('orders', self.make_orders),
+            ('reorder_alerts', self.make_reorder_alerts),
+            ('audit_logs', self.make_audit_logs),
+        ]
+        with mute_signals(), fast_load():
+            for name, step in steps:
+                started = time.perf_counter()
+                before = dict(self.written)
+                step()
+                rows = sum(self.written.values()) - sum(before.values())
+                elapsed = time.perf_counter() - started
+                self.log(f"{name}: {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        self.finish()
+        return self.written
+
+    def record(self, model, rows):
+        self.written[model._meta.label] = self.written.get(model._meta.label, 0) + rows
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.record(model, len(objects))
+
+    def insert(self, model, fields, rows):
+        self.record(model, insert_rows(model, fields, rows, self.batch_size))
+
+    def make_users(self):
+        first_id = _next_id(User)
+        count = self.counts['users']
+        self.bulk(User, [
+            User(
+                id=first_id + i, username=f'{self.prefix.lower()}-user-{i}', password='!',
+                first_name='Synthetic', last_name=f'User {i}', email=f'{self.prefix.lower()}-user-{i}@example.com',
+                department=self.rng.choice(['Stores', 'Production', 'Procurement', 'Sales', 'Quality']),
+            )
+            for i in range(count)
+        ])
+        self.user_ids = list(range(first_id, first_id + count))
+        self.users = Skewed(self.rng, self.user_ids, exponent=0.8)
+
+    def make_categories(self):
+        first_id = _next_id(Category)
+        count = self.counts['categories']
+        roots = max(1, count // 20)
+        middle = max(roots, count // 4)
+        categories = []
+        for i in range(count):
+            if i < roots:
+                parent = None
+            elif i < middle:
+                parent = first_id + self.rng.randrange(roots)
+            else:
+                parent = first_id + self.rng.randrange(roots, middle)
+            categories.append(Category(id=first_id + i, name=f'{self.prefix} Category {i}', parent_id=parent))
+        self.bulk(Category, categories)
+        self.category_ids = [category.id for category in categories]
+
+    def make_products(self):
+        self.unit_ids = [UnitOfMeasure.objects.get_or_create(name=name, symbol=symbol)[0].pk for name, symbol in UNITS]
+        first_id = _next_id(Product)
+        count = self.counts['products']
+        types = _mix(self.rng, PRODUCT_TYPES, count)
+        products, self.product_cost = [], {}
+        self.products_by_type = {name: [] for name, _ in PRODUCT_TYPES}
+        for i, product_type in enumerate(types):
+            pk = first_id + i
+            cost = self.rng.randint(50, 50000)
+            products.append(Product(
+                id=pk, sku=f'{self.prefix}-{i:07d}', name=f'{product_type.title()} product {i}',
+                product_type=product_type, category_id=self.rng.choice(self.category_ids),
+                unit_of_measure_id=self.rng.choice(self.unit_ids),
+                cost_price=_money(cost), selling_price=_money(int(cost * self.rng.uniform(1.1, 1.8))),
+                reorder_threshold=self.rng.randint(5, 200),
+            ))
+            self.product_cost[pk] = cost
+            self.products_by_type[product_type].append(pk)
+        self.bulk(Product, products)
+        self.product_ids = list(self.product_cost)
+        self.products = Skewed(self.rng, self.product_ids, exponent=1.1)
+
+    def make_boms(self):
+        by_type = self.products_by_type
+        outputs = by_type['finished'] + by_type['intermediate']
+        self.rng.shuffle(outputs)
+        outputs = outputs[:self.counts['boms']]
+        intermediates = set(by_type['intermediate'])
+        first_id, first_component_id = _next_id(BOM), _next_id(BOMComponent)
+        boms, components = [], []
+        for i, product_id in enumerate(outputs):
+            bom_id = first_id + i
+            boms.append(BOM(
+                id=bom_id, bom_code=f'{self.prefix}-BOM-{i:06d}', product_id=product_id,
+                is_active=True, is_draft=False, created_by_id=self.rng.choice(self.user_ids),
+                labor_cost=_money(self.rng.randint(0, 20000)), overhead_cost=_money(self.rng.randint(0, 10000)),
+            ))
+            # Intermediates are made from raw materials; finished goods also use intermediates and packaging
+            if product_id in intermediates:
+                pool = by_type['raw']
+            else:
+                pool = by_type['raw'] + by_type['intermediate'] + by_type['packaging']
+            for component_id in self.rng.sample(pool, min(len(pool), self.rng.randint(2, 8))):
+                components.append(BOMComponent(
+                    id=first_component_id + len(components), bom_id=bom_id, component_id=component_id,
+                    quantity=f'{self.rng.uniform(0.1, 50):.4f}', unit_cost=_money(self.product_cost[component_id]),
+                    waste_percentage=_money(self.rng.randint(0, 500)),
+                ))
+        self.bulk(BOM, boms)
+        self.bulk(BOMComponent, components)
+
+    def make_warehouses(self):
+        first_id = _next_id(Warehouse)
+        count = self.counts['warehouses']
+        warehouses = [
+            Warehouse(
+                id=first_id + i, code=f'{self.prefix}-WH{i:04d}', name=f'Synthetic warehouse {i}',
+                location=self.rng.choice(CITIES), capacity=str(self.rng.randint(1, 50) * 1000),
+                manager_id=self.rng.choice(self.user_ids) if self.rng.random() < 0.8 else None,
+            )
+            for i in range(count)
+        ]
+        self.bulk(Warehouse, warehouses)
+        self.warehouses = Skewed(self.rng, [warehouse.id for warehouse in warehouses], exponent=0.9)
+
+    def ledger(self, seed, balances, item_ids):
+        """
+        Yield ledger rows ``(item index, type, quantity cents, user id, reference)``
+        while tracking each item's running balance in ``balances``.
+        """
+        rng = random.Random(seed)
+        items = Skewed(rng, range(len(item_ids)), exponent=0.8)
+        users = Skewed(rng, self.user_ids, exponent=0.8)
+        total = self.counts['transactions']
+        done = 0
+        while done < total:
+            size = min(self.batch_size, total - done)
+            for item, kind, user_id in zip(items.pick(size), _mix(rng, TRANSACTION_MIX, size), users.pick(size)):
+                balance = balances[item]
+                if kind == 'out' and balance <= 0:
+                    kind = 'in'
+                if kind == 'in':
+                    quantity = rng.randint(1000, 50000)
+                    balances[item] = balance + quantity
+                elif kind == 'out':
+                    quantity = min(balance, rng.randint(100, 10000))
+                    balances[item] = balance - quantity
+                elif kind == 'adjustment':
+                    quantity = max(0, balance + rng.randint(-balance // 20 - 1, balance // 20 + 1))
+                    balances[item] = quantity
+                else:
+                    quantity = rng.randint(100, 5000)
+                yield item, kind, quantity, user_id, done
+                done += 1
+
+    def make_stock(self):
+        count = self.counts['stock_items']
+        first_id = _next_id(StockItem)
+        item_ids = list(range(first_id, first_id + count))
+        ledger_seed = self.rng.randrange(2 ** 32)
+
+        # First pass only settles each item's closing balance, so items are written before their ledger
+        balances = [0] * count
+        for _ in self.ledger(ledger_seed, balances, item_ids):
+            pass
+
+        products, warehouses = self.products.pick(count), self.warehouses.pick(count)
+        created = [self.moment(self.rng.random() * 0.2, 1) for _ in range(count)]
+        today = date.today()
+
+        def items():
+            for i, (pk, product_id, warehouse_id) in enumerate(zip(item_ids, products, warehouses)):
+                rng = self.rng
+                perishable = rng.random() < 0.3
+                yield (
+                    pk, product_id, warehouse_id, _money(balances[i]),
+                    _money(max(1, int(self.product_cost[product_id] * rng.uniform(0.9, 1.1)))),
+                    f'{self.prefix}-B{i:08d}', f'R{rng.randint(1, 40):02d}-S{rng.randint(1, 12):02d}',
+                    str(today + timedelta(days=rng.randint(-60, 720))) if perishable else None,
+                    str(today - timedelta(days=rng.randint(30, 400))) if perishable else None,
+                    _money(rng.randint(500, 20000)), _mix(rng, [('received', 70), ('ordered', 15), ('pending', 15)], 1)[0],
+                    1, created[i], created[i],
+                )
+
+        self.insert(StockItem, [
+            'id', 'product', 'warehouse', 'quantity', 'unit_cost', 'batch_number', 'location', 'expiry_date',
+            'manufactured_date', 'reorder_threshold', 'procurement_status', 'alert_cooldown_days',
+            'created_at', 'updated_at',
+        ], items())
+
+        total = self.counts['transactions']
+        prefixes = {'in': 'GRN', 'out': 'ISS', 'adjustment': 'ADJ', 'transfer': 'TRF'}
+        first_transaction_id = _next_id(StockTransaction)
+
+        def transactions():
+            for item, kind, quantity, user_id, position in self.ledger(ledger_seed, [0] * count, item_ids):
+                moment = self.moment(0.2 * total + 0.8 * position, total)
+                yield (
+                    first_transaction_id + position, item_ids[item], kind, _money(quantity),
+                    f'{prefixes[kind]}-{position:08d}', user_id, moment, moment,
+                )
+
+        self.insert(StockTransaction, [
+            'id', 'stock_item', 'transaction_type', 'quantity', 'reference', 'created_by', 'created_at', 'updated_at',
+        ], transactions())
+        self.stock_item_ids = item_ids
+
+    def make_orders(self):
+        count = self.counts['orders']
+        first_id, first_item_id = _next_id(Order), _next_id(OrderItem)
+        statuses = _mix(self.rng, ORDER_STATUSES, count)
+        order_rows, item_rows = [], []
+        for i, (status, warehouse_id, user_id) in enumerate(
+            zip(statuses, self.warehouses.pick(count), self.users.pick(count))
+        ):
+            moment = self.moment(i, count)
+            order_rows.append((first_id + i, f'{self.prefix}-SO{i:08d}', warehouse_id, status, user_id, moment, moment))
+            for product_id in set(self.products.pick(self.rng.randint(1, 6))):
+                item_rows.append((
+                    first_item_id + len(item_rows), first_id + i, product_id,
+                    _money(self.rng.randint(100, 100000)), moment, moment,
+                ))
+        self.insert(Order, ['id', 'order_number', 'warehouse', 'status', 'created_by', 'created_at', 'updated_at'], order_rows)
+        self.insert(OrderItem, ['id', 'order', 'product', 'quantity', 'created_at', 'updated_at'], item_rows)
+
+    def make_reorder_alerts(self):
+        count = self.counts['reorder_alerts']
+        first_id = _next_id(ReorderAlert)
+        items = Skewed(self.rng, self.stock_item_ids, exponent=0.9)
+        statuses = _mix(self.rng, ALERT_STATUSES, count)
+        rows = []
+        for i, (stock_item_id, status, user_id) in enumerate(zip(items.pick(count), statuses, self.users.pick(count))):
+            moment = self.moment(i, count)
+            rows.append((first_id + i, stock_item_id, status, user_id, moment, moment))
+        self.insert(ReorderAlert, ['id', 'stock_item', 'status', 'triggered_by', 'created_at', 'updated_at'], rows)
+
+    def make_audit_logs(self):
+        count = self.counts['audit_logs']
+        first_id = _next_id(AuditLog)
+        first_change_id = _next_id(AuditChange)
+        objects = {
+            'StockItem': self.stock_item_ids, 'Product': self.product_ids,
+            'Order': None, 'Warehouse': self.warehouses.items, 'BOM': None,
+        }
+        changes = []
+
+        def entries():
+            actions = _mix(self.rng, AUDIT_ACTIONS, count)
+            for i, (action, user_id) in enumerate(zip(actions, self.users.pick(count))):
+                rng = self.rng
+                moment = self.moment(i, count)
+                ip_address = f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+                if action in ('login', 'logout'):
+                    yield first_id + i, user_id, action, 'User', str(user_id), None, None, ip_address, moment
+                    continue
+                model_name = rng.choice(AUDITED_MODELS)
+                ids = objects[model_name]
+                object_id = str(rng.choice(ids) if ids else rng.randint(1, 100000))
+                entry_changes = None
+                if action == 'update':
+                    old = rng.randint(0, 100000)
+                    new = max(0, old + rng.randint(-5000, 5000))
+                    entry_changes = {'quantity': {'old': _money(old), 'new': _money(new)}}
+                    changes.append((
+                        first_change_id + len(changes), user_id, action, model_name, object_id,
+                        'quantity', _money(old), _money(new), moment,
+                    ))
+                yield (
+                    first_id + i, user_id, action, model_name, object_id, f'{model_name} {object_id}',
+                    json.dumps(entry_changes) if entry_changes else None, ip_address, moment,
+                )
+
+        self.insert(AuditLog, [
+            'id', 'user', 'action', 'model_name', 'object_id', 'object_repr', 'changes', 'ip_address', 'timestamp',
+        ], entries())
+        self.insert(AuditChange, [
+            'id', 'user', 'action', 'model_name', 'object_id', 'field', 'old_value', 'new_value', 'timestamp',
+        ], changes)
+
+    def finish(self):
+        from apps.reports.cache import bump_data_version
+        from apps.users.permissions import bump_permission_version
+
+        # Explicit primary keys leave sequence-based backends behind
+        models = [User, Category, Product, BOM, BOMComponent, Warehouse, StockItem, StockTransaction,
+                  Order, OrderItem, ReorderAlert, AuditLog, AuditChange, UnitOfMeasure]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        # Bulk inserts bypass the signals that invalidate cached reports and permissions
+        for model in models:
+            bump_data_version(model._meta.label)
+        bump_permission_version()
+
+
+def generate_dataset(size='small', seed=0, prefix='SYN', batch_size=BATCH_SIZE, log=None, **overrides):
+    """
+    Generate the ``size`` preset (see ``SIZES``), with any counts in
+    ``overrides`` replaced; returns ``{model label: rows written}``.
+    """
+    counts = {**SIZES[size], **{name: value for name, value in overrides.items() if value is not None}}
+    return DatasetGenerator(counts, seed=seed, prefix=prefix, batch_size=batch_size, log=log).run()
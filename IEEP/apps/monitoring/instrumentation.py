@@ -0,0 +1,150 @@
+# monitoring/instrumentation.py
+"""
+Feeds the metrics registry.
+
+- ``MetricsMiddleware`` times every request and counts its queries, per view
+  (under ASGI the counter is installed on the request's executor thread,
+  where sync views and the async ORM run their queries).
+- Signal receivers count stock transactions, reorder alerts and
+  notifications once their transaction commits.
+- A collector reads back the Celery task durations that workers record
+  in the shared cache (see ``taskmetrics``).
+- A collector reports the number of ``GeneratedReport`` rows per status.
+
+Report generation timings are recorded where the file is rendered, in
+``reports.cache``; cache hits and misses by the instrumented cache
+backends in ``monitoring.cache``.
+"""
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+
+from apps.inventory.models import ReorderAlert, StockTransaction
+from apps.notifications.models import Notification
+from apps.reports.models import GeneratedReport
+from .metrics import (
+    ALERTS, REGISTRY, REQUEST_LATENCY, REQUEST_QUERIES, STOCK_TRANSACTIONS, TASK_BUCKETS,
+    Gauge, Histogram,
+)
+from .profiler import view_name
+from .taskmetrics import TASK_BUCKET_KEY, TASK_NAMES_KEY, TASK_STATES
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        # Connections are per thread: call on the thread that runs the queries
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class MetricsMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        REQUEST_QUERIES.observe(counter.count, view=view_name(request))
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        await sync_to_async(counter.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.uninstall)()
+        self.observe(request, response, time.perf_counter() - start)
+        REQUEST_QUERIES.observe(counter.count, view=view_name(request))
+        return response
+
+    def observe(self, request, response, elapsed):
+        REQUEST_LATENCY.observe(
+            elapsed, view=view_name(request), method=request.method, status=f"{response.status_code // 100}xx"
+        )
+
+
+def count_stock_transaction(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        kind = instance.transaction_type
+        transaction.on_commit(lambda: STOCK_TRANSACTIONS.inc(type=kind))
+
+
+def count_alert(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        if sender is ReorderAlert:
+            labels = {'source': 'reorder_alert', 'kind': 'reorder'}
+        else:
+            labels = {'source': 'notification', 'kind': instance.kind}
+        transaction.on_commit(lambda: ALERTS.inc(**labels))
+
+
+@REGISTRY.collector
+def celery_task_metrics():
+    histogram = Histogram(
+        'ieep_celery_task_duration_seconds', "Celery task run time, by task and final state (all workers)",
+        labels=('task', 'state'), buckets=TASK_BUCKETS,
+    )
+    names = cache.get(TASK_NAMES_KEY) or []
+    buckets = range(len(histogram.buckets))
+    keys = [
+        TASK_BUCKET_KEY.format(name, state, index)
+        for name in names for state in TASK_STATES for index in [*buckets, 'sum']
+    ]
+    values = cache.get_many(keys)
+    for name in names:
+        for state in TASK_STATES:
+            counts = [values.get(TASK_BUCKET_KEY.format(name, state, index), 0) for index in buckets]
+            if any(counts):
+                total = values.get(TASK_BUCKET_KEY.format(name, state, 'sum'), 0) / 1000
+                histogram.load(counts, total, task=name, state=state)
+    return [histogram]
+
+
+@REGISTRY.collector
+def generated_report_metrics():
+    gauge = Gauge('ieep_generated_reports', "Stored generated reports, by status", labels=('status',))
+    rows = GeneratedReport.objects.order_by().values_list('status').annotate(count=Count('pk'))
+    for status, count in rows:
+        gauge.set(count, status=status)
+    return [gauge]
+
+
+def connect_signals():
+    post_save.connect(count_stock_transaction, sender=StockTransaction, dispatch_uid='metrics-stock-transaction')
+    post_save.connect(count_alert, sender=ReorderAlert, dispatch_uid='metrics-reorder-alert')
+    post_save.connect(count_alert, sender=Notification, dispatch_uid='metrics-notification')
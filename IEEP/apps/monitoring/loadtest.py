@@ -0,0 +1,251 @@
+# monitoring/loadtest.py
+"""
+In-process concurrent load test.
+
+``run_load`` starts one thread per simulated client. Each thread has its
+own database connection and test client, and for ``duration`` seconds
+runs operations drawn from a weighted mix:
+
+- ``stock_transaction``: lock a stock item and post a receipt or issue
+- ``order_confirmation``: confirm a pending order and deduct its stock
+- ``stock_list``: poll the stock item list
+- ``low_stock_report``: open the low stock report
+
+Stock items are picked with the same Zipf skew as the seeded data, so
+clerks contend on the same hot items as they do at shift change. Each
+operation's latency and outcome is recorded. Time spent in row-locking
+statements (``SELECT ... FOR UPDATE``, ``UPDATE``, ``DELETE``) is
+recorded as its lock wait. Failures are classified as deadlocks, lock
+timeouts or other errors, and the first message of each kind is kept so a
+failing run says why.
+"""
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test import Client
+from django.utils.module_loading import import_string
+
+from apps.inventory.models import Order, StockItem, StockTransaction
+from .benchmarks import fetch, url_for_view
+from .datasets import Skewed
+from .profiler import percentile
+
+DEFAULT_MIX = {'stock_transaction': 50, 'stock_list': 30, 'low_stock_report': 10, 'order_confirmation': 10}
+
+# Backend error codes: MySQL 1213/1205, PostgreSQL 40P01/55P03
+DEADLOCK_CODES = {1213, '40P01'}
+LOCK_TIMEOUT_CODES = {1205, '55P03'}
+LOCKING_PREFIXES = ('UPDATE', 'DELETE')
+
+
+class Rejected(Exception):
+    """The operation was refused by business rules (e.g. insufficient stock)."""
+
+
+class LockTimer:
+    """Execute wrapper summing the time spent in row-locking statements."""
+
+    def __init__(self):
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not (sql.lstrip().upper().startswith(LOCKING_PREFIXES) or 'FOR UPDATE' in sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.total += time.perf_counter() - start
+
+
+def classify(exc):
+    if isinstance(exc, Rejected):
+        return 'rejected'
+    cause = exc.__cause__ or exc
+    code = getattr(cause, 'pgcode', None) or (cause.args[0] if cause.args else None)
+    if code in DEADLOCK_CODES or 'deadlock' in str(exc).lower():
+        return 'deadlock'
+    if code in LOCK_TIMEOUT_CODES or 'database is locked' in str(exc):
+        return 'lock_timeout'
+    return 'error'
+
+
+class ClientContext:
+    def __init__(self, number, user, rng, shared):
+        self.number = number
+        self.user = user
+        self.rng = rng
+        self.shared = shared
+        self.client = Client()
+        self.client.force_login(user)
+
+
+def post_stock_transaction(ctx):
+    item_id = ctx.shared['stock_items'].pick(1, ctx.rng)[0]
+    with transaction.atomic():
+        item = StockItem.objects.select_for_update().select_related('product', 'warehouse').get(pk=item_id)
+        if item.quantity <= 0 or ctx.rng.random() < 0.4:
+            kind, quantity = 'in', Decimal(ctx.rng.randint(1, 50))
+        else:
+            kind, quantity = 'out', min(item.quantity, Decimal(ctx.rng.randint(1, 20)))
+        StockTransaction.objects.create(
+            stock_item=item, transaction_type=kind, quantity=quantity,
+            reference=f'LOAD-{ctx.number}-{time.monotonic_ns()}', created_by=ctx.user,
+        )
+
+
+def confirm_order(ctx):
+    try:
+        order_id = ctx.shared['pending_orders'].pop()
+    except IndexError:
+        return 'skipped'
+    try:
+        with transaction.atomic():
+            order = Order.objects.select_for_update().select_related('warehouse').get(pk=order_id)
+            if order.status != 'pending':
+                return 'skipped'
+            order.status = 'confirmed'
+            order.save(update_fields=['status', 'updated_at'])
+            order.update_stock()
+    except ValueError as exc:
+        raise Rejected(str(exc))
+
+
+def poll_stock_list(ctx):
+    fetch(ctx.client, ctx.shared['urls']['stock_list'], {'page': ctx.rng.randint(1, 3)})
+
+
+def open_low_stock_report(ctx):
+    fetch(ctx.client, ctx.shared['urls']['low_stock_report'])
+
+
+OPERATIONS = {
+    'stock_transaction': post_stock_transaction,
+    'order_confirmation': confirm_order,
+    'stock_list': poll_stock_list,
+    'low_stock_report': open_low_stock_report,
+}
+
+
+def _client_loop(ctx, mix, deadline, think_time, records):
+    names, weights = zip(*mix.items())
+    timer = LockTimer()
+    try:
+        with connection.execute_wrapper(timer):
+            while time.monotonic() < deadline:
+                name = ctx.rng.choices(names, weights=weights)[0]
+                timer.total = 0.0
+                start = time.perf_counter()
+                message = None
+                try:
+                    outcome = OPERATIONS[name](ctx) or 'ok'
+                except Exception as exc:
+                    outcome = classify(exc)
+                    message = f"{type(exc).__name__}: {exc}"
+                records.append((name, outcome, time.perf_counter() - start, timer.total, message))
+                if think_time:
+                    time.sleep(ctx.rng.uniform(0, 2 * think_time))
+    finally:
+        connection.close()
+
+
+def _shared_state(seed):
+    stock_item_ids = list(StockItem.objects.order_by('pk').values_list('pk', flat=True))
+    if not stock_item_ids:
+        raise ValueError("No stock items; seed a dataset first (manage.py seed_dataset)")
+    pending = list(
+        Order.objects.filter(status='pending', warehouse__isnull=False, order_items__isnull=False)
+        .distinct().order_by('pk').values_list('pk', flat=True)
+    )
+    random.Random(seed).shuffle(pending)
+    urls = {}
+    for name, view in (('stock_list', 'apps.inventory.views.StockItemListView'),
+                       ('low_stock_report', 'apps.reports.views.LowStockReportView')):
+        try:
+            urls[name] = url_for_view(import_string(view))
+        except Exception:
+            urls[name] = None
+    return {
+        # One popularity ranking shared by all clients; each picks with its own generator
+        'stock_items': Skewed(random.Random(seed), stock_item_ids, exponent=0.8),
+        'pending_orders': deque(pending),
+        'urls': urls,
+    }
+
+
+def summarize(records, elapsed):
+    by_operation = defaultdict(list)
+    for record in records:
+        by_operation[record[0]].append(record)
+    summary = {}
+    for name, rows in sorted(by_operation.items()):
+        outcomes = defaultdict(int)
+        first_messages = {}
+        for row in rows:
+            outcomes[row[1]] += 1
+            if row[4] is not None:
+                first_messages.setdefault(row[1], row[4])
+        latencies = [row[2] * 1000 for row in rows if row[1] == 'ok']
+        lock_waits = [row[3] * 1000 for row in rows]
+        summary[name] = {
+            'operations': len(rows),
+            'ok': outcomes['ok'],
+            'throughput_per_s': round(outcomes['ok'] / elapsed, 2),
+            'latency_p50_ms': round(percentile(latencies, 50) or 0, 2),
+            'latency_p95_ms': round(percentile(latencies, 95) or 0, 2),
+            'latency_p99_ms': round(percentile(latencies, 99) or 0, 2),
+            'latency_max_ms': round(max(latencies, default=0), 2),
+            'errors': outcomes['error'],
+            'deadlocks': outcomes['deadlock'],
+            'lock_timeouts': outcomes['lock_timeout'],
+            'rejected': outcomes['rejected'],
+            'skipped': outcomes['skipped'],
+            'lock_wait_total_ms': round(sum(lock_waits), 1),
+            'lock_wait_p95_ms': round(percentile(lock_waits, 95) or 0, 2),
+            'first_messages': first_messages,
+        }
+    return summary
+
+
+def innodb_lock_status():
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%%'")
+        return {name: int(value) for name, value in cursor.fetchall()}
+
+
+def run_load(clients, duration, mix=None, seed=0, think_time=0.0, users=None):
+    """
+    Run the load test and return ``(summary, elapsed)``, where ``summary``
+    maps each operation to its counts, latency percentiles and lock waits.
+    """
+    mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+    if unknown := set(mix) - set(OPERATIONS):
+        raise ValueError(f"Unknown operations: {', '.join(sorted(unknown))}")
+    shared = _shared_state(seed)
+    for name in ('stock_list', 'low_stock_report'):
+        if name in mix and shared['urls'][name] is None:
+            raise ValueError(f"No URL serves the view behind '{name}'")
+    users = list(users)
+    contexts = [
+        ClientContext(number, users[number % len(users)], random.Random(seed + number + 1), shared)
+        for number in range(clients)
+    ]
+    records = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_client_loop, args=(ctx, mix, deadline, think_time, records), name=f'load-client-{ctx.number}')
+        for ctx in contexts
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return summarize(records, elapsed), elapsed
@@ -0,0 +1,63 @@
+# monitoring/logqueue.py
+"""
+Non-blocking file logging.
+
+``QueuedFileHandler`` formats a record in the calling thread and puts it
+on a bounded in-memory queue; a ``QueueListener`` thread writes the queue
+to the file. A slow disk therefore never stalls a request thread. When
+the queue is full the record is dropped and counted in
+``ieep_log_records_dropped_total`` rather than blocking.
+
+Forked children (Celery prefork workers, gunicorn with ``--preload``)
+inherit the handler but not its writer thread, so each child starts its
+own listener on a fresh queue.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import weakref
+
+from .metrics import LOG_RECORDS_DROPPED
+
+_handlers = weakref.WeakSet()
+
+
+class QueuedFileHandler(logging.handlers.QueueHandler):
+    def __init__(self, filename, mode='a', encoding=None, delay=False, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.FileHandler(filename, mode, encoding, delay)
+        self.listener = None
+        self._start_listener()
+        _handlers.add(self)
+
+    def _start_listener(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        # Records still queued in the parent are the parent's to write
+        self.queue = queue.Queue(self.maxsize)
+        self._start_listener()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        # Called by logging.shutdown at exit: drain the queue before closing the file
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+
+def _after_fork():
+    for handler in list(_handlers):
+        handler._restart_in_child()
+
+
+os.register_at_fork(after_in_child=_after_fork)
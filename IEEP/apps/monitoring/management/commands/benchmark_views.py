@@ -0,0 +1,153 @@
+# monitoring/management/commands/benchmark_views.py
+import json
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from apps.monitoring.benchmarks import CASES, compare_to_baseline, result_key, run_case
+from apps.monitoring.datasets import SIZES, generate_dataset
+from apps.users.audit import audit_sink
+
+BENCHMARK_DIR = Path(settings.BASE_DIR) / 'benchmarks'
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main views and saves against seeded datasets and compare with a stored baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='tiny,small', help="Comma-separated dataset sizes (default: tiny,small)")
+        parser.add_argument('--cases', help="Comma-separated case names (default: all)")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case (default: 5)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--warm', action='store_true', help="Keep the cache between runs instead of clearing it")
+        parser.add_argument('--existing', action='store_true',
+                            help="Benchmark the current database as is, without a test database or seeding")
+        parser.add_argument('--baseline', default=str(BENCHMARK_DIR / 'baseline.json'))
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative growth of wall time and peak memory (default: 0.25)")
+        parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+        parser.add_argument('--output', help="Where to write the JSON results (default: benchmarks/results-<time>.json)")
+
+    def handle(self, *args, **options):
+        cases = CASES
+        if options['cases']:
+            names = set(options['cases'].split(','))
+            cases = [case for case in CASES if case.name in names]
+            if unknown := names - {case.name for case in cases}:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+        sizes = ['existing'] if options['existing'] else options['sizes'].split(',')
+        if unknown := [size for size in sizes if size not in SIZES and size != 'existing']:
+            raise CommandError(f"Unknown sizes: {', '.join(unknown)}")
+
+        results = self.run(sizes, cases, options)
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'cold_cache': not options['warm'],
+            'results': results,
+        }
+
+        baseline_path = Path(options['baseline'])
+        regressions = []
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())['results']
+            regressions = compare_to_baseline(results, baseline, options['tolerance'])
+        report['regressions'] = regressions
+
+        output = Path(options['output'] or BENCHMARK_DIR / f"results-{timezone.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Results written to {output}")
+
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'revision': report['revision'],
+                'timestamp': report['timestamp'],
+                'results': {result_key(result): result for result in results if result['status'] == 'ok'},
+            }, indent=2))
+            self.stdout.write(f"Baseline updated at {baseline_path}")
+            return
+
+        errors = [result for result in results if result['status'] != 'ok']
+        for message in regressions:
+            self.stderr.write(self.style.ERROR(f"Regression: {message}"))
+        if regressions or errors:
+            raise CommandError(f"{len(regressions)} regression(s), {len(errors)} failed case(s)")
+        self.stdout.write(self.style.SUCCESS("No regressions"))
+
+    def run(self, sizes, cases, options):
+        results = []
+        setup_test_environment()
+        old_name = None
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                # Never clear or fill a shared cache, and keep generated reports out of MEDIA_ROOT
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'}},
+                MEDIA_ROOT=media_root,
+                QUERY_PROFILER_ENABLED=False,
+            ):
+                if not options['existing']:
+                    old_name = connection.settings_dict['NAME']
+                    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                for size in sizes:
+                    client = Client()
+                    client.force_login(self.prepare(size, options['seed']))
+                    for case in cases:
+                        result = {'size': size, **run_case(client, case, options['repeat'], cold=not options['warm'])}
+                        # Audit entries written in the background must not land in the next case or dataset
+                        audit_sink.flush()
+                        results.append(result)
+                        self.write_result(result)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        return results
+
+    def prepare(self, size, seed):
+        from apps.users.models import User
+
+        if size != 'existing':
+            call_command('flush', interactive=False, verbosity=0)
+            self.stdout.write(f"Seeding {size} dataset...")
+            generate_dataset(size=size, seed=seed)
+        user, _ = User.objects.get_or_create(
+            username='benchmark', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        return user
+
+    def write_result(self, result):
+        label = f"{result['size']}/{result['case']}"
+        if result['status'] != 'ok':
+            self.stdout.write(self.style.WARNING(f"  {label:<40} {result['error']}"))
+            return
+        self.stdout.write(
+            f"  {label:<40} {result['wall_ms']:>9.1f}ms {result['queries']:>5} queries "
+            f"{result['peak_memory_kb']:>10.0f}KB peak"
+        )
@@ -0,0 +1,91 @@
+# monitoring/management/commands/loadtest.py
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from apps.monitoring.loadtest import DEFAULT_MIX, innodb_lock_status, run_load
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        try:
+            mix[name.strip()] = int(weight)
+        except ValueError:
+            raise CommandError(f"Invalid mix entry '{part}'; expected name=weight")
+    return mix
+
+
+class Command(BaseCommand):
+    help = "Run concurrent simulated clients against the stock write and read paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20, help="Concurrent simulated clients (default: 20)")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run (default: 30)")
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help="Operation weights, e.g. stock_transaction=50,stock_list=30,"
+                                 "low_stock_report=10,order_confirmation=10")
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help="Mean pause between a client's operations, in seconds")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Also write the results as JSON to this path")
+        parser.add_argument('--force', action='store_true', help="Run even when DEBUG is off")
+
+    def handle(self, *args, **options):
+        from apps.users.models import User
+
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("The load test writes stock transactions; refusing to run with DEBUG off (use --force)")
+        users = User.objects.filter(is_active=True).order_by('pk')[:options['clients']]
+        if not users:
+            raise CommandError("No active users to run the clients as")
+
+        before = innodb_lock_status()
+        self.stdout.write(f"Running {options['clients']} clients for {options['duration']:g}s...")
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                summary, elapsed = run_load(
+                    options['clients'], options['duration'], mix=options['mix'],
+                    seed=options['seed'], think_time=options['think_time'], users=users,
+                )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        after = innodb_lock_status()
+
+        self.stdout.write(
+            f"{'operation':<20}{'ok':>8}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'errors':>8}{'deadlk':>8}{'lock to':>8}{'rejected':>9}{'lock ms':>10}"
+        )
+        for name, row in summary.items():
+            self.stdout.write(
+                f"{name:<20}{row['ok']:>8}{row['throughput_per_s']:>9.1f}{row['latency_p50_ms']:>9.1f}"
+                f"{row['latency_p95_ms']:>9.1f}{row['latency_p99_ms']:>9.1f}{row['errors']:>8}"
+                f"{row['deadlocks']:>8}{row['lock_timeouts']:>8}{row['rejected']:>9}{row['lock_wait_total_ms']:>10.0f}"
+            )
+        for name, row in summary.items():
+            for outcome, message in sorted(row['first_messages'].items()):
+                self.stdout.write(f"  {name} {outcome}: {message}")
+        total_ok = sum(row['ok'] for row in summary.values())
+        self.stdout.write(f"Total: {total_ok} operations in {elapsed:.1f}s ({total_ok / elapsed:.1f}/s)")
+
+        innodb = None
+        if before is not None and after is not None:
+            innodb = {name: after[name] - before.get(name, 0) for name in after}
+            self.stdout.write(
+                f"InnoDB row lock waits: {innodb.get('Innodb_row_lock_waits', 0)}, "
+                f"time waited: {innodb.get('Innodb_row_lock_time', 0)}ms"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({
+                'clients': options['clients'],
+                'duration': options['duration'],
+                'mix': options['mix'],
+                'elapsed': round(elapsed, 2),
+                'operations': summary,
+                'innodb_row_locks': innodb,
+            }, indent=2))
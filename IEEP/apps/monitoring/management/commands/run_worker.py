@@ -0,0 +1,39 @@
+# monitoring/management/commands/run_worker.py
+import shlex
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Start a Celery worker for one queue, with that queue's concurrency and prefetch from TASK_QUEUE_WORKERS"
+    # The worker runs its own checks when it loads the Celery app
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', help=f"Queue to consume: {', '.join(settings.TASK_QUEUE_WORKERS)}")
+        parser.add_argument('--concurrency', type=int, help="Override the configured concurrency")
+        parser.add_argument('--prefetch-multiplier', type=int, help="Override the configured prefetch multiplier")
+        parser.add_argument('--loglevel', default='INFO')
+        parser.add_argument('--print', action='store_true', dest='print_only',
+                            help="Print the equivalent celery command (e.g. for a service unit) instead of starting")
+
+    def handle(self, *args, **options):
+        queue = options['queue']
+        if queue not in settings.TASK_QUEUE_WORKERS:
+            raise CommandError(f"Unknown queue '{queue}'. Configured: {', '.join(settings.TASK_QUEUE_WORKERS)}")
+        config = settings.TASK_QUEUE_WORKERS[queue]
+        argv = [
+            'worker',
+            '--queues', queue,
+            '--hostname', f'{queue}@%h',
+            '--concurrency', str(options['concurrency'] or config['concurrency']),
+            '--prefetch-multiplier', str(options['prefetch_multiplier'] or config['prefetch_multiplier']),
+            '--loglevel', options['loglevel'],
+        ]
+        if options['print_only']:
+            self.stdout.write(shlex.join(['celery', '--app', 'ieep', *argv]))
+            return
+
+        from ieep.celery import app
+        app.worker_main(argv)
@@ -0,0 +1,59 @@
+# monitoring/management/commands/startup_profile.py
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.monitoring.startup import TARGETS, StartupError, by_package, profile_startup
+
+
+class Command(BaseCommand):
+    help = "Measure cold start: import time per module and the time until the first request is served"
+    # The boot being measured happens in a child process, which reports its own failures
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='web',
+                            help="Boot a web process (default) or a Celery worker")
+        parser.add_argument('--url', default='/', help="Path of the first request (web target, default: /)")
+        parser.add_argument('--host', help="Host header of the first request (default: first of ALLOWED_HOSTS)")
+        parser.add_argument('--repeat', type=int, default=3, help="Fresh processes to boot; timings are medians (default: 3)")
+        parser.add_argument('--top', type=int, default=25, help="Modules and packages to list (default: 25)")
+        parser.add_argument('--max-ms', type=float,
+                            help="Fail if the phases up to ready take longer than this many milliseconds in total")
+        parser.add_argument('--output', help="Also write the full results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+        try:
+            report = profile_startup(options['target'], options['url'], options['host'], options['repeat'])
+        except StartupError as exc:
+            raise CommandError(f"Startup failed:\n{exc}")
+
+        modules = report['modules']
+        top = options['top']
+        self.stdout.write(f"Phases ({report['target']}, median of {report['repeat']}):")
+        for name, elapsed in report['phases_ms'].items():
+            self.stdout.write(f"  {name:<20} {elapsed:>9.1f}ms")
+        self.stdout.write(f"  {'ready':<20} {report['ready_ms']:>9.1f}ms")
+        self.stdout.write(f"  {'process wall':<20} {report['process_wall_ms']:>9.1f}ms")
+        if report['status']:
+            self.stdout.write(f"  first response status {report['status']}")
+
+        self.stdout.write(f"\nImports: {len(modules)} modules, {report['import_total_ms']:.1f}ms")
+        self.stdout.write("\nSlowest packages (self time):")
+        for package, self_us in sorted(by_package(modules).items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {package:<40} {self_us / 1000:>9.1f}ms")
+        self.stdout.write("\nSlowest modules (cumulative / self):")
+        for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:top]:
+            self.stdout.write(f"  {name:<60} {cumulative_us / 1000:>9.1f}ms {self_us / 1000:>9.1f}ms")
+
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"\nResults written to {output}")
+
+        if options['max_ms'] is not None and report['ready_ms'] > options['max_ms']:
+            raise CommandError(f"Startup took {report['ready_ms']:.1f}ms, over the {options['max_ms']:.0f}ms budget")
@@ -0,0 +1,275 @@
+# monitoring/metrics.py
+"""
+In-process metrics registry.
+
+Counters, gauges and histograms are kept in memory, keyed by their label
+values, and rendered in the Prometheus text exposition format by
+``MetricsView``. Updating a metric takes a lock and a dictionary update,
+so it is cheap enough for every request. Values are recorded per
+process; ``sharedmetrics`` pushes counter and histogram changes to the
+shared cache so a scrape of any process reports the totals of all of
+them. Gauges stay per process; ``ieep_process_start_time_seconds`` lets
+the scraper tell a restart from a drop.
+
+Collectors registered with ``REGISTRY.collector`` are called at scrape
+time and return extra metrics computed on demand (for example from the
+database or the shared cache).
+
+This module imports nothing from Django, so the logging handlers can use
+it before the apps are loaded.
+"""
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _copy(value):
+    return list(value) if isinstance(value, list) else value
+
+
+def _subtract(value, previous):
+    if previous is None:
+        return value
+    if isinstance(value, list):
+        return [current - before for current, before in zip(value, previous)]
+    return value - previous
+
+
+def _nonzero(value):
+    return any(value) if isinstance(value, list) else value != 0
+
+
+class Metric:
+    kind = None
+    # Whether values from several processes add up (see sharedmetrics)
+    additive = True
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pushed = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+            self._pushed.clear()
+
+    def changes(self):
+        """Return ``{label values: change}`` since the previous call, and remember the current values."""
+        with self._lock:
+            values = {key: _copy(value) for key, value in self._values.items()}
+            pushed, self._pushed = self._pushed, values
+        changes = {}
+        for key, value in values.items():
+            change = _subtract(value, pushed.get(key))
+            if _nonzero(change):
+                changes[key] = change
+        return changes
+
+    def samples(self):
+        """Yield ``(suffix, label pairs, value)`` for every recorded series."""
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield '', tuple(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def load(self, value, **labels):
+        """Set a series to a total recorded elsewhere."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    additive = False
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # One count per bucket (not cumulative), then the sum
+                series = self._values[key] = [0] * len(self.buckets) + [0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-1] += value
+
+    def load(self, counts, total, **labels):
+        """Set a series from per-bucket counts and a sum recorded elsewhere."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = list(counts) + [total]
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            pairs = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield '_bucket', pairs + (('le', _format_value(float(bound))),), cumulative
+            yield '_sum', pairs, series[-1]
+            yield '_count', pairs, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        # ``function(metrics) -> metrics`` that swaps in values from all processes
+        self.merge = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, function):
+        """Register ``function() -> iterable of metrics``, called at every scrape."""
+        with self._lock:
+            self._collectors.append(function)
+        return function
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def collect(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        if self.merge is not None:
+            try:
+                metrics = self.merge(metrics)
+            except Exception:
+                logger.warning("Could not read metrics shared by other processes; serving this process's", exc_info=True)
+        for function in collectors:
+            try:
+                metrics.extend(function())
+            except Exception:
+                # One failing source (e.g. the cache is down) must not hide the rest
+                logger.warning("Metrics collector %s failed", function.__name__, exc_info=True)
+        return metrics
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.collect()) + '\n'
+
+
+REGISTRY = Registry()
+
+PROCESS_START_TIME = REGISTRY.gauge(
+    'ieep_process_start_time_seconds', "Start time of the process since the epoch, in seconds")
+PROCESS_START_TIME.set(time.time())
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'ieep_http_request_duration_seconds', "Time to build the response, by view",
+    labels=('view', 'method', 'status'))
+REQUEST_QUERIES = REGISTRY.histogram(
+    'ieep_http_request_db_queries', "Database queries per request, by view",
+    labels=('view',), buckets=QUERY_BUCKETS)
+STOCK_TRANSACTIONS = REGISTRY.counter(
+    'ieep_stock_transactions_total', "Committed stock transactions, by type", labels=('type',))
+REPORT_GENERATION = REGISTRY.histogram(
+    'ieep_report_generation_seconds', "Time to render a generated report file",
+    labels=('report_type', 'format', 'status'), buckets=TASK_BUCKETS)
+REPORT_SIZE = REGISTRY.histogram(
+    'ieep_report_size_bytes', "Size of generated report files",
+    labels=('report_type', 'format'), buckets=SIZE_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter(
+    'ieep_cache_requests_total', "Cache lookups by key namespace and result (hit or miss)",
+    labels=('namespace', 'result'))
+ALERTS = REGISTRY.counter(
+    'ieep_alerts_total', "Committed reorder alerts and notifications, by source and kind",
+    labels=('source', 'kind'))
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    'ieep_log_records_dropped_total', "Log records dropped because the log queue was full")
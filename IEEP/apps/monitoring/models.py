@@ -0,0 +1,34 @@
+# monitoring/models.py
+from django.conf import settings
+from django.db import models
+
+class RequestProfile(models.Model):
+    TRIGGER_CHOICES = [
+        ('header', 'X-Profile header'),
+        ('query', 'Query parameter'),
+        ('sampled', 'Random sample'),
+    ]
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status_code = models.PositiveSmallIntegerField(null=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField()
+    cpu_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    interval_ms = models.FloatField()
+    # Collapsed stacks ("frame;frame;frame count" per line), readable by speedscope and flamegraph.pl
+    file_path = models.CharField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['view_name', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
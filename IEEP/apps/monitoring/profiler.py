@@ -0,0 +1,185 @@
+# monitoring/profiler.py
+"""
+Per-request query profiling and N+1 detection.
+
+``QueryProfilerMiddleware`` is enabled with ``QUERY_PROFILER_ENABLED``;
+when it is off Django drops it at startup, so requests pay nothing. When
+on, every query of a request runs through a database execute wrapper that
+counts it, times it and groups it by SQL shape (the statement with its
+parameters left out). A shape repeated ``QUERY_PROFILER_N_PLUS_ONE_THRESHOLD``
+times in one request is reported as an N+1, with the view and the first
+project source line on the stack that issued it.
+
+Results go to the ``X-DB-Queries``/``X-DB-Time``/``Server-Timing`` response
+headers and to per-view aggregates (latency p50/p95, queries per request)
+kept in process and served by ``QueryStatsView``.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = str(Path(settings.BASE_DIR) / 'apps')
+# Frames that wrap every request rather than issue its queries
+SKIPPED_FILES = {str(Path(__file__).resolve()), str(Path(settings.BASE_DIR) / 'apps' / 'users' / 'middleware.py')}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (``pct`` in 0-100); None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def query_origin():
+    """``(filename, lineno)`` of the innermost project frame that issued the query."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_ROOT) and filename not in SKIPPED_FILES:
+            return filename[len(str(settings.BASE_DIR)) + 1:], frame.f_lineno
+        frame = frame.f_back
+    return None, None
+
+
+class QueryRecorder:
+    """Database execute wrapper collecting one request's queries."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql] += 1
+            # Walking the stack is only worth it once a shape looks like an N+1
+            if self.shapes[sql] == self.threshold:
+                self.origins[sql] = query_origin()
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.shapes.items() if count > 1}
+
+    @property
+    def n_plus_one(self):
+        return [
+            {'sql': sql, 'count': self.shapes[sql], 'file': filename, 'line': lineno}
+            for sql, (filename, lineno) in self.origins.items()
+        ]
+
+
+class QueryStats:
+    """Per-view aggregates over the last ``size`` profiled requests of each view."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.size))
+        self._requests = Counter()
+        self._n_plus_one = defaultdict(Counter)
+
+    def add(self, view, elapsed, recorder):
+        with self._lock:
+            self._samples[view].append((elapsed, recorder.count, recorder.duration))
+            self._requests[view] += 1
+            for issue in recorder.n_plus_one:
+                self._n_plus_one[view][(issue['file'], issue['line'], issue['sql'])] += 1
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._requests.clear()
+            self._n_plus_one.clear()
+
+    def summary(self):
+        with self._lock:
+            samples = {view: list(rows) for view, rows in self._samples.items()}
+            requests = dict(self._requests)
+            n_plus_one = {view: dict(issues) for view, issues in self._n_plus_one.items()}
+        views = []
+        for view, rows in samples.items():
+            latencies = [row[0] * 1000 for row in rows]
+            queries = [row[1] for row in rows]
+            views.append({
+                'view': view,
+                'requests': requests[view],
+                'latency_p50_ms': round(percentile(latencies, 50), 2),
+                'latency_p95_ms': round(percentile(latencies, 95), 2),
+                'queries_avg': round(sum(queries) / len(queries), 1),
+                'queries_max': max(queries),
+                'db_time_avg_ms': round(sum(row[2] for row in rows) * 1000 / len(rows), 2),
+                'n_plus_one': [
+                    {'file': filename, 'line': lineno, 'sql': sql, 'requests': count}
+                    for (filename, lineno, sql), count in sorted(
+                        n_plus_one.get(view, {}).items(), key=lambda item: -item[1]
+                    )
+                ],
+            })
+        views.sort(key=lambda row: -row['queries_avg'])
+        return views
+
+
+query_stats = QueryStats(getattr(settings, 'QUERY_PROFILER_SAMPLES', 500))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        recorder = QueryRecorder(self.threshold)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_name(request)
+        query_stats.add(view, elapsed, recorder)
+        for issue in recorder.n_plus_one:
+            logger.warning(
+                "Possible N+1 in %s: %d x %s (%s:%s)",
+                view, issue['count'], issue['sql'][:200], issue['file'], issue['line'],
+            )
+        response['X-DB-Queries'] = recorder.count
+        response['X-DB-Time'] = f"{recorder.duration * 1000:.1f}ms"
+        response['X-DB-Duplicate-Queries'] = sum(count - 1 for count in recorder.duplicates.values())
+        if recorder.origins:
+            response['X-DB-N-Plus-One'] = '; '.join(
+                f"{issue['count']}x {issue['file']}:{issue['line']}" if issue['file'] else f"{issue['count']}x {view}"
+                for issue in recorder.n_plus_one
+            )
+        response['Server-Timing'] = (
+            f"db;desc=\"{recorder.count} queries\";dur={recorder.duration * 1000:.1f}, "
+            f"total;dur={elapsed * 1000:.1f}"
+        )
+        return response
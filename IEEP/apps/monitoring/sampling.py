@@ -0,0 +1,186 @@
+# monitoring/sampling.py
+"""
+Sampling profiler for individual requests.
+
+A request is profiled when a staff user sends ``X-Profile: 1`` or
+``?_profile=1``, or when it is picked at random at
+``REQUEST_PROFILER_SAMPLE_RATE``. For a profiled request a helper thread
+reads the request thread's stack every ``REQUEST_PROFILER_INTERVAL``
+seconds; identical stacks are counted and written as collapsed stacks
+(one ``frame;frame;frame count`` line per stack) under
+``REQUEST_PROFILE_ROOT``, which speedscope and flamegraph.pl open
+directly. A ``RequestProfile`` row records the view and timings, and is
+listed in the admin with a download link.
+
+The checks on an unprofiled request are a couple of dictionary lookups;
+no thread is started and nothing is traced. Under ASGI, sync views, their
+template rendering and sync middleware all run on the request's
+thread-sensitive executor thread, so that thread is the one sampled (an
+``async def`` view runs on the event loop and is not captured).
+"""
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .profiler import view_name
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile='
+# A runaway request stops being sampled after this long
+MAX_DURATION = 120
+BASE_DIR = str(settings.BASE_DIR) + '/'
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(BASE_DIR):
+                filename = filename[len(BASE_DIR):]
+            elif 'site-packages/' in filename:
+                filename = filename.split('site-packages/', 1)[1]
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+            self.labels[code] = label
+        return label
+
+    def _run(self):
+        deadline = time.monotonic() + MAX_DURATION
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_trigger(request, sample_rate):
+    """How this request asked to be profiled, or None."""
+    if PROFILE_HEADER in request.META or PROFILE_PARAM in request.META.get('QUERY_STRING', ''):
+        if getattr(request, 'user', None) is not None and request.user.is_staff:
+            return 'header' if PROFILE_HEADER in request.META else 'query'
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None
+
+
+def save_profile(request, response, trigger, sampler, duration, cpu_time):
+    from .models import RequestProfile
+
+    root = Path(settings.REQUEST_PROFILE_ROOT) / f"{timezone.now():%Y-%m-%d}"
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"{uuid.uuid4().hex}.collapsed.txt"
+    path.write_text(sampler.collapsed())
+    user = request.user if getattr(request, 'user', None) is not None and request.user.is_authenticated else None
+    return RequestProfile.objects.create(
+        method=request.method,
+        path=request.path[:500],
+        view_name=view_name(request)[:200],
+        user=user,
+        status_code=response.status_code,
+        trigger=trigger,
+        duration_ms=duration * 1000,
+        cpu_ms=cpu_time * 1000,
+        sample_count=sum(sampler.stacks.values()),
+        interval_ms=sampler.interval * 1000,
+        file_path=str(path),
+    )
+
+
+class SamplingProfilerMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILER_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_PROFILER_SAMPLE_RATE', 0.0)
+        self.interval = getattr(settings, 'REQUEST_PROFILER_INTERVAL', 0.005)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = profile_trigger(request, self.sample_rate)
+        if trigger is None:
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration, cpu_time = time.perf_counter() - start, time.thread_time() - cpu_start
+        try:
+            profile = save_profile(request, response, trigger, sampler, duration, cpu_time)
+        except Exception:
+            # A profile that cannot be stored must not fail the request
+            logger.exception("Could not save the profile of %s %s", request.method, request.path)
+            return response
+        if trigger != 'sampled':
+            response['X-Profile-Id'] = profile.pk
+        return response
+
+    def _executor_state(self, request):
+        # request.user may hit the session and the database, so this runs on the executor thread
+        return profile_trigger(request, self.sample_rate), threading.get_ident(), time.thread_time()
+
+    async def __acall__(self, request):
+        trigger, thread_id, cpu_start = await sync_to_async(self._executor_state)(request)
+        if trigger is None:
+            return await self.get_response(request)
+
+        sampler = StackSampler(thread_id, self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - start
+        cpu_time = await sync_to_async(time.thread_time)() - cpu_start
+        try:
+            profile = await sync_to_async(save_profile)(request, response, trigger, sampler, duration, cpu_time)
+        except Exception:
+            logger.exception("Could not save the profile of %s %s", request.method, request.path)
+            return response
+        if trigger != 'sampled':
+            response['X-Profile-Id'] = profile.pk
+        return response
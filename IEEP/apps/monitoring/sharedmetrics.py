@@ -0,0 +1,159 @@
+# monitoring/sharedmetrics.py
+"""
+Metrics shared between processes.
+
+Gunicorn and Celery run several processes, each with its own ``REGISTRY``,
+and a scrape reaches only one of them. Every process adds the changes to
+its counters and histograms to per-series counters in the shared cache
+every ``METRICS_PUSH_INTERVAL`` seconds and when it exits; a scrape pushes
+its own changes, then serves the totals of all processes. Gauges describe
+the process that answers the scrape and are not shared.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import REGISTRY, Counter, Histogram
+from .taskmetrics import _incr
+
+logger = logging.getLogger(__name__)
+
+SERIES_KEY = 'monitoring:metrics:series'
+VALUE_KEY = 'monitoring:metrics:{}:{}'
+# Cache counters hold integers, so histogram sums are kept in millionths
+SUM_SCALE = 10 ** 6
+
+_push_lock = threading.Lock()
+_known_series = set()
+_unindexed = {}
+_stop = threading.Event()
+
+
+def _series_id(name, key):
+    return hashlib.sha1(json.dumps([name, key]).encode()).hexdigest()[:16]
+
+
+def _index_series():
+    """Add the series pushed since the last call to the shared series index."""
+    index = cache.get(SERIES_KEY) or {}
+    missing = {series: entry for series, entry in _unindexed.items() if series not in index}
+    if missing:
+        cache.set(SERIES_KEY, {**index, **missing}, timeout=None)
+        # A concurrent writer may have replaced the index; anything it dropped is retried on the next push
+        index = cache.get(SERIES_KEY) or {}
+    for series in list(_unindexed):
+        if series in index:
+            _known_series.add(series)
+            del _unindexed[series]
+
+
+def _push(metrics):
+    # Changes are taken before they are sent, so a cache error drops them rather than counting them twice
+    with _push_lock:
+        for metric in metrics:
+            if not metric.additive:
+                continue
+            for key, change in metric.changes().items():
+                series = _series_id(metric.name, key)
+                if isinstance(change, list):
+                    for index, count in enumerate(change[:-1]):
+                        if count:
+                            _incr(VALUE_KEY.format(series, index), count)
+                    if change[-1]:
+                        _incr(VALUE_KEY.format(series, 'sum'), round(change[-1] * SUM_SCALE))
+                else:
+                    _incr(VALUE_KEY.format(series, 'value'), round(change))
+                if series not in _known_series:
+                    _unindexed[series] = (metric.name, key)
+        if _unindexed:
+            _index_series()
+
+
+def push(registry=REGISTRY):
+    """Add this process's changes since the last push to the shared totals."""
+    _push(registry.metrics())
+
+
+def merge(metrics):
+    """Return ``metrics`` with counters and histograms replaced by the totals of all processes."""
+    _push(metrics)
+    series_by_name = {}
+    for series, (name, key) in (cache.get(SERIES_KEY) or {}).items():
+        series_by_name.setdefault(name, []).append((series, tuple(key)))
+    shared = [
+        metric for metric in metrics
+        if metric.additive and isinstance(metric, (Counter, Histogram)) and metric.name in series_by_name
+    ]
+    keys = []
+    for metric in shared:
+        for series, _ in series_by_name[metric.name]:
+            if isinstance(metric, Histogram):
+                keys.extend(VALUE_KEY.format(series, index) for index in range(len(metric.buckets)))
+                keys.append(VALUE_KEY.format(series, 'sum'))
+            else:
+                keys.append(VALUE_KEY.format(series, 'value'))
+    values = cache.get_many(keys)
+
+    totals = {}
+    for metric in shared:
+        if isinstance(metric, Histogram):
+            total = Histogram(metric.name, metric.documentation, metric.labelnames, metric.buckets[:-1])
+        else:
+            total = Counter(metric.name, metric.documentation, metric.labelnames)
+        for series, key in series_by_name[metric.name]:
+            if len(key) != len(metric.labelnames):
+                # Recorded before the metric's labels changed
+                continue
+            labels = dict(zip(metric.labelnames, key))
+            if isinstance(metric, Histogram):
+                counts = [values.get(VALUE_KEY.format(series, index), 0) for index in range(len(metric.buckets))]
+                total.load(counts, values.get(VALUE_KEY.format(series, 'sum'), 0) / SUM_SCALE, **labels)
+            else:
+                total.load(values.get(VALUE_KEY.format(series, 'value'), 0), **labels)
+        totals[metric.name] = total
+    return [totals.get(metric.name, metric) for metric in metrics]
+
+
+def _run(registry, interval):
+    while not _stop.wait(interval):
+        try:
+            push(registry)
+        except Exception:
+            logger.warning("Could not push metrics to the shared cache", exc_info=True)
+
+
+def _start_thread(registry, interval):
+    thread = threading.Thread(target=_run, args=(registry, interval), name='metrics-push', daemon=True)
+    thread.start()
+    return thread
+
+
+def _push_at_exit(registry):
+    _stop.set()
+    try:
+        push(registry)
+    except Exception:
+        logger.warning("Could not push metrics to the shared cache", exc_info=True)
+
+
+def start(registry=REGISTRY, interval=None):
+    """Push ``registry`` in the background and serve the shared totals from its scrapes."""
+    interval = interval or getattr(settings, 'METRICS_PUSH_INTERVAL', 5)
+    registry.merge = merge
+
+    def after_fork():
+        # The child inherits the parent's values, which the parent pushes itself
+        for metric in registry.metrics():
+            if metric.additive:
+                metric.reset()
+        _start_thread(registry, interval)
+
+    os.register_at_fork(after_in_child=after_fork)
+    atexit.register(_push_at_exit, registry)
+    return _start_thread(registry, interval)
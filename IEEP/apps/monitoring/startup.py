@@ -0,0 +1,152 @@
+# monitoring/startup.py
+"""
+Cold-start measurement.
+
+``profile_startup`` boots the project in a fresh interpreter run with
+``-X importtime`` and times the phases a new worker goes through:
+
+- ``web``: ``django.setup()``, loading the middleware, importing the
+  URLconf, then the first and second request through the WSGI handler
+- ``worker``: ``django.setup()``, then loading the Celery app and
+  importing every app's task module
+
+The child reports its phase timings on stdout. The import log on stderr
+is parsed into per-module self and cumulative times.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+MARKER = '@@startup-profile@@'
+
+WEB_SCRIPT = r'''
+import json, sys, time
+from io import BytesIO
+start = time.perf_counter()
+phases = {}
+def mark(name):
+    global start
+    now = time.perf_counter()
+    phases[name] = (now - start) * 1000
+    start = now
+import django
+django.setup()
+mark('setup')
+from django.core.handlers.wsgi import WSGIHandler
+handler = WSGIHandler()
+mark('middleware')
+from django.urls import get_resolver
+get_resolver().url_patterns
+mark('urlconf')
+status = []
+def request():
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': URL, 'QUERY_STRING': '', 'SERVER_NAME': HOST,
+        'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+    response = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(response)
+    response.close()
+request()
+mark('first_request')
+request()
+mark('second_request')
+print(MARKER + json.dumps({'phases': phases, 'status': status[0]}))
+'''
+
+WORKER_SCRIPT = r'''
+import json, time
+start = time.perf_counter()
+phases = {}
+def mark(name):
+    global start
+    now = time.perf_counter()
+    phases[name] = (now - start) * 1000
+    start = now
+import django
+django.setup()
+mark('setup')
+from ieep.celery import app
+mark('celery_app')
+app.loader.import_default_modules()
+mark('task_modules')
+print(MARKER + json.dumps({'phases': phases, 'tasks': len([name for name in app.tasks if not name.startswith('celery.')])}))
+'''
+
+TARGETS = {'web': WEB_SCRIPT, 'worker': WORKER_SCRIPT}
+
+
+class StartupError(Exception):
+    pass
+
+
+def parse_importtime(lines):
+    """``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output."""
+    modules = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def by_package(modules):
+    """Total self import time per top-level package, in microseconds."""
+    totals = defaultdict(int)
+    for name, (self_us, _) in modules.items():
+        totals[name.split('.', 1)[0]] += self_us
+    return dict(totals)
+
+
+def run_once(target, url='/', host=None):
+    """Boot one fresh interpreter; returns ``(result, modules, wall_ms)``."""
+    host = host or next((name for name in settings.ALLOWED_HOSTS if name and '*' not in name), 'localhost')
+    script = f"MARKER = {MARKER!r}\nURL = {url!r}\nHOST = {host!r}\n" + TARGETS[target]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'ieep.settings')}
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=300,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    output = next((line for line in process.stdout.splitlines() if line.startswith(MARKER)), None)
+    if process.returncode or output is None:
+        errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+        raise StartupError('\n'.join(errors[-20:]) or f"exit status {process.returncode}")
+    return json.loads(output[len(MARKER):]), parse_importtime(process.stderr.splitlines()), wall_ms
+
+
+def profile_startup(target='web', url='/', host=None, repeat=3):
+    """
+    Boot ``repeat`` fresh interpreters and return the median phase timings,
+    the process wall time and the import times of the last run (the first
+    run may also be writing bytecode caches).
+    """
+    runs = [run_once(target, url, host) for _ in range(repeat)]
+    results = [result for result, _, _ in runs]
+    phases = {
+        name: round(statistics.median(result['phases'][name] for result in results), 1)
+        for name in results[0]['phases']
+    }
+    modules = runs[-1][1]
+    return {
+        'target': target,
+        'url': url if target == 'web' else None,
+        'status': results[-1].get('status'),
+        'repeat': repeat,
+        'phases_ms': phases,
+        'ready_ms': round(sum(elapsed for name, elapsed in phases.items() if name != 'second_request'), 1),
+        'process_wall_ms': round(statistics.median(wall_ms for _, _, wall_ms in runs), 1),
+        'import_total_ms': round(sum(self_us for self_us, _ in modules.values()) / 1000, 1),
+        'modules': modules,
+    }
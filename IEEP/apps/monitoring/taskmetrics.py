@@ -0,0 +1,74 @@
+# monitoring/taskmetrics.py
+"""
+Celery task durations.
+
+Workers are separate processes, so their timings cannot go in the
+registry the web process serves. Each finished task instead increments
+one counter per histogram bucket in the shared cache, and
+``instrumentation.celery_task_metrics`` reads them back at scrape time.
+
+The receivers are connected by ``ieep/celery.py``, so only processes that
+load the Celery app (workers, beat) pay for importing its signals.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+
+from .metrics import TASK_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+TASK_NAMES_KEY = 'monitoring:celery-tasks'
+TASK_BUCKET_KEY = 'monitoring:celery:{}:{}:{}'
+TASK_STATES = ('success', 'failure', 'retry')
+
+_task_starts = {}
+_known_tasks = set()
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def _remember_task(name):
+    """Add ``name`` to the shared list of tasks the collector reads."""
+    names = cache.get(TASK_NAMES_KEY) or []
+    if name not in names:
+        cache.set(TASK_NAMES_KEY, sorted(set(names) | {name}), timeout=None)
+        # A concurrent writer may have replaced the list; check again on the next run
+        names = cache.get(TASK_NAMES_KEY) or []
+    if name in names:
+        _known_tasks.add(name)
+
+
+def task_started(sender=None, task_id=None, **kwargs):
+    _task_starts[task_id] = time.perf_counter()
+
+
+def task_finished(sender=None, task_id=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is None or sender is None:
+        return
+    elapsed = time.perf_counter() - start
+    name, state = sender.name, (state or 'success').lower()
+    if state not in TASK_STATES:
+        return
+    index = next(index for index, bound in enumerate(TASK_BUCKETS + (float('inf'),)) if elapsed <= bound)
+    try:
+        _incr(TASK_BUCKET_KEY.format(name, state, index))
+        _incr(TASK_BUCKET_KEY.format(name, state, 'sum'), round(elapsed * 1000))
+        if name not in _known_tasks:
+            _remember_task(name)
+    except Exception:
+        logger.warning("Could not record metrics for task %s", name, exc_info=True)
+
+
+def connect_task_signals():
+    from celery.signals import task_postrun, task_prerun
+    task_prerun.connect(task_started, dispatch_uid='metrics-task-prerun')
+    task_postrun.connect(task_finished, dispatch_uid='metrics-task-postrun')
@@ -0,0 +1,20 @@
+# monitoring/tasks.py
+from datetime import timedelta
+from pathlib import Path
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RequestProfile
+
+
+@shared_task
+def prune_request_profiles():
+    """Delete request profiles, and their files, older than REQUEST_PROFILE_RETENTION_DAYS."""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'REQUEST_PROFILE_RETENTION_DAYS', 14))
+    expired = RequestProfile.objects.filter(created_at__lt=cutoff)
+    for file_path in expired.values_list('file_path', flat=True).iterator():
+        Path(file_path).unlink(missing_ok=True)
+    deleted, _ = expired.delete()
+    return deleted
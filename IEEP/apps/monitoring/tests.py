@@ -0,0 +1,294 @@
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+
+from apps.inventory.api import WarehouseViewSet
+from apps.inventory.models import Warehouse
+from apps.users.models import User
+from . import sharedmetrics
+from .benchmarks import CASES, run_case
+from .loadtest import summarize
+from .metrics import CONTENT_TYPE, REQUEST_QUERIES, Registry
+from .models import RequestProfile
+from .profiler import QueryProfilerMiddleware, query_stats
+from .sampling import profile_trigger
+from .startup import profile_startup
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def process_registry():
+    """A registry shaped like the one each process builds at import time."""
+    registry = Registry()
+    registry.counter('test_stock_total', "Stock transactions", labels=('type',))
+    registry.histogram('test_latency_seconds', "Latency", labels=('view',), buckets=(0.1, 1))
+    registry.gauge('test_start_time_seconds', "Start time")
+    return registry
+
+
+class StartupProfileTests(SimpleTestCase):
+    def test_first_request_is_served_by_a_view(self):
+        # The login page needs no session, so it renders even on a cold, empty process
+        report = profile_startup('web', url='/login/', repeat=1)
+        self.assertEqual(report['status'], '200 OK')
+        self.assertEqual(list(report['phases_ms']), ['setup', 'middleware', 'urlconf', 'first_request', 'second_request'])
+        self.assertIn('apps.inventory.views', report['modules'])
+        self.assertNotIn('reportlab', {name.split('.')[0] for name in report['modules']})
+
+
+class LoadTestSummaryTests(SimpleTestCase):
+    def test_keeps_the_first_message_of_each_failure_kind(self):
+        records = [
+            ('stock_list', 'ok', 0.010, 0.0, None),
+            ('stock_list', 'error', 0.002, 0.0, 'NoReverseMatch: first'),
+            ('stock_list', 'error', 0.002, 0.0, 'NoReverseMatch: second'),
+            ('stock_transaction', 'deadlock', 0.050, 0.040, 'OperationalError: deadlock found'),
+        ]
+        summary = summarize(records, elapsed=1.0)
+        self.assertEqual(summary['stock_list']['first_messages'], {'error': 'NoReverseMatch: first'})
+        self.assertEqual((summary['stock_list']['ok'], summary['stock_list']['errors']), (1, 2))
+        self.assertEqual(summary['stock_transaction']['deadlocks'], 1)
+        self.assertEqual(summary['stock_transaction']['lock_wait_total_ms'], 40.0)
+
+
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class AsgiProfilingTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(REQUEST_PROFILE_ROOT=root, REQUEST_PROFILER_INTERVAL=0.001)
+        override.enable()
+        self.addCleanup(override.disable)
+        Warehouse.objects.create(code='W1', name='Main', location='Addis')
+        self.async_client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        REQUEST_QUERIES.reset()
+
+    async def test_sync_view_is_sampled_and_its_queries_counted(self, enqueue):
+        list_warehouses = WarehouseViewSet.list
+
+        def slow_list(viewset, request, *args, **kwargs):
+            time.sleep(0.05)
+            return list_warehouses(viewset, request, *args, **kwargs)
+
+        with mock.patch.object(WarehouseViewSet, 'list', slow_list):
+            response = await self.async_client.get('/api/v1/warehouses/', headers={'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+
+        profile = await RequestProfile.objects.aget(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.trigger, 'header')
+        self.assertGreater(profile.sample_count, 0)
+        self.assertIn('slow_list', Path(profile.file_path).read_text())
+
+        counts = [value for suffix, _, value in REQUEST_QUERIES.samples() if suffix == '_sum']
+        self.assertEqual(len(counts), 1)
+        self.assertGreater(counts[0], 0)
+
+
+class MetricsRenderTests(SimpleTestCase):
+    def test_counter_and_histogram_exposition(self):
+        registry = process_registry()
+        counter, histogram, gauge = registry.metrics()
+        counter.inc(type='receipt')
+        counter.inc(2, type='issue "manual"')
+        histogram.observe(0.05, view='stock')
+        histogram.observe(0.5, view='stock')
+        histogram.observe(3, view='stock')
+        gauge.set(1700000000.0)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_stock_total counter', lines)
+        self.assertIn('test_stock_total{type="issue \\"manual\\""} 2', lines)
+        self.assertIn('test_stock_total{type="receipt"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{view="stock",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{view="stock",le="1"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{view="stock",le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_sum{view="stock"} 3.55', lines)
+        self.assertIn('test_latency_seconds_count{view="stock"} 3', lines)
+        self.assertIn('test_start_time_seconds 1700000000', lines)
+
+    def test_labels_must_match(self):
+        counter = process_registry().metrics()[0]
+        with self.assertRaises(ValueError):
+            counter.inc(kind='receipt')
+        with self.assertRaises(ValueError):
+            counter.inc(-1, type='receipt')
+
+    def test_changes_are_reported_once(self):
+        counter, histogram, _ = process_registry().metrics()
+        counter.inc(3, type='receipt')
+        histogram.observe(0.5, view='stock')
+        self.assertEqual(counter.changes(), {('receipt',): 3})
+        self.assertEqual(histogram.changes(), {('stock',): [0, 1, 0, 0.5]})
+        counter.inc(type='receipt')
+        self.assertEqual(counter.changes(), {('receipt',): 1})
+        self.assertEqual(histogram.changes(), {})
+
+
+@override_settings(CACHES=LOCMEM)
+class SharedMetricsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        sharedmetrics._known_series.clear()
+
+    def test_scrape_reports_the_totals_of_every_process(self):
+        web, worker = process_registry(), process_registry()
+        web.merge = worker.merge = sharedmetrics.merge
+        web_counter, web_histogram, web_gauge = web.metrics()
+        worker_counter, worker_histogram, worker_gauge = worker.metrics()
+        web_counter.inc(2, type='receipt')
+        web_histogram.observe(0.05, view='stock')
+        web_gauge.set(100)
+        worker_counter.inc(type='receipt')
+        worker_counter.inc(type='issue')
+        worker_histogram.observe(0.5, view='stock')
+        worker_gauge.set(200)
+        sharedmetrics.push(worker)
+
+        lines = web.render().splitlines()
+        self.assertIn('test_stock_total{type="receipt"} 3', lines)
+        self.assertIn('test_stock_total{type="issue"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{view="stock",le="1"} 2', lines)
+        self.assertIn('test_latency_seconds_sum{view="stock"} 0.55', lines)
+        # Gauges describe the process that answered
+        self.assertIn('test_start_time_seconds 100', lines)
+
+        # Pushing again adds only what changed since
+        web_counter.inc(type='receipt')
+        sharedmetrics.push(web)
+        self.assertIn('test_stock_total{type="receipt"} 4', worker.render().splitlines())
+
+    def test_scrape_falls_back_to_this_process_when_the_cache_fails(self):
+        registry = process_registry()
+        registry.merge = sharedmetrics.merge
+        registry.metrics()[0].inc(type='receipt')
+        with mock.patch.object(sharedmetrics, '_incr', side_effect=ConnectionError):
+            with self.assertLogs('apps.monitoring.metrics', 'WARNING'):
+                lines = registry.render().splitlines()
+        self.assertIn('test_stock_total{type="receipt"} 1', lines)
+
+
+@override_settings(CACHES=LOCMEM)
+class MetricsViewTests(TestCase):
+    def test_staff_can_scrape(self):
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        response = self.client.get('/api/monitoring/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+        self.assertIn('# TYPE ieep_http_request_duration_seconds histogram', response.content.decode())
+
+    def test_other_users_are_sent_to_the_login_page(self):
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        response = self.client.get('/api/monitoring/metrics/')
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('ieep_', response.content.decode())
+
+
+@override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_N_PLUS_ONE_THRESHOLD=3)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class QueryProfilerTests(TestCase):
+    def setUp(self):
+        self.warehouses = [
+            Warehouse.objects.create(code=f'W{number}', name=f'Store {number}', location='Addis')
+            for number in range(4)
+        ]
+        query_stats.reset()
+        self.addCleanup(query_stats.reset)
+
+    def get(self, view):
+        request = RequestFactory().get('/api/inventory/warehouses/')
+        request.resolver_match = resolve('/api/inventory/warehouses/')
+        return QueryProfilerMiddleware(view)(request)
+
+    def one_query_per_row(self, request):
+        for warehouse in self.warehouses:
+            Warehouse.objects.get(pk=warehouse.pk)
+        return HttpResponse('ok')
+
+    def one_query(self, request):
+        list(Warehouse.objects.all())
+        return HttpResponse('ok')
+
+    def test_repeated_query_shape_is_reported_as_n_plus_one(self, enqueue):
+        with self.assertLogs('apps.monitoring.profiler', 'WARNING') as logs:
+            response = self.get(self.one_query_per_row)
+        self.assertEqual(response['X-DB-Queries'], '4')
+        self.assertEqual(response['X-DB-Duplicate-Queries'], '3')
+        self.assertRegex(response['X-DB-N-Plus-One'], r'^4x apps/monitoring/tests\.py:\d+$')
+        self.assertIn('Possible N+1 in warehouse-list', logs.output[0])
+        self.assertIn('db;desc="4 queries"', response['Server-Timing'])
+
+    def test_distinct_queries_are_not_reported(self, enqueue):
+        response = self.get(self.one_query)
+        self.assertEqual(response['X-DB-Queries'], '1')
+        self.assertEqual(response['X-DB-Duplicate-Queries'], '0')
+        self.assertNotIn('X-DB-N-Plus-One', response)
+
+    def test_per_view_stats(self, enqueue):
+        with self.assertLogs('apps.monitoring.profiler', 'WARNING'):
+            self.get(self.one_query_per_row)
+        self.get(self.one_query)
+        self.get(self.one_query)
+
+        [stats] = query_stats.summary()
+        self.assertEqual(stats['view'], 'warehouse-list')
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual((stats['queries_avg'], stats['queries_max']), (2.0, 4))
+        self.assertLessEqual(stats['latency_p50_ms'], stats['latency_p95_ms'])
+        [issue] = stats['n_plus_one']
+        self.assertEqual((issue['file'], issue['requests']), ('apps/monitoring/tests.py', 1))
+
+    def test_stats_view_is_staff_only(self, enqueue):
+        self.get(self.one_query)
+        self.client.force_login(User.objects.create_user('clerk', password='x'))
+        self.assertEqual(self.client.get('/api/monitoring/queries/').status_code, 302)
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        views = self.client.get('/api/monitoring/queries/').json()['views']
+        self.assertIn('warehouse-list', [row['view'] for row in views])
+
+
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class ProfileTriggerTests(TestCase):
+    def request(self, user, path='/inventory/', **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = user
+        return request
+
+    def test_only_staff_can_ask_for_a_profile(self, enqueue):
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        clerk = User.objects.create_user('clerk', password='x')
+        self.assertEqual(profile_trigger(self.request(staff, HTTP_X_PROFILE='1'), 0), 'header')
+        self.assertEqual(profile_trigger(self.request(staff, path='/inventory/?_profile=1'), 0), 'query')
+        self.assertIsNone(profile_trigger(self.request(staff), 0))
+        self.assertIsNone(profile_trigger(self.request(clerk, HTTP_X_PROFILE='1'), 0))
+        self.assertIsNone(profile_trigger(self.request(clerk, path='/inventory/?_profile=1'), 0))
+        self.assertIsNone(profile_trigger(self.request(AnonymousUser(), HTTP_X_PROFILE='1'), 0))
+
+    def test_sampling_applies_to_everyone(self, enqueue):
+        clerk = User.objects.create_user('clerk', password='x')
+        with mock.patch('apps.monitoring.sampling.random.random', return_value=0.05):
+            self.assertEqual(profile_trigger(self.request(clerk), 0.1), 'sampled')
+            self.assertIsNone(profile_trigger(self.request(clerk), 0.01))
+
+
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class SaveBenchmarkTests(TestCase):
+    def test_save_cases_time_the_saves_and_restore_the_row(self, enqueue):
+        warehouse = Warehouse.objects.create(code='W1', name='Main', location='Addis')
+        cases = {case.name: case for case in CASES}
+        for name in ('warehouse_save', 'warehouse_save_unaudited'):
+            with self.subTest(name):
+                result = run_case(None, cases[name], repeat=1)
+                self.assertEqual(result['status'], 'ok', result.get('error'))
+                # One read, one UPDATE per save and the restore
+                self.assertEqual(result['queries'], cases[name].calls + 2)
+                self.assertGreater(result['per_call_us'], 0)
+        warehouse.refresh_from_db()
+        self.assertEqual(warehouse.location, 'Addis')
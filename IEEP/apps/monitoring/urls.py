@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('queries/', views.QueryStatsView.as_view(), name='query-stats'),
+    path('profiles/<int:pk>/download/', views.RequestProfileDownloadView.as_view(), name='request-profile-download'),
+]
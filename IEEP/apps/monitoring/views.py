@@ -0,0 +1,51 @@
+# monitoring/views.py
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from .metrics import CONTENT_TYPE, REGISTRY
+from .models import RequestProfile
+from .profiler import query_stats
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class QueryStatsView(View):
+    """Per-view query and latency aggregates from the query profiler (this process only)."""
+
+    def get(self, request):
+        return JsonResponse({
+            'enabled': getattr(settings, 'QUERY_PROFILER_ENABLED', False),
+            'pid': os.getpid(),
+            'views': query_stats.summary(),
+        })
+
+    def delete(self, request):
+        query_stats.reset()
+        return JsonResponse({'success': True})
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class MetricsView(View):
+    """Scrape endpoint: the metrics registry in the Prometheus text format, totalled across processes."""
+
+    def get(self, request):
+        return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class RequestProfileDownloadView(View):
+    def get(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        path = Path(profile.file_path)
+        if not path.exists():
+            raise Http404("Profile file is missing")
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True,
+            filename=f"profile-{profile.pk}.collapsed.txt", content_type='text/plain',
+        )
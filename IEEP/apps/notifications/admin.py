@@ -0,0 +1,19 @@
+from django.contrib import admin
+from .models import Notification, InboxEntry, UnreadCounter
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['title', 'kind', 'created_by', 'created_at']
+    list_filter = ['kind']
+    search_fields = ['title', 'message']
+
+@admin.register(InboxEntry)
+class InboxEntryAdmin(admin.ModelAdmin):
+    list_display = ['notification', 'user', 'is_read', 'created_at']
+    list_filter = ['is_read']
+    raw_id_fields = ['notification', 'user']
+
+@admin.register(UnreadCounter)
+class UnreadCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'unread']
+    readonly_fields = ['user', 'unread']
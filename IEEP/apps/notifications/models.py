@@ -0,0 +1,52 @@
+# notifications/models.py
+from django.db import models
+from django.conf import settings
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('info', 'Information'),
+        ('low_stock', 'Low Stock'),
+        ('reorder', 'Reorder'),
+        ('order', 'Order'),
+        ('system', 'System'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='info')
+    title = models.CharField(max_length=200)
+    message = models.TextField(blank=True)
+    url = models.CharField(max_length=500, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+class InboxEntry(models.Model):
+    """A notification delivered to one user; written once per recipient at send time."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inbox')
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['notification', 'user']
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.notification} -> {self.user}"
+
+class UnreadCounter(models.Model):
+    """Denormalized unread count per user, kept in step with InboxEntry by services.py."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread}"
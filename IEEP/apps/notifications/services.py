@@ -0,0 +1,115 @@
+# notifications/services.py
+"""
+Notification delivery and unread badges.
+
+``notify`` fans a notification out on write: one InboxEntry per recipient
+and an atomic ``unread + 1`` on each recipient's UnreadCounter, in one
+transaction, so reading a badge never counts inbox rows. Each user also
+has a change sequence in the shared cache, bumped after commit whenever
+their unread count changes. The count is cached together with the
+sequence it was read at, so a badge read is one cache round trip and a
+long-poll waits on the sequence without touching the database.
+
+``aget_badge`` and ``await_badge`` are the async counterparts served to
+the browser; a waiting long-poll is parked on the process-wide cache
+watcher (see apps/polling.py) instead of sleeping in a thread.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from apps.polling import LONG_POLL_TIMEOUT, watcher
+from .models import InboxEntry, Notification, UnreadCounter
+
+SEQUENCE_KEY = 'notifications:seq:{}'
+BADGE_KEY = 'notifications:badge:{}'
+BADGE_TTL = 3600
+
+
+def _bump_sequences(user_ids):
+    for user_id in user_ids:
+        key = SEQUENCE_KEY.format(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Seed from the clock so a flushed cache never reissues an old sequence
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_badge(user_id):
+    """Return ``{'seq': ..., 'count': ...}`` for a user's unread badge."""
+    sequence_key, badge_key = SEQUENCE_KEY.format(user_id), BADGE_KEY.format(user_id)
+    cached = cache.get_many([sequence_key, badge_key])
+    sequence = cached.get(sequence_key)
+    if sequence is None:
+        cache.add(sequence_key, time.time_ns(), timeout=None)
+        sequence = cache.get(sequence_key)
+    badge = cached.get(badge_key)
+    if badge is None or badge['seq'] != sequence:
+        count = UnreadCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+        badge = {'seq': sequence, 'count': count or 0}
+        cache.set(badge_key, badge, BADGE_TTL)
+    return badge
+
+
+async def aget_badge(user_id):
+    """Async ``get_badge``."""
+    sequence_key, badge_key = SEQUENCE_KEY.format(user_id), BADGE_KEY.format(user_id)
+    cached = await cache.aget_many([sequence_key, badge_key])
+    sequence = cached.get(sequence_key)
+    if sequence is None:
+        await cache.aadd(sequence_key, time.time_ns(), timeout=None)
+        sequence = await cache.aget(sequence_key)
+    badge = cached.get(badge_key)
+    if badge is None or badge['seq'] != sequence:
+        count = await UnreadCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).afirst()
+        badge = {'seq': sequence, 'count': count or 0}
+        await cache.aset(badge_key, badge, BADGE_TTL)
+    return badge
+
+
+async def await_badge(user_id, since, timeout=LONG_POLL_TIMEOUT):
+    """Return the badge once its sequence differs from ``since``, or after ``timeout`` seconds."""
+    badge = await aget_badge(user_id)
+    if str(badge['seq']) == str(since) and await watcher.wait(SEQUENCE_KEY.format(user_id), since, timeout):
+        badge = await aget_badge(user_id)
+    return badge
+
+
+def notify(users, title, message='', kind='info', url='', created_by=None):
+    """Deliver a notification to each of ``users`` (users or user ids)."""
+    user_ids = sorted({getattr(user, 'pk', user) for user in users})
+    if not user_ids:
+        return None
+    with transaction.atomic():
+        notification = Notification.objects.create(
+            kind=kind, title=title, message=message, url=url, created_by=created_by
+        )
+        InboxEntry.objects.bulk_create(
+            [InboxEntry(notification=notification, user_id=user_id) for user_id in user_ids]
+        )
+        UnreadCounter.objects.bulk_create(
+            [UnreadCounter(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        UnreadCounter.objects.filter(user_id__in=user_ids).update(unread=F('unread') + 1)
+        transaction.on_commit(lambda: _bump_sequences(user_ids))
+    return notification
+
+
+def mark_read(user_id, entry_ids=None):
+    """Mark a user's entries (all unread ones when ``entry_ids`` is None) as read; returns the count."""
+    with transaction.atomic():
+        entries = InboxEntry.objects.filter(user_id=user_id, is_read=False)
+        if entry_ids is not None:
+            entries = entries.filter(pk__in=entry_ids)
+        changed = entries.update(is_read=True, read_at=timezone.now())
+        if changed:
+            # Subtracting in SQL could underflow the unsigned column, so clamp with a CASE
+            UnreadCounter.objects.filter(user_id=user_id).update(
+                unread=Case(When(unread__gt=changed, then=F('unread') - changed), default=Value(0))
+            )
+            transaction.on_commit(lambda: _bump_sequences([user_id]))
+    return changed
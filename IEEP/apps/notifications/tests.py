@@ -0,0 +1,109 @@
+import asyncio
+import functools
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, TestCase, override_settings
+
+from apps.polling import watcher
+from apps.users.models import User
+from . import views
+from .models import InboxEntry, UnreadCounter
+from .services import await_badge, get_badge, mark_read, notify
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def unread(user):
+    return UnreadCounter.objects.get(user=user).unread
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class NotifyTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def test_notify_delivers_once_per_recipient(self, enqueue):
+        notification = notify([self.alice, self.bob, self.alice.pk], 'Low stock', kind='low_stock')
+        self.assertEqual(notification.deliveries.count(), 2)
+        notify([self.alice], 'Reorder placed', kind='reorder')
+        self.assertEqual((unread(self.alice), unread(self.bob)), (2, 1))
+        self.assertIsNone(notify([], 'Nobody'))
+
+    def test_mark_read_keeps_the_counter_in_step(self, enqueue):
+        for title in ('One', 'Two', 'Three'):
+            notify([self.alice, self.bob], title)
+        first = InboxEntry.objects.filter(user=self.alice).last()
+
+        self.assertEqual(mark_read(self.alice.pk, [first.pk]), 1)
+        self.assertEqual(unread(self.alice), 2)
+        # Reading an entry twice must not count it twice
+        self.assertEqual(mark_read(self.alice.pk, [first.pk]), 0)
+        self.assertEqual(unread(self.alice), 2)
+        # Another user's entry is not this user's to read
+        other = InboxEntry.objects.filter(user=self.bob).first()
+        self.assertEqual(mark_read(self.alice.pk, [other.pk]), 0)
+
+        self.assertEqual(mark_read(self.alice.pk), 2)
+        self.assertEqual(unread(self.alice), 0)
+        self.assertEqual(mark_read(self.alice.pk), 0)
+        self.assertEqual(unread(self.alice), 0)
+        self.assertEqual(unread(self.bob), 3)
+
+    def test_badge_is_cached_until_the_count_changes(self, enqueue):
+        badge = get_badge(self.alice.pk)
+        self.assertEqual(badge['count'], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_badge(self.alice.pk), badge)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.alice], 'Low stock')
+        changed = get_badge(self.alice.pk)
+        self.assertEqual(changed['count'], 1)
+        self.assertNotEqual(changed['seq'], badge['seq'])
+
+        entry = InboxEntry.objects.get(user=self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_read(self.alice.pk, [entry.pk])
+        self.assertEqual(get_badge(self.alice.pk)['count'], 0)
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class UnreadCountLongPollTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.async_client.force_login(self.alice)
+        interval = mock.patch.object(watcher, 'interval', 0.01)
+        interval.start()
+        self.addCleanup(interval.stop)
+
+    def notify_and_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.alice], 'Low stock')
+
+    async def test_returns_when_a_notification_arrives(self, enqueue):
+        badge = (await self.async_client.get('/api/notifications/unread-count/')).json()
+        self.assertEqual(badge['count'], 0)
+
+        poll = asyncio.ensure_future(
+            self.async_client.get('/api/notifications/unread-count/', {'since': badge['seq']}))
+        await asyncio.sleep(0.05)
+        self.assertFalse(poll.done())
+        await sync_to_async(self.notify_and_commit)()
+
+        response = await asyncio.wait_for(poll, timeout=5)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertNotEqual(response.json()['seq'], badge['seq'])
+
+    async def test_returns_the_same_badge_on_timeout(self, enqueue):
+        badge = (await self.async_client.get('/api/notifications/unread-count/')).json()
+        with mock.patch.object(views, 'await_badge', functools.partial(await_badge, timeout=0.05)):
+            response = await self.async_client.get('/api/notifications/unread-count/', {'since': badge['seq']})
+        self.assertEqual(response.json(), badge)
+
+    async def test_anonymous_requests_get_a_401(self, enqueue):
+        response = await AsyncClient().get('/api/notifications/unread-count/')
+        self.assertEqual(response.status_code, 401)
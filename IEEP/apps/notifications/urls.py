@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.NotificationListView.as_view(), name='notification-list'),
+    path('unread-count/', views.UnreadCountView.as_view(), name='unread-count'),
+    path('<int:pk>/read/', views.MarkReadView.as_view(), name='notification-read'),
+    path('read-all/', views.MarkAllReadView.as_view(), name='notification-read-all'),
+]
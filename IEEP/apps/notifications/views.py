@@ -0,0 +1,47 @@
+# notifications/views.py
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.generic import ListView
+
+from apps.polling import AsyncJsonView
+from .models import InboxEntry
+from .services import aget_badge, await_badge, get_badge, mark_read
+
+@method_decorator(login_required, name='dispatch')
+class NotificationListView(ListView):
+    template_name = 'notifications/notification_list.html'
+    context_object_name = 'entries'
+    paginate_by = 20
+
+    def get_queryset(self):
+        return InboxEntry.objects.filter(user=self.request.user).select_related('notification')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['unread_count'] = get_badge(self.request.user.pk)['count']
+        return context
+
+class UnreadCountView(AsyncJsonView):
+    """
+    Unread badge for the current user. With ``?since=<seq>`` the request is
+    held until the badge changes (or the long-poll timeout passes).
+    """
+    async def get(self, request):
+        since = request.GET.get('since')
+        badge = await await_badge(request.user_id, since) if since else await aget_badge(request.user_id)
+        return JsonResponse({'count': badge['count'], 'seq': str(badge['seq'])})
+
+@method_decorator(login_required, name='dispatch')
+class MarkReadView(View):
+    def post(self, request, pk):
+        mark_read(request.user.pk, [pk])
+        return redirect('notification-list')
+
+@method_decorator(login_required, name='dispatch')
+class MarkAllReadView(View):
+    def post(self, request):
+        mark_read(request.user.pk)
+        return redirect('notification-list')
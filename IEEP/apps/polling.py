@@ -0,0 +1,107 @@
+# apps/polling.py
+"""
+Async JSON endpoints for browser polling.
+
+Under ASGI an ``AsyncJsonView`` request that waits holds a coroutine, not
+a worker thread. Django's auth decorators and lazy ``request.user`` are
+sync-only in this version, so the view resolves the user itself, once,
+before it starts waiting.
+
+``CacheWatcher`` serves long-polls on cache counters (notification
+sequences, data versions). Every waiter in the process shares one loop
+that reads all watched keys with a single ``get_many`` per interval, so a
+thousand idle pollers cost one cache round trip a second, not a thousand.
+"""
+import asyncio
+import contextvars
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views import View
+
+logger = logging.getLogger(__name__)
+
+LONG_POLL_TIMEOUT = 25
+POLL_INTERVAL = 1
+
+
+def current_user(request):
+    """
+    The authenticated, active user, or None. Sessions go through
+    ``get_user``, so a session invalidated by a password change is
+    rejected as it would be by ``login_required``.
+    """
+    auth = getattr(request, 'auth', None)
+    user = auth.user if auth is not None else get_user(request)
+    if not user.is_authenticated or not user.is_active:
+        return None
+    return user
+
+
+class AsyncJsonView(View):
+    """Async view that answers anonymous requests with a JSON 401 instead of a login redirect."""
+    login_required = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Loading the session and the user is blocking I/O
+        user = await sync_to_async(current_user)(request)
+        if self.login_required and user is None:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if user is not None:
+            request.user = user
+        request.user_id = user.pk if user is not None else None
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class CacheWatcher:
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        # Waiters and reader task per event loop: under WSGI each async view runs on its own loop
+        self._waiters = weakref.WeakKeyDictionary()
+        self._tasks = weakref.WeakKeyDictionary()
+
+    async def wait(self, key, since, timeout=LONG_POLL_TIMEOUT):
+        """Wait until the key's value differs from ``since``; False if ``timeout`` seconds pass first."""
+        loop = asyncio.get_running_loop()
+        waiters = self._waiters.setdefault(loop, {})
+        future = loop.create_future()
+        waiter = (str(since), future)
+        waiters.setdefault(key, []).append(waiter)
+        task = self._tasks.get(loop)
+        if task is None or task.done():
+            # A fresh context, so the reader does not keep the first request's context alive
+            self._tasks[loop] = contextvars.Context().run(loop.create_task, self._run(waiters))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            key_waiters = waiters.get(key, [])
+            if waiter in key_waiters:
+                key_waiters.remove(waiter)
+            if not key_waiters:
+                waiters.pop(key, None)
+
+    async def _run(self, waiters):
+        read = sync_to_async(cache.get_many, thread_sensitive=False)
+        while waiters:
+            await asyncio.sleep(self.interval)
+            keys = list(waiters)
+            try:
+                values = await read(keys)
+            except Exception:
+                logger.exception("Could not read %d watched cache keys", len(keys))
+                continue
+            for key in keys:
+                # A missing key (flushed cache) wakes its waiters too, so they re-read and re-seed it
+                value = str(values.get(key))
+                for since, future in waiters.get(key, ()):
+                    if value != since and not future.done():
+                        future.set_result(True)
+
+
+watcher = CacheWatcher()
@@ -0,0 +1,67 @@
+# products/api.py
+from apps.api import ValuesReadOnlyViewSet
+from .models import BOM, BOMComponent, Product
+
+
+class ProductViewSet(ValuesReadOnlyViewSet):
+    queryset = Product.objects.all()
+    filterset_fields = ['product_type', 'category', 'is_active']
+    api_fields = {
+        'id': 'id',
+        'sku': 'sku',
+        'name': 'name',
+        'product_type': 'product_type',
+        'category_id': 'category_id',
+        'category': 'category__name',
+        'unit': 'unit_of_measure__symbol',
+        'cost_price': 'cost_price',
+        'selling_price': 'selling_price',
+        'reorder_threshold': 'reorder_threshold',
+        'product_code': 'product_code',
+        'description': 'description',
+        'specifications': 'specifications',
+        'is_active': 'is_active',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    default_fields = ('id', 'sku', 'name', 'product_type', 'category', 'unit', 'cost_price', 'selling_price', 'is_active')
+
+
+class BOMViewSet(ValuesReadOnlyViewSet):
+    queryset = BOM.objects.all()
+    filterset_fields = ['product', 'is_active', 'is_draft']
+    api_fields = {
+        'id': 'id',
+        'bom_code': 'bom_code',
+        'product_id': 'product_id',
+        'product_sku': 'product__sku',
+        'product_name': 'product__name',
+        'version': 'version',
+        'description': 'description',
+        'effective_date': 'effective_date',
+        'is_active': 'is_active',
+        'is_draft': 'is_draft',
+        'labor_cost': 'labor_cost',
+        'overhead_cost': 'overhead_cost',
+        'expected_yield_percentage': 'expected_yield_percentage',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+        # Filled by add_related with one query for the whole page
+        'components': 'id',
+    }
+    default_fields = ('id', 'bom_code', 'product_id', 'product_sku', 'version', 'is_active', 'is_draft')
+
+    def add_related(self, data, rows, names):
+        if 'components' not in names:
+            return
+        by_bom = {item['components']: [] for item in data}
+        components = BOMComponent.objects.filter(bom_id__in=list(by_bom)).order_by('bom_id', 'id').values_list(
+            'bom_id', 'component_id', 'component__sku', 'quantity', 'unit_cost', 'waste_percentage',
+        )
+        for bom_id, component_id, sku, quantity, unit_cost, waste in components:
+            by_bom[bom_id].append({
+                'component_id': component_id, 'sku': sku, 'quantity': str(quantity),
+                'unit_cost': str(unit_cost), 'waste_percentage': str(waste),
+            })
+        for item in data:
+            item['components'] = by_bom[item['components']]
@@ -1,7 +1,8 @@
 from django.db import models
 from django.conf import settings
+from apps.users.capture import AuditedModel
 
-class Category(models.Model):
+class Category(AuditedModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subcategories')
@@ -39,7 +40,7 @@ class UnitOfMeasure(models.Model):
     def __str__(self):
         return f"{self.name} ({self.symbol})"
 
-class Product(models.Model):
+class Product(AuditedModel):
     PRODUCT_TYPES = (
         ('finished', 'Finished Good'),
         ('raw', 'Raw Material'),
@@ -80,7 +81,7 @@ class Product(models.Model):
             return ((self.selling_price - self.cost_price) / self.cost_price) * 100
         return 0
 
-class BOM(models.Model):
+class BOM(AuditedModel):
     BOM_STATUS = (
         ('draft', 'Draft'),
         ('active', 'Active'),
@@ -118,7 +119,7 @@ class BOM(models.Model):
         return self.total_material_cost + self.labor_cost + self.overhead_cost
 
         
-class BOMComponent(models.Model):
+class BOMComponent(AuditedModel):
     bom = models.ForeignKey(BOM, on_delete=models.CASCADE, related_name='components')
     component = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='used_in_boms')
     quantity = models.DecimalField(max_digits=10, decimal_places=4)
@@ -131,6 +132,9 @@ class BOMComponent(models.Model):
     
     def __str__(self):
         return f"{self.component.sku} in {self.bom.bom_code}"
+
+    def audit_repr(self):
+        return f"Component {self.component_id} in BOM {self.bom_id}"
     
     @property
     def total_cost(self):
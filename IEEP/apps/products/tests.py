@@ -1,3 +1,77 @@
-from django.test import TestCase
+import gzip
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from apps.users.models import User
+from .models import Category, Product, UnitOfMeasure
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class ProductApiTests(TestCase):
+    def setUp(self):
+        uom = UnitOfMeasure.objects.create(name='Litre', symbol='L')
+        category = Category.objects.create(name='Paints')
+        self.products = [
+            Product.objects.create(
+                sku=f'P-{index}', name=f'Paint {index}', product_type='finished', category=category,
+                unit_of_measure=uom, cost_price='12.50', selling_price=20,
+            )
+            for index in range(5)
+        ]
+        self.client.force_login(User.objects.create_user('buyer', password='x'))
+
+    def get(self, path='/api/v1/products/', **params):
+        response = self.client.get(path, params)
+        return response, response.json() if response['Content-Type'] == 'application/json' else None
+
+    def test_default_and_requested_fields(self, enqueue):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(body['results'][0]), [
+            'id', 'sku', 'name', 'product_type', 'category', 'unit', 'cost_price', 'selling_price', 'is_active',
+        ])
+        _, body = self.get(fields='sku, unit,category,sku')
+        self.assertEqual(body['results'][0], {'sku': 'P-0', 'unit': 'L', 'category': 'Paints'})
+
+    def test_unknown_fields_are_rejected(self, enqueue):
+        response, body = self.get(fields='sku,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: password', body['fields'])
+
+    def test_decimals_and_datetimes_are_encoded_as_strings(self, enqueue):
+        _, body = self.get(fields='cost_price,selling_price,created_at')
+        row = body['results'][0]
+        self.assertEqual((row['cost_price'], row['selling_price']), ('12.50', '20.00'))
+        self.assertTrue(row['created_at'].endswith('Z'))
+
+    def test_cursor_pages_cover_every_row_once(self, enqueue):
+        seen = []
+        response, body = self.get(page_size=2, fields='id')
+        seen += [row['id'] for row in body['results']]
+        # A row added while paging shows up on a later page, without shifting the others
+        late = Product.objects.create(
+            sku='P-late', name='Late', product_type='raw', unit_of_measure=self.products[0].unit_of_measure,
+        )
+        while body['next']:
+            body = self.client.get(body['next']).json()
+            seen += [row['id'] for row in body['results']]
+        self.assertEqual(seen, [product.pk for product in self.products] + [late.pk])
+
+    def test_large_responses_are_gzipped(self, enqueue):
+        response = self.client.get('/api/v1/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 5)
+        small = self.client.get('/api/v1/products/', {'fields': 'id', 'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    def test_retrieve(self, enqueue):
+        product = self.products[0]
+        response, body = self.get(f'/api/v1/products/{product.pk}/', fields='sku,unit')
+        self.assertEqual(body, {'sku': 'P-0', 'unit': 'L'})
+        self.assertEqual(self.get('/api/v1/products/999999/')[0].status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/products/abc/').status_code, 404)
@@ -49,7 +49,7 @@ class ProductDetailView(DetailView):
         product = self.get_object()
         
         try:
-            from inventory.models import StockItem
+            from apps.inventory.models import StockItem
             stock_items = StockItem.objects.filter(product=product)
             context['total_stock'] = sum(item.quantity for item in stock_items)
             context['warehouse_count'] = stock_items.values('warehouse').distinct().count()
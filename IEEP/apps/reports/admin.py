@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ReportTemplate, GeneratedReport
+from .models import ReportTemplate, GeneratedReport, MetricSnapshot
 
 @admin.register(ReportTemplate)
 class ReportTemplateAdmin(admin.ModelAdmin):
@@ -9,6 +9,11 @@ class ReportTemplateAdmin(admin.ModelAdmin):
 
 @admin.register(GeneratedReport)
 class GeneratedReportAdmin(admin.ModelAdmin):
-    list_display = ['report_template', 'generated_by', 'status', 'generated_at']
+    list_display = ['report_template', 'generated_by', 'status', 'file_size', 'generated_at']
     list_filter = ['status']
-    readonly_fields = ['generated_at', 'completed_at']
+    readonly_fields = ['generated_at', 'completed_at', 'cache_key', 'data_version']
+
+@admin.register(MetricSnapshot)
+class MetricSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'updated_at']
+    readonly_fields = ['date', 'metrics', 'created_at', 'updated_at']
@@ -0,0 +1,221 @@
+# reports/cache.py
+"""
+Result cache for generated reports.
+
+A generated file is identified by its template, the normalised request
+parameters and a data-version stamp of the tables the report reads.
+Versions live in the shared cache and are bumped after commit whenever a
+tracked model is written (see signals.py), so the stamp only moves when
+the underlying data does. Identical concurrent requests coalesce on the
+unique ``GeneratedReport.cache_key``: one request renders, the others wait
+up to ``WAIT_TIMEOUT`` seconds for its file and then get ``ReportInProgress``
+so they can ask the client to retry instead of holding a worker.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.monitoring.metrics import REPORT_GENERATION, REPORT_SIZE
+from .models import GeneratedReport
+
+# Tables each report type reads; a write to any of them invalidates its results.
+REPORT_SOURCES = {
+    'low_stock': ['inventory.StockItem', 'inventory.Warehouse', 'products.Product', 'products.UnitOfMeasure'],
+    'inventory_status': ['inventory.StockItem', 'inventory.Warehouse', 'products.Product', 'products.UnitOfMeasure'],
+    'stock_ledger': ['inventory.StockTransaction', 'inventory.StockItem', 'inventory.Warehouse', 'products.Product'],
+}
+
+FILE_EXTENSIONS = {
+    'pdf': 'pdf',
+    'csv': 'csv',
+    'excel': 'xlsx',
+}
+
+DATA_VERSION_KEY = 'reports:data-version:{}'
+REPORTS_DIR = 'reports'
+# A generation still marked in progress after this long is treated as abandoned.
+GENERATION_TIMEOUT = 600
+# How long a request waits for another request's render of the same report
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.5
+
+
+class ReportInProgress(Exception):
+    """Another request is still rendering the report."""
+
+    def __init__(self, report):
+        super().__init__(f"Report {report.pk} is still being generated")
+        self.report = report
+
+
+def data_version_key(label):
+    return DATA_VERSION_KEY.format(label.lower())
+
+
+def _stamp(keys, versions):
+    stamp = ';'.join(f"{label}={versions[key]}" for label, key in keys.items())
+    return hashlib.sha1(stamp.encode()).hexdigest()
+
+
+def get_data_version(labels):
+    """Return a stamp that changes whenever any of the given models is written."""
+    keys = {label: data_version_key(label) for label in sorted(labels)}
+    versions = cache.get_many(list(keys.values()))
+    for key in keys.values():
+        if key not in versions:
+            # Seed from the clock so a flushed cache never reissues an old version
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return _stamp(keys, versions)
+
+
+async def aget_data_version(labels):
+    """Async ``get_data_version``."""
+    keys = {label: data_version_key(label) for label in sorted(labels)}
+    versions = await cache.aget_many(list(keys.values()))
+    for key in keys.values():
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return _stamp(keys, versions)
+
+
+def bump_data_version(label):
+    key = data_version_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def normalize_parameters(parameters):
+    """Drop empty values and canonicalise the rest so equivalent requests share a key."""
+    normalized = {}
+    for name, value in parameters.items():
+        if value in (None, '', [], ()):
+            continue
+        if isinstance(value, (list, tuple, set)):
+            normalized[name] = sorted(str(item).strip() for item in value)
+        else:
+            normalized[name] = str(value).strip()
+    return dict(sorted(normalized.items()))
+
+
+def build_cache_key(template, parameters, data_version):
+    payload = json.dumps(
+        [template.pk, template.updated_at.isoformat(), parameters, data_version],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_or_generate_report(template, parameters, user, render, sources=None):
+    """
+    Return a completed ``GeneratedReport`` for the request, rendering it only
+    when no up-to-date file exists.
+
+    ``render`` is called with a writable binary file and must write the full
+    report to it. ``sources`` overrides the tables the report type reads.
+    Raises ``ReportInProgress`` if another request is rendering it.
+    """
+    parameters = normalize_parameters(parameters)
+    if sources is None:
+        sources = REPORT_SOURCES.get(template.report_type, [])
+    data_version = get_data_version(sources)
+    cache_key = build_cache_key(template, parameters, data_version)
+
+    report, created = GeneratedReport.objects.get_or_create(
+        cache_key=cache_key,
+        defaults={
+            'report_template': template,
+            'generated_by': user,
+            'parameters': parameters,
+            'data_version': data_version,
+            'status': 'generating',
+        },
+    )
+    if not created:
+        report = _wait_or_claim(report, user)
+        if report.status == 'completed':
+            return report
+    return _generate(report, template, render)
+
+
+def _wait_or_claim(report, user):
+    """Wait briefly for an in-flight generation, or take over a failed/abandoned one."""
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while True:
+        if report.status == 'completed' and os.path.exists(report.file_path):
+            return report
+
+        abandoned_before = timezone.now() - timedelta(seconds=GENERATION_TIMEOUT)
+        if report.status == 'generating' and report.generated_at > abandoned_before:
+            if time.monotonic() >= deadline:
+                raise ReportInProgress(report)
+            time.sleep(POLL_INTERVAL)
+            report.refresh_from_db()
+            continue
+
+        claimed = GeneratedReport.objects.filter(
+            pk=report.pk, status=report.status, generated_at=report.generated_at
+        ).update(status='generating', generated_at=timezone.now(), generated_by=user, error_message='')
+        report.refresh_from_db()
+        if claimed:
+            return report
+
+
+def _generate(report, template, render):
+    directory = Path(settings.MEDIA_ROOT) / REPORTS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{report.cache_key}.{FILE_EXTENSIONS[template.output_format]}"
+    # Render to a side file and rename so waiters never see a partial report
+    partial = path.with_name(path.name + '.part')
+    labels = {'report_type': template.report_type, 'format': template.output_format}
+    start = time.perf_counter()
+    try:
+        with open(partial, 'wb') as output:
+            render(output)
+        os.replace(partial, path)
+    except Exception as exc:
+        partial.unlink(missing_ok=True)
+        GeneratedReport.objects.filter(pk=report.pk).update(status='failed', error_message=str(exc))
+        REPORT_GENERATION.observe(time.perf_counter() - start, status='failed', **labels)
+        raise
+    REPORT_GENERATION.observe(time.perf_counter() - start, status='completed', **labels)
+
+    report.status = 'completed'
+    report.file_path = str(path)
+    report.file_size = path.stat().st_size
+    report.completed_at = timezone.now()
+    report.save(update_fields=['status', 'file_path', 'file_size', 'completed_at'])
+    REPORT_SIZE.observe(report.file_size, **labels)
+    return report
+
+
+def prune_reports(older_than):
+    """
+    Delete generated reports, and their files, created more than
+    ``older_than`` ago, then any older file in the reports directory that
+    no report refers to (renders that crashed before recording it).
+    Returns the number of reports deleted.
+    """
+    cutoff = timezone.now() - older_than
+    expired = GeneratedReport.objects.filter(generated_at__lt=cutoff)
+    for file_path in expired.exclude(file_path='').values_list('file_path', flat=True).iterator():
+        Path(file_path).unlink(missing_ok=True)
+    deleted, _ = expired.delete()
+
+    directory = Path(settings.MEDIA_ROOT) / REPORTS_DIR
+    if directory.is_dir():
+        kept = set(GeneratedReport.objects.exclude(file_path='').values_list('file_path', flat=True))
+        for path in directory.iterdir():
+            if str(path) not in kept and path.stat().st_mtime < cutoff.timestamp():
+                path.unlink(missing_ok=True)
+    return deleted
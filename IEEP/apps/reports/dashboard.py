@@ -0,0 +1,116 @@
+# reports/dashboard.py
+"""
+Dashboard KPIs.
+
+Metrics are computed with one conditional aggregate per table and cached
+under the data-version stamp of the tables they read (see cache.py), so a
+stock or product write invalidates them on commit. The short TTL covers
+tables without signal tracking. Daily values are stored as
+``MetricSnapshot`` rows by a periodic task and read back for sparklines.
+"""
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from apps.inventory.models import StockItem
+from apps.products.models import Product
+
+from .cache import aget_data_version, get_data_version
+from .models import MetricSnapshot
+
+DASHBOARD_SOURCES = ['products.Product', 'inventory.StockItem']
+METRICS_CACHE_KEY = 'dashboard:metrics:{}'
+METRICS_CACHE_TTL = 60
+TREND_CACHE_KEY = 'dashboard:trend:{}:{}:{}'
+TREND_CACHE_TTL = 300
+TREND_DAYS = 14
+
+
+def _count_optional(app_label, model_name, **filters):
+    """Count rows of a model from an app that may not be installed yet."""
+    try:
+        model = apps.get_model(app_label, model_name)
+    except LookupError:
+        return 0
+    return model.objects.filter(**filters).count()
+
+
+def compute_dashboard_metrics():
+    stock = StockItem.objects.aggregate(
+        low_stock_items=Count('id', filter=Q(quantity__gt=0, quantity__lte=F('reorder_threshold'))),
+        out_of_stock_items=Count('id', filter=Q(quantity__lte=0)),
+        stock_value=Sum(F('quantity') * F('unit_cost')),
+    )
+    return {
+        'total_products': Product.objects.count(),
+        'low_stock_items': stock['low_stock_items'],
+        'out_of_stock_items': stock['out_of_stock_items'],
+        'stock_value': float(stock['stock_value'] or 0),
+        'active_work_orders': _count_optional(
+            'production', 'ProductionOrder', status__in=['planned', 'in_progress']
+        ),
+        'pending_maintenance': _count_optional(
+            'maintenance', 'Asset', next_maintenance_date__isnull=False
+        ),
+    }
+
+
+def get_dashboard_metrics():
+    key = METRICS_CACHE_KEY.format(get_data_version(DASHBOARD_SOURCES))
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = compute_dashboard_metrics()
+        cache.set(key, metrics, METRICS_CACHE_TTL)
+    return metrics
+
+
+async def aget_dashboard_metrics():
+    """Async ``get_dashboard_metrics``; only a cache miss leaves the event loop for the aggregates."""
+    key = METRICS_CACHE_KEY.format(await aget_data_version(DASHBOARD_SOURCES))
+    metrics = await cache.aget(key)
+    if metrics is None:
+        metrics = await sync_to_async(compute_dashboard_metrics)()
+        await cache.aset(key, metrics, METRICS_CACHE_TTL)
+    return metrics
+
+
+def record_snapshot():
+    """Store today's metrics; re-running on the same day overwrites the row."""
+    snapshot, _ = MetricSnapshot.objects.update_or_create(
+        date=timezone.localdate(), defaults={'metrics': compute_dashboard_metrics()}
+    )
+    return snapshot
+
+
+def get_metric_trend(name, days=TREND_DAYS):
+    """Return ``[(date, value), ...]`` for the last ``days`` days, None where no snapshot exists."""
+    today = timezone.localdate()
+    key = TREND_CACHE_KEY.format(name, days, today.isoformat())
+    trend = cache.get(key)
+    if trend is None:
+        start = today - timedelta(days=days - 1)
+        values = {
+            snapshot.date: snapshot.metrics.get(name)
+            for snapshot in MetricSnapshot.objects.filter(date__gte=start).only('date', 'metrics')
+        }
+        trend = [(start + timedelta(days=i), values.get(start + timedelta(days=i))) for i in range(days)]
+        cache.set(key, trend, TREND_CACHE_TTL)
+    return trend
+
+
+def sparkline_points(trend, width=120, height=24):
+    """Scale a trend to SVG polyline points, skipping days without a snapshot."""
+    values = [value for _, value in trend if value is not None]
+    if len(values) < 2:
+        return ''
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    step = width / max(len(trend) - 1, 1)
+    return ' '.join(
+        f"{i * step:.1f},{height - (value - low) / span * height:.1f}"
+        for i, (_, value) in enumerate(trend) if value is not None
+    )
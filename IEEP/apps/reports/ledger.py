@@ -0,0 +1,119 @@
+# reports/ledger.py
+"""
+Stock ledger with running balances computed in SQL.
+
+Movements are signed per transaction type ('in' adds, 'out' subtracts,
+'transfer' is neutral) and an 'adjustment' resets the balance to its
+quantity, mirroring ``StockTransaction.save``. Window functions split each
+stock item's history into reset groups at every adjustment and sum within
+the group, so balances come out of one indexed scan over
+``(stock_item, created_at)`` instead of a Python loop over the history.
+"""
+from decimal import Decimal
+
+from django.db import connection
+
+from apps.inventory.models import StockItem, StockTransaction, Warehouse
+from apps.products.models import Product
+
+LEDGER_CHUNK_SIZE = 2000
+CENT = Decimal('0.01')
+
+LEDGER_SQL = """
+WITH movements AS (
+    SELECT
+        t.id, t.stock_item_id, t.created_at, t.transaction_type, t.quantity, t.reference,
+        CASE t.transaction_type
+            WHEN 'in' THEN t.quantity
+            WHEN 'out' THEN -t.quantity
+            WHEN 'adjustment' THEN t.quantity
+            ELSE 0
+        END AS delta,
+        SUM(CASE WHEN t.transaction_type = 'adjustment' THEN 1 ELSE 0 END) OVER (
+            PARTITION BY t.stock_item_id ORDER BY t.created_at, t.id ROWS UNBOUNDED PRECEDING
+        ) AS reset_group
+    FROM {transaction} t
+    INNER JOIN {stock_item} si ON si.id = t.stock_item_id
+    WHERE t.created_at < %s {scope}
+),
+balances AS (
+    SELECT
+        m.*,
+        SUM(m.delta) OVER (
+            PARTITION BY m.stock_item_id, m.reset_group ORDER BY m.created_at, m.id ROWS UNBOUNDED PRECEDING
+        ) AS balance,
+        LEAD(m.created_at) OVER (PARTITION BY m.stock_item_id ORDER BY m.created_at, m.id) AS next_created_at
+    FROM movements m
+)
+SELECT
+    b.stock_item_id, b.created_at, b.transaction_type, b.reference, b.quantity, b.balance,
+    p.sku, w.code, si.batch_number
+FROM balances b
+INNER JOIN {stock_item} si ON si.id = b.stock_item_id
+INNER JOIN {product} p ON p.id = si.product_id
+INNER JOIN {warehouse} w ON w.id = si.warehouse_id
+WHERE b.created_at >= %s OR b.next_created_at IS NULL OR b.next_created_at >= %s
+ORDER BY p.sku, w.code, b.stock_item_id, b.created_at, b.id
+"""
+
+SCOPE_FILTERS = {
+    'stock_item': 'si.id = %s',
+    'warehouse': 'si.warehouse_id = %s',
+    'product': 'si.product_id = %s',
+}
+
+TRANSACTION_LABELS = dict(StockTransaction.TRANSACTION_TYPES)
+
+
+def _decimal(value):
+    return Decimal(str(value)).quantize(CENT)
+
+
+def iter_stock_ledger(start, end, stock_item=None, warehouse=None, product=None):
+    """
+    Yield ledger rows for movements in ``[start, end)``.
+
+    Each stock item gets an 'Opening Balance' row (the balance carried in
+    from before ``start``, when it has earlier history) followed by its
+    movements in order. Rows are
+    ``(date, sku, warehouse, batch, type, reference, in, out, balance)``.
+    """
+    scope_sql, scope_params = [], []
+    for name, value in (('stock_item', stock_item), ('warehouse', warehouse), ('product', product)):
+        if value:
+            scope_sql.append(f"AND {SCOPE_FILTERS[name]}")
+            scope_params.append(value)
+
+    qn = connection.ops.quote_name
+    sql = LEDGER_SQL.format(
+        transaction=qn(StockTransaction._meta.db_table),
+        stock_item=qn(StockItem._meta.db_table),
+        product=qn(Product._meta.db_table),
+        warehouse=qn(Warehouse._meta.db_table),
+        scope=' '.join(scope_sql),
+    )
+    start_value = connection.ops.adapt_datetimefield_value(start)
+    end_value = connection.ops.adapt_datetimefield_value(end)
+    params = [end_value, *scope_params, start_value, start_value]
+
+    convert_datetime = connection.ops.convert_datetimefield_value
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(LEDGER_CHUNK_SIZE)
+            if not rows:
+                break
+            for _, created_at, kind, reference, quantity, balance, sku, code, batch in rows:
+                created_at = convert_datetime(created_at, None, connection)
+                balance = _decimal(balance)
+                if created_at < start:
+                    yield (start, sku, code, batch or '-', 'Opening Balance', '', None, None, balance)
+                    continue
+                quantity = _decimal(quantity)
+                yield (
+                    created_at, sku, code, batch or '-', TRANSACTION_LABELS.get(kind, kind),
+                    reference or '',
+                    quantity if kind == 'in' else None,
+                    quantity if kind == 'out' else None,
+                    balance,
+                )
@@ -0,0 +1,93 @@
+# reports/mixins.py
+"""
+Report exports for views.
+
+The PDF and Excel writers import ReportLab and openpyxl, which take
+longer to import than the rest of the app together, so they are imported
+on first use rather than with the URLconf.
+"""
+import csv
+import io
+
+from django.http import FileResponse, HttpResponse
+
+from .cache import FILE_EXTENSIONS, ReportInProgress, get_or_generate_report
+from .models import ReportTemplate
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'pdf': 'application/pdf',
+    'excel': XLSX_CONTENT_TYPE,
+}
+# Seconds a client is asked to wait while another request renders the same report
+RETRY_AFTER = 5
+
+
+class ReportExportMixin:
+    """
+    CSV/PDF/Excel file exports for a view, served through the report result cache.
+
+    Subclasses set ``report_type``, ``report_title``, ``export_filename`` and
+    ``export_columns`` (``(header, relative_width)`` pairs), list the GET
+    parameters that change the output in ``export_parameters`` and implement
+    ``iter_export_rows()``.
+    """
+    report_type = None
+    report_title = None
+    export_filename = None
+    export_columns = []
+    export_parameters = []
+
+    def iter_export_rows(self):
+        raise NotImplementedError
+
+    def get_report_parameters(self):
+        return {name: self.request.GET.getlist(name) for name in self.export_parameters}
+
+    def get_report_template(self, export_format):
+        return ReportTemplate.get_system_template(self.report_type, export_format)
+
+    def get_report_sources(self):
+        """Tables the export reads; None uses the defaults for ``report_type``."""
+        return None
+
+    def export(self, export_format):
+        template = self.get_report_template(export_format)
+        try:
+            report = get_or_generate_report(
+                template,
+                self.get_report_parameters(),
+                self.request.user,
+                getattr(self, f'render_{export_format}'),
+                sources=self.get_report_sources(),
+            )
+        except ReportInProgress:
+            response = HttpResponse(
+                "This report is being generated. Try again in a few seconds.",
+                status=503, content_type='text/plain',
+            )
+            response['Retry-After'] = RETRY_AFTER
+            return response
+        return FileResponse(
+            open(report.file_path, 'rb'),
+            as_attachment=True,
+            filename=f"{self.export_filename}.{FILE_EXTENSIONS[export_format]}",
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+
+    def render_csv(self, output):
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow([header for header, _ in self.export_columns])
+        writer.writerows(self.iter_export_rows())
+        text.detach()
+
+    def render_pdf(self, output):
+        from .pdf import PDFReportRenderer
+        PDFReportRenderer(self.report_title, self.export_columns).render(self.iter_export_rows(), output)
+
+    def render_excel(self, output):
+        from .excel import ExcelReportWriter
+        ExcelReportWriter(self.report_title, self.export_columns).write(self.iter_export_rows(), output)
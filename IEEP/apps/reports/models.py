@@ -31,6 +31,20 @@ class ReportTemplate(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_system_template(cls, report_type, output_format):
+        """Return the active template for a built-in report, creating it on first use."""
+        template = cls.objects.filter(
+            report_type=report_type, output_format=output_format, is_active=True
+        ).order_by('pk').first()
+        if template is None:
+            template = cls.objects.create(
+                name=f"{dict(cls.REPORT_TYPES)[report_type]} ({dict(cls.FORMAT_CHOICES)[output_format]})",
+                report_type=report_type,
+                output_format=output_format,
+            )
+        return template
+
 class GeneratedReport(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -42,6 +56,8 @@ class GeneratedReport(models.Model):
     report_template = models.ForeignKey(ReportTemplate, on_delete=models.CASCADE)
     generated_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True)
     parameters = models.JSONField(default=dict)
+    cache_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    data_version = models.CharField(max_length=40, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     file_path = models.CharField(max_length=500, blank=True)
     file_size = models.PositiveIntegerField(null=True, blank=True)
@@ -56,4 +72,16 @@ class GeneratedReport(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.report_template} - {self.generated_at}"
\ No newline at end of file
+        return f"{self.report_template} - {self.generated_at}"
+
+class MetricSnapshot(models.Model):
+    date = models.DateField(unique=True)
+    metrics = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Metrics for {self.date}"
@@ -0,0 +1,360 @@
+# reports/query.py
+"""
+Declarative report queries for ``ReportTemplate.template_query``.
+
+A template query is a JSON spec compiled into a single grouped ORM
+aggregate, e.g.::
+
+    {
+        "model": "inventory.StockItem",
+        "dimensions": ["warehouse__code", {"field": "created_at", "trunc": "month", "as": "month"}],
+        "measures": {
+            "items": {"agg": "count", "field": "id"},
+            "total_qty": {"agg": "sum", "field": "quantity"}
+        },
+        "filters": [
+            {"field": "product__product_type", "op": "exact", "value": "raw"},
+            {"field": "warehouse__code", "op": "in", "param": "warehouses", "default": []}
+        ],
+        "order_by": ["-total_qty"],
+        "limit": 500
+    }
+
+Only allowlisted models, field paths, lookups and aggregates are accepted,
+so a template can never reach arbitrary tables or raw SQL. Compiled plans
+are cached per template revision; runs are bounded by a row limit and a
+per-statement timeout (``QueryTimeout`` when it is hit), and ``explain``
+returns the database's plan and cost estimate without executing the query.
+"""
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, BooleanField, Count, Max, Min, Sum, Value
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+QUERYABLE_FIELDS = {
+    'inventory.StockItem': [
+        'id', 'quantity', 'unit_cost', 'reorder_threshold', 'procurement_status', 'batch_number',
+        'location', 'expiry_date', 'created_at', 'updated_at',
+        'warehouse__code', 'warehouse__name', 'warehouse__location',
+        'product__sku', 'product__name', 'product__product_type', 'product__category__name',
+        'product__cost_price', 'product__selling_price',
+    ],
+    'inventory.StockTransaction': [
+        'id', 'transaction_type', 'quantity', 'reference', 'created_at', 'created_by__username',
+        'stock_item__batch_number', 'stock_item__warehouse__code', 'stock_item__product__sku',
+        'stock_item__product__name', 'stock_item__product__product_type',
+        'stock_item__product__category__name',
+    ],
+    'inventory.ReorderAlert': [
+        'id', 'status', 'created_at', 'stock_item__warehouse__code', 'stock_item__product__sku',
+        'stock_item__product__category__name',
+    ],
+    'products.Product': [
+        'id', 'sku', 'name', 'product_type', 'category__name', 'unit_of_measure__symbol',
+        'cost_price', 'selling_price', 'reorder_threshold', 'is_active', 'created_at',
+    ],
+    'products.BOM': [
+        'id', 'bom_code', 'version', 'is_active', 'is_draft', 'effective_date', 'labor_cost',
+        'overhead_cost', 'expected_yield_percentage', 'product__sku', 'product__name', 'created_at',
+    ],
+}
+
+# Models whose writes must invalidate cached results of template queries.
+QUERY_SOURCES = {
+    'inventory.StockItem': ['inventory.StockItem', 'inventory.Warehouse', 'products.Product', 'products.Category'],
+    'inventory.StockTransaction': ['inventory.StockTransaction', 'inventory.StockItem', 'inventory.Warehouse', 'products.Product', 'products.Category'],
+    'inventory.ReorderAlert': ['inventory.ReorderAlert', 'inventory.StockItem', 'inventory.Warehouse', 'products.Product', 'products.Category'],
+    'products.Product': ['products.Product', 'products.Category', 'products.UnitOfMeasure'],
+    'products.BOM': ['products.BOM', 'products.Product'],
+}
+
+AGGREGATES = {'count': Count, 'sum': Sum, 'avg': Avg, 'min': Min, 'max': Max}
+LOOKUPS = {'exact', 'in', 'lt', 'lte', 'gt', 'gte', 'range', 'icontains', 'istartswith', 'isnull'}
+TRUNCATIONS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth, 'year': TruncYear}
+
+DEFAULT_ROW_LIMIT = 1000
+MAX_ROW_LIMIT = 10000
+DEFAULT_TIMEOUT_MS = 10000
+MISSING = object()
+# Query string spellings accepted for ``isnull`` parameters
+BOOLEAN_STRINGS = {'true': True, 'yes': True, 'on': True, 'false': False, 'no': False, 'off': False}
+
+
+class QuerySpecError(ValueError):
+    pass
+
+
+class QueryTimeout(Exception):
+    """A template query ran past its statement timeout."""
+
+
+class QueryPlan:
+    """A validated, compiled template query; bind parameters with ``queryset()``."""
+
+    def __init__(self, model, dimensions, annotations, measures, filters, order_by, limit):
+        self.model = model
+        self.dimensions = dimensions
+        self.annotations = annotations
+        self.measures = measures
+        self.filters = filters
+        self.order_by = order_by
+        self.limit = limit
+        self.columns = dimensions + list(measures)
+        self.sources = QUERY_SOURCES[model._meta.label]
+
+    def bind(self, parameters=None):
+        """
+        Return the filter lookups with ``parameters`` bound, each value
+        converted to its field's type. Raises QuerySpecError for a missing
+        or malformed parameter.
+        """
+        parameters = parameters or {}
+        lookups = {}
+        for lookup, target, value, param, default in self.filters:
+            if param is not None:
+                value = parameters.get(param, default)
+                if value is MISSING:
+                    raise QuerySpecError(f"Missing report parameter '{param}'")
+                if lookup.endswith('__in') and not isinstance(value, (list, tuple)):
+                    value = [value]
+                if lookup.endswith('__in') and not value:
+                    # An empty optional list means "no filter", not "match nothing"
+                    continue
+            try:
+                lookups[lookup] = _coerce(target, lookup.rsplit('__', 1)[1], value)
+            except (ValidationError, ValueError, TypeError) as exc:
+                name = f"report parameter '{param}'" if param is not None else f"filter value for '{lookup}'"
+                raise QuerySpecError(f"Invalid {name}: {value!r}") from exc
+        return lookups
+
+    def queryset(self, parameters=None):
+        annotations, group_by = dict(self.annotations), self.dimensions
+        if not group_by:
+            # Group on a constant so measures aggregate over the whole set
+            annotations['_total'] = Value(1)
+            group_by = ['_total']
+        return (
+            self.model.objects.filter(**self.bind(parameters))
+            .annotate(**annotations)
+            .values(*group_by)
+            .annotate(**self.measures)
+            .order_by(*self.order_by)
+        )
+
+
+def _check_field(model_label, field):
+    if not isinstance(field, str) or field not in QUERYABLE_FIELDS[model_label]:
+        raise QuerySpecError(f"Field '{field}' is not queryable on {model_label}")
+
+
+def _target_field(model, path):
+    """The model field a queryable ``a__b__c`` path ends on."""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _coerce(field, op, value):
+    """Convert a filter value to the Python type ``field`` compares against."""
+    if op == 'isnull':
+        if isinstance(value, str) and value.lower() in BOOLEAN_STRINGS:
+            return BOOLEAN_STRINGS[value.lower()]
+        return BooleanField().to_python(value)
+    if op in ('in', 'range'):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if op == 'range' and len(values) != 2:
+            raise ValueError("A range needs exactly two values")
+        return [_to_python(field, item) for item in values]
+    if op in ('icontains', 'istartswith'):
+        return str(value)
+    return _to_python(field, value)
+
+
+def _to_python(field, value):
+    value = field.to_python(value)
+    if isinstance(value, datetime) and timezone.is_naive(value):
+        # Query string datetimes are in the site's time zone
+        value = timezone.make_aware(value)
+    return value
+
+
+def _list(spec, key):
+    value = spec.get(key) or []
+    if not isinstance(value, list):
+        raise QuerySpecError(f"'{key}' must be a list")
+    return value
+
+
+def compile_spec(spec):
+    """Validate a spec dict and compile it into a ``QueryPlan``."""
+    if not isinstance(spec, dict):
+        raise QuerySpecError("Template query must be a JSON object")
+    model_label = spec.get('model')
+    if model_label not in QUERYABLE_FIELDS:
+        raise QuerySpecError(f"Model '{model_label}' is not queryable")
+    model = apps.get_model(model_label)
+    field_names = {field.name for field in model._meta.get_fields()}
+
+    dimensions, annotations = [], {}
+    for dimension in _list(spec, 'dimensions'):
+        if isinstance(dimension, str):
+            _check_field(model_label, dimension)
+            dimensions.append(dimension)
+            continue
+        if not isinstance(dimension, dict):
+            raise QuerySpecError(f"Invalid dimension {dimension!r}")
+        field, trunc, alias = dimension.get('field'), dimension.get('trunc'), dimension.get('as')
+        _check_field(model_label, field)
+        if trunc not in TRUNCATIONS or not isinstance(alias, str) or not alias.isidentifier() or alias in field_names:
+            raise QuerySpecError(f"Invalid dimension {dimension!r}")
+        annotations[alias] = TRUNCATIONS[trunc](field)
+        dimensions.append(alias)
+
+    measures = {}
+    if not isinstance(spec.get('measures') or {}, dict):
+        raise QuerySpecError("'measures' must be an object")
+    for name, measure in (spec.get('measures') or {}).items():
+        if not name.isidentifier() or name in dimensions or name in field_names:
+            raise QuerySpecError(f"Invalid measure name '{name}'")
+        if not isinstance(measure, dict):
+            raise QuerySpecError(f"Invalid measure '{name}': {measure!r}")
+        agg = AGGREGATES.get(measure.get('agg'))
+        if agg is None:
+            raise QuerySpecError(f"Unknown aggregate '{measure.get('agg')}'")
+        _check_field(model_label, measure.get('field'))
+        kwargs = {'distinct': True} if measure.get('distinct') and agg is Count else {}
+        measures[name] = agg(measure['field'], **kwargs)
+    if not dimensions and not measures:
+        raise QuerySpecError("A template query needs at least one dimension or measure")
+
+    filters = []
+    for condition in _list(spec, 'filters'):
+        if not isinstance(condition, dict):
+            raise QuerySpecError(f"Invalid filter {condition!r}")
+        field, op = condition.get('field'), condition.get('op', 'exact')
+        _check_field(model_label, field)
+        if not isinstance(op, str) or op not in LOOKUPS:
+            raise QuerySpecError(f"Unsupported filter operator '{op}'")
+        target = _target_field(model, field)
+        if 'param' in condition:
+            filters.append((f"{field}__{op}", target, None, condition['param'], condition.get('default', MISSING)))
+        elif 'value' in condition:
+            filters.append((f"{field}__{op}", target, condition['value'], None, None))
+        else:
+            raise QuerySpecError(f"Filter on '{field}' needs a 'value' or a 'param'")
+
+    order_by = []
+    for name in _list(spec, 'order_by'):
+        if not isinstance(name, str) or (name.lstrip('-') not in dimensions and name.lstrip('-') not in measures):
+            raise QuerySpecError(f"Cannot order by '{name}'")
+        order_by.append(name)
+
+    limit = spec.get('limit', DEFAULT_ROW_LIMIT)
+    if not isinstance(limit, int) or limit < 1:
+        raise QuerySpecError("'limit' must be a positive integer")
+    return QueryPlan(model, dimensions, annotations, measures, filters, order_by, min(limit, MAX_ROW_LIMIT))
+
+
+@lru_cache(maxsize=256)
+def _compile_template_query(template_pk, updated_at, template_query):
+    try:
+        spec = json.loads(template_query)
+    except ValueError as exc:
+        raise QuerySpecError(f"Template query is not valid JSON: {exc}") from exc
+    return compile_spec(spec)
+
+
+def get_plan(template):
+    """Return the compiled plan for a template, cached until the template changes."""
+    return _compile_template_query(template.pk, template.updated_at, template.template_query)
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Abort any statement that runs longer than ``milliseconds`` inside the block."""
+    vendor = connection.vendor
+    if vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT @@SESSION.max_execution_time')
+            previous = cursor.fetchone()[0]
+            cursor.execute('SET SESSION max_execution_time = %s', [milliseconds])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SET SESSION max_execution_time = %s', [previous])
+    elif vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+            yield
+    elif vendor == 'sqlite':
+        deadline = time.monotonic() + milliseconds / 1000
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+def _is_timeout(error):
+    cause = error.__cause__
+    if connection.vendor == 'mysql':
+        # ER_QUERY_TIMEOUT: maximum statement execution time exceeded
+        return bool(getattr(cause, 'args', None)) and cause.args[0] == 3024
+    if connection.vendor == 'postgresql':
+        # query_canceled, raised for statement_timeout
+        return getattr(cause, 'pgcode', None) == '57014'
+    # SQLite reports a progress handler abort as an interrupt
+    return 'interrupted' in str(error)
+
+
+def run_plan(plan, parameters=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """
+    Execute a plan and return ``(rows, truncated)``.
+
+    Rows are tuples in ``plan.columns`` order; ``truncated`` is True when the
+    result was cut at the plan's row limit. Raises ``QueryTimeout`` if the
+    query runs longer than ``timeout_ms``.
+    """
+    queryset = plan.queryset(parameters).values_list(*plan.columns)
+    try:
+        with statement_timeout(timeout_ms):
+            rows = list(queryset[:plan.limit + 1])
+    except OperationalError as exc:
+        if _is_timeout(exc):
+            raise QueryTimeout(f"The query ran longer than {timeout_ms / 1000:g} seconds") from exc
+        raise
+    return rows[:plan.limit], len(rows) > plan.limit
+
+
+def explain_plan(plan, parameters=None):
+    """Return the SQL, the database plan and its estimated cost (None if unknown) without running it."""
+    queryset = plan.queryset(parameters)
+    vendor = connection.vendor
+    if vendor in ('mysql', 'postgresql'):
+        raw_plan = queryset.explain(format='JSON')
+        parsed = json.loads(raw_plan)
+        if vendor == 'mysql':
+            cost = parsed['query_block'].get('cost_info', {}).get('query_cost')
+        else:
+            cost = parsed[0]['Plan']['Total Cost']
+    else:
+        raw_plan, cost = queryset.explain(), None
+    return {
+        'sql': str(queryset.query),
+        'plan': raw_plan,
+        'estimated_cost': float(cost) if cost is not None else None,
+    }
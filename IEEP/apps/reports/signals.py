@@ -0,0 +1,24 @@
+# reports/signals.py
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .cache import REPORT_SOURCES, bump_data_version
+from .dashboard import DASHBOARD_SOURCES
+from .query import QUERY_SOURCES
+
+
+def invalidate_report_data(sender, **kwargs):
+    """Bump the data version of the written table once the write is committed."""
+    label = sender._meta.label
+    transaction.on_commit(lambda: bump_data_version(label))
+
+
+def connect_signals():
+    tracked = {label for labels in REPORT_SOURCES.values() for label in labels}
+    tracked.update(DASHBOARD_SOURCES)
+    tracked.update(label for labels in QUERY_SOURCES.values() for label in labels)
+    for label in tracked:
+        model = apps.get_model(label)
+        post_save.connect(invalidate_report_data, sender=model, dispatch_uid=f'reports-version-save-{label}')
+        post_delete.connect(invalidate_report_data, sender=model, dispatch_uid=f'reports-version-delete-{label}')
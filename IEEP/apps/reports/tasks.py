@@ -0,0 +1,20 @@
+# reports/tasks.py
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+
+from .cache import prune_reports
+from .dashboard import record_snapshot
+
+
+@shared_task
+def snapshot_dashboard_metrics():
+    snapshot = record_snapshot()
+    return snapshot.metrics
+
+
+@shared_task
+def prune_generated_reports():
+    """Delete generated reports, and their files, older than REPORT_RETENTION_DAYS."""
+    return prune_reports(timedelta(days=getattr(settings, 'REPORT_RETENTION_DAYS', 7)))
@@ -1,3 +1,274 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.inventory.models import StockItem, StockTransaction, Warehouse
+from apps.products.models import Product, UnitOfMeasure
+from apps.users.models import User
+from .cache import (
+    ReportInProgress, build_cache_key, get_data_version, get_or_generate_report, normalize_parameters,
+)
+from .ledger import iter_stock_ledger
+from .models import GeneratedReport, ReportTemplate
+from .query import QuerySpecError, QueryTimeout, compile_spec, run_plan
+from .tasks import prune_generated_reports
+from .views import TemplateQueryReportView
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_stock_item(sku='P-1', code='W1', **fields):
+    uom, _ = UnitOfMeasure.objects.get_or_create(name='Litre', symbol='L')
+    product, _ = Product.objects.get_or_create(
+        sku=sku, defaults={'name': sku, 'product_type': 'finished_good', 'unit_of_measure': uom}
+    )
+    warehouse, _ = Warehouse.objects.get_or_create(code=code, defaults={'name': code, 'location': 'Site'})
+    fields.setdefault('batch_number', f'{sku}-{code}')
+    return StockItem.objects.create(product=product, warehouse=warehouse, unit_cost=1, **fields)
+
+
+@override_settings(CACHES=LOCMEM, MEDIA_ROOT=tempfile.mkdtemp())
+# Committed writes would otherwise reach the audit writer thread, outside the test transaction
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reporter', password='x')
+        self.template = ReportTemplate.objects.create(
+            name='Low stock', report_type='low_stock', output_format='csv', created_by=self.user
+        )
+        self.renders = 0
+
+    def render(self, output):
+        self.renders += 1
+        output.write(b'sku,quantity\n')
+
+    def test_equivalent_parameters_share_a_key(self, enqueue):
+        first = normalize_parameters({'warehouse': ' W1 ', 'sku': ['b', 'a'], 'empty': ''})
+        second = normalize_parameters({'sku': ('a', 'b'), 'warehouse': 'W1', 'none': None})
+        self.assertEqual(first, {'sku': ['a', 'b'], 'warehouse': 'W1'})
+        self.assertEqual(build_cache_key(self.template, first, 'v'), build_cache_key(self.template, second, 'v'))
+        self.assertNotEqual(build_cache_key(self.template, first, 'v'), build_cache_key(self.template, first, 'w'))
+
+    def test_data_version_moves_only_when_a_source_is_written(self, enqueue):
+        ledger_version = get_data_version(['inventory.StockTransaction'])
+        stock_version = get_data_version(['inventory.StockItem'])
+        with self.captureOnCommitCallbacks(execute=True):
+            create_stock_item()
+        self.assertNotEqual(get_data_version(['inventory.StockItem']), stock_version)
+        self.assertEqual(get_data_version(['inventory.StockTransaction']), ledger_version)
+
+    def test_identical_requests_render_once(self, enqueue):
+        first = get_or_generate_report(self.template, {'warehouse': 'W1'}, self.user, self.render)
+        second = get_or_generate_report(self.template, {'warehouse': ' W1'}, self.user, self.render)
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(second.status, 'completed')
+
+    def test_write_to_a_source_invalidates_the_result(self, enqueue):
+        first = get_or_generate_report(self.template, {}, self.user, self.render)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_stock_item()
+        second = get_or_generate_report(self.template, {}, self.user, self.render)
+        self.assertEqual(self.renders, 2)
+        self.assertNotEqual(first.cache_key, second.cache_key)
+
+    def test_failed_render_is_retried(self, enqueue):
+        def fail(output):
+            raise RuntimeError('renderer crashed')
+
+        with self.assertRaises(RuntimeError):
+            get_or_generate_report(self.template, {}, self.user, fail)
+        self.assertEqual(GeneratedReport.objects.get().status, 'failed')
+        report = get_or_generate_report(self.template, {}, self.user, self.render)
+        self.assertEqual((report.status, self.renders), ('completed', 1))
+
+    @mock.patch('apps.reports.cache.WAIT_TIMEOUT', 0)
+    def test_waiting_for_another_render_is_capped(self, enqueue):
+        def render(output):
+            # An identical request arrives while this one is still rendering
+            with self.assertRaises(ReportInProgress):
+                get_or_generate_report(self.template, {}, self.user, self.render)
+            output.write(b'sku,quantity\n')
+
+        report = get_or_generate_report(self.template, {}, self.user, render)
+        self.assertEqual((report.status, self.renders), ('completed', 0))
+
+    def test_export_asks_the_client_to_retry_while_rendering(self, enqueue):
+        self.client.force_login(self.user)
+        in_progress = ReportInProgress(GeneratedReport(pk=1))
+        with mock.patch('apps.reports.mixins.get_or_generate_report', side_effect=in_progress):
+            response = self.client.get(reverse('low-stock-report'), {'format': 'csv'})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '5'))
+
+    def test_prune_deletes_old_reports_and_their_files(self, enqueue):
+        old = get_or_generate_report(self.template, {'warehouse': 'W1'}, self.user, self.render)
+        recent = get_or_generate_report(self.template, {'warehouse': 'W2'}, self.user, self.render)
+        GeneratedReport.objects.filter(pk=old.pk).update(generated_at=timezone.now() - timedelta(days=8))
+        directory = os.path.dirname(recent.file_path)
+        orphan = os.path.join(directory, 'crashed.csv.part')
+        open(orphan, 'wb').close()
+        week_ago = (timezone.now() - timedelta(days=8)).timestamp()
+        os.utime(orphan, (week_ago, week_ago))
+        os.utime(recent.file_path, (week_ago, week_ago))
+
+        self.assertEqual(prune_generated_reports(), 1)
+        self.assertEqual(list(GeneratedReport.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertFalse(os.path.exists(old.file_path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recent.file_path))
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='x')
+        self.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=10)
+
+    def post(self, item, kind, quantity, day):
+        transaction = StockTransaction.objects.create(
+            stock_item=item, transaction_type=kind, quantity=quantity, created_by=self.user, reference=f'{kind}-{day}'
+        )
+        StockTransaction.objects.filter(pk=transaction.pk).update(created_at=self.day + timedelta(days=day))
+
+    def ledger(self, start, end, **scope):
+        return list(iter_stock_ledger(self.day + timedelta(days=start), self.day + timedelta(days=end), **scope))
+
+    def test_balances_reset_at_adjustments_and_open_at_range_start(self, enqueue):
+        item = create_stock_item(quantity=0)
+        for kind, quantity, day in [('in', 100, 1), ('out', 30, 2), ('adjustment', 50, 3),
+                                    ('in', 10, 5), ('transfer', 5, 6), ('out', 5, 7)]:
+            self.post(item, kind, quantity, day)
+
+        rows = self.ledger(4, 8)
+        self.assertEqual(
+            [(row[4], row[6], row[7], row[8]) for row in rows],
+            [
+                ('Opening Balance', None, None, Decimal('50.00')),
+                ('Stock In', Decimal('10.00'), None, Decimal('60.00')),
+                ('Transfer', None, None, Decimal('60.00')),
+                ('Stock Out', None, Decimal('5.00'), Decimal('55.00')),
+            ],
+        )
+        self.assertEqual(rows[0][0], self.day + timedelta(days=4))
+        # The closing balance matches the stored one
+        self.assertEqual(rows[-1][8], StockItem.objects.get(pk=item.pk).quantity)
+
+    def test_opening_balance_only_for_items_with_earlier_history(self, enqueue):
+        dormant = create_stock_item(sku='P-1', quantity=0)
+        fresh = create_stock_item(sku='P-2', quantity=0)
+        self.post(dormant, 'in', 20, 1)
+        self.post(fresh, 'in', 7, 5)
+
+        rows = self.ledger(4, 8)
+        self.assertEqual(
+            [(row[1], row[4], row[8]) for row in rows],
+            [('P-1', 'Opening Balance', Decimal('20.00')), ('P-2', 'Stock In', Decimal('7.00'))],
+        )
+        self.assertEqual(self.ledger(6, 8, stock_item=fresh.pk)[0][4], 'Opening Balance')
+        self.assertEqual(self.ledger(0, 1), [])
+
+
+STOCK_QUERY = {
+    'model': 'inventory.StockItem',
+    'dimensions': ['warehouse__code'],
+    'measures': {'items': {'agg': 'count', 'field': 'id'}, 'total_qty': {'agg': 'sum', 'field': 'quantity'}},
+    'filters': [
+        {'field': 'quantity', 'op': 'gte', 'param': 'min_qty', 'default': 0},
+        {'field': 'warehouse__code', 'op': 'in', 'param': 'warehouses', 'default': []},
+    ],
+    'order_by': ['warehouse__code'],
+}
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class TemplateQueryTests(TestCase):
+    def test_rejects_specs_outside_the_allowlist(self, enqueue):
+        invalid = [
+            {**STOCK_QUERY, 'model': 'users.User'},
+            {**STOCK_QUERY, 'dimensions': ['created_by__password']},
+            {**STOCK_QUERY, 'measures': {'n': {'agg': 'stddev', 'field': 'quantity'}}},
+            {**STOCK_QUERY, 'filters': [{'field': 'quantity', 'op': 'regex', 'value': '.*'}]},
+            {**STOCK_QUERY, 'filters': [{'field': 'quantity', 'op': 'gte'}]},
+            {**STOCK_QUERY, 'order_by': ['unit_cost']},
+            {**STOCK_QUERY, 'limit': 0},
+            {'model': 'inventory.StockItem'},
+            # Entries of the wrong JSON type
+            {**STOCK_QUERY, 'dimensions': [['warehouse__code']]},
+            {**STOCK_QUERY, 'dimensions': [{'field': 'created_at', 'trunc': 'month', 'as': 1}]},
+            {**STOCK_QUERY, 'dimensions': 'warehouse__code'},
+            {**STOCK_QUERY, 'measures': {'n': 'count'}},
+            {**STOCK_QUERY, 'measures': [{'agg': 'count', 'field': 'id'}]},
+            {**STOCK_QUERY, 'measures': {'n': {'agg': 'count', 'field': ['id']}}},
+            {**STOCK_QUERY, 'filters': ['quantity']},
+            {**STOCK_QUERY, 'filters': [{'field': 'quantity', 'op': ['gte'], 'value': 1}]},
+            {**STOCK_QUERY, 'order_by': [{'field': 'items'}]},
+        ]
+        for spec in invalid:
+            with self.subTest(spec=spec), self.assertRaises(QuerySpecError):
+                compile_spec(spec)
+
+    def test_runs_grouped_query_with_bound_parameters(self, enqueue):
+        create_stock_item(sku='P-1', code='W1', quantity=5)
+        create_stock_item(sku='P-2', code='W1', quantity=15)
+        create_stock_item(sku='P-1', code='W2', quantity=30)
+        plan = compile_spec(STOCK_QUERY)
+
+        rows, truncated = run_plan(plan)
+        self.assertEqual(rows, [('W1', 2, Decimal('20.00')), ('W2', 1, Decimal('30.00'))])
+        self.assertFalse(truncated)
+        rows, _ = run_plan(plan, {'min_qty': '10', 'warehouses': 'W1'})
+        self.assertEqual(rows, [('W1', 1, Decimal('15.00'))])
+
+    def test_parameters_are_converted_to_field_types(self, enqueue):
+        plan = compile_spec(STOCK_QUERY)
+        self.assertEqual(plan.bind({'min_qty': '2.5'})['quantity__gte'], Decimal('2.5'))
+        for parameters in ({'min_qty': 'abc'}, {'min_qty': ['1', '2']}):
+            with self.subTest(parameters=parameters), self.assertRaises(QuerySpecError):
+                plan.bind(parameters)
+        required = compile_spec({**STOCK_QUERY, 'filters': [{'field': 'quantity', 'op': 'gte', 'param': 'min_qty'}]})
+        with self.assertRaises(QuerySpecError):
+            required.bind({})
+
+    def test_view_answers_invalid_parameters_with_400(self, enqueue):
+        user = User.objects.create_user('analyst', password='x')
+        template = ReportTemplate.objects.create(
+            name='By warehouse', report_type='inventory_status', output_format='csv',
+            template_query=json.dumps(STOCK_QUERY), created_by=user,
+        )
+        request = RequestFactory().get('/', {'min_qty': 'abc'})
+        request.user = user
+        response = TemplateQueryReportView.as_view()(request, pk=template.pk)
+        self.assertEqual(response.status_code, 400)
+
+    def test_statement_timeout_is_reported(self, enqueue):
+        item = create_stock_item(quantity=5)
+        # Enough rows for SQLite to reach its progress handler, which enforces the timeout
+        StockItem.objects.bulk_create([
+            StockItem(product=item.product, warehouse=item.warehouse, batch_number=f'B-{index}', quantity=1, unit_cost=1)
+            for index in range(500)
+        ])
+        plan = compile_spec(STOCK_QUERY)
+        with self.assertRaises(QueryTimeout):
+            run_plan(plan, timeout_ms=-1)
+        self.assertEqual(len(run_plan(plan)[0]), 1)
+
+        user = User.objects.create_user('analyst', password='x')
+        template = ReportTemplate.objects.create(
+            name='By warehouse', report_type='inventory_status', output_format='csv',
+            template_query=json.dumps(STOCK_QUERY), created_by=user,
+        )
+        request = RequestFactory().get('/')
+        request.user = user
+        with mock.patch('apps.reports.views.run_plan', side_effect=QueryTimeout('The query ran longer than 10 seconds')):
+            response = TemplateQueryReportView.as_view()(request, pk=template.pk)
+        self.assertEqual(response.status_code, 504)
+        self.assertIn(b'took too long', response.content)
@@ -2,6 +2,9 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('dashboard/', views.DashboardView.as_view(), name='dashboard'),
+    path('dashboard/', views.DashboardView.as_view(template_name='reports/dashboard.html'), name='reports-dashboard'),
+    path('dashboard/kpis/', views.DashboardKPIView.as_view(), name='dashboard-kpis'),
     path('low-stock/', views.LowStockReportView.as_view(), name='low-stock-report'),
+    path('stock-ledger/', views.StockLedgerReportView.as_view(), name='stock-ledger'),
+    path('templates/<int:pk>/', views.TemplateQueryReportView.as_view(), name='report-template-run'),
 ]
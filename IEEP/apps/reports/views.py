@@ -1,19 +1,26 @@
 from django.views.generic import TemplateView
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, Http404
+from django.shortcuts import get_object_or_404
 from django.db import models
-from django.db.models import F, FloatField
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
 import csv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from itertools import islice
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from apps.inventory.models import StockTransaction, StockItem, Warehouse
-from apps.production.models import ProductionOrder
-from apps.maintenance.models import MaintenanceOrder, Asset
 from apps.products.models import Product
+from .mixins import ReportExportMixin, EXPORT_CONTENT_TYPES
+from .ledger import iter_stock_ledger
+from apps.polling import AsyncJsonView
+from .dashboard import aget_dashboard_metrics, get_dashboard_metrics, get_metric_trend, sparkline_points
+from .models import ReportTemplate
+from .query import QuerySpecError, QueryTimeout, get_plan, run_plan, explain_plan
+
+EXPORT_CHUNK_SIZE = 2000
 
 @method_decorator(login_required, name='dispatch')
 class DashboardView(TemplateView):
@@ -21,25 +28,29 @@ class DashboardView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_products'] = Product.objects.count()
-        context['low_stock_items'] = StockItem.objects.filter(
-            quantity__lte=models.F('reorder_threshold'),
-            quantity__gt=0
-        ).count()
-        context['active_work_orders'] = ProductionOrder.objects.filter(
-            status__in=['planned', 'in_progress']
-        ).count()
-        context['pending_maintenance'] = Asset.objects.filter(
-            next_maintenance_date__isnull=False
-        ).count()
+        context.update(get_dashboard_metrics())
+        context['low_stock_trend'] = get_metric_trend('low_stock_items')
+        context['low_stock_sparkline'] = sparkline_points(context['low_stock_trend'])
         return context
 
+class DashboardKPIView(AsyncJsonView):
+    """Dashboard metrics as JSON, for widgets that refresh without reloading the page."""
+    async def get(self, request):
+        return JsonResponse(await aget_dashboard_metrics())
+
 @method_decorator(login_required, name='dispatch')
-class LowStockReportView(TemplateView):
+class LowStockReportView(ReportExportMixin, TemplateView):
     template_name = 'reports/low_stock_report.html'
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    report_type = 'low_stock'
+    report_title = 'Low Stock Report'
+    export_filename = 'low_stock_report'
+    export_parameters = ['warehouse']
+    export_columns = [
+        ('SKU', 1.2), ('Product', 2.6), ('Batch', 1.2), ('Warehouse', 1),
+        ('Current Qty', 1), ('Reorder Level', 1.1), ('Deficit', 0.9), ('Unit', 0.6),
+    ]
+
+    def get_queryset(self):
         queryset = StockItem.objects.select_related(
             'product__unit_of_measure', 'warehouse'
         ).annotate(
@@ -53,84 +64,185 @@ class LowStockReportView(TemplateView):
         warehouse = self.request.GET.get('warehouse')
         if warehouse:
             queryset = queryset.filter(warehouse_id=warehouse)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        queryset = self.get_queryset()
 
         context['low_stock_items'] = queryset
         context['warehouses'] = Warehouse.objects.filter(is_active=True)
         context['total_low_stock'] = queryset.count()
-        context['total_deficit'] = sum(item.stock_deficit for item in queryset)
+        context['total_deficit'] = queryset.aggregate(
+            total=Sum(F('reorder_threshold') - F('quantity'))
+        )['total'] or 0
         return context
 
+    def iter_export_rows(self):
+        """Yield plain value tuples in export column order without building model instances."""
+        return self.get_queryset().annotate(
+            batch=Coalesce('batch_number', Value('-'))
+        ).values_list(
+            'product__sku',
+            'product__name',
+            'batch',
+            'warehouse__code',
+            'quantity',
+            'reorder_threshold',
+            'stock_deficit',
+            'product__unit_of_measure__symbol',
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
     def get(self, request, *args, **kwargs):
         export_format = request.GET.get('format')
-        if export_format == 'csv':
-            return self.export_csv()
-        if export_format == 'pdf':
-            return self.export_pdf()
+        if export_format in EXPORT_CONTENT_TYPES:
+            return self.export(export_format)
         return super().get(request, *args, **kwargs)
 
-    def export_csv(self):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="low_stock_report.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'SKU', 'Product', 'Batch', 'Warehouse', 'Current Qty',
-            'Reorder Level', 'Deficit', 'Unit'
-        ])
-
-        items = self.get_context_data()['low_stock_items']
-        for item in items:
-            writer.writerow([
-                item.product.sku,
-                item.product.name,
-                item.batch_number or '-',
-                item.warehouse.code,
-                float(item.quantity),
-                float(item.reorder_threshold),
-                float(item.stock_deficit),
-                item.product.unit_of_measure.symbol
-            ])
-
-        return response
-
-    def export_pdf(self):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="low_stock_report.pdf"'
-
-        doc = SimpleDocTemplate(response, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
-
-        elements.append(Paragraph("Low Stock Report", styles['Title']))
-        elements.append(Paragraph(f"Generated on: {timezone.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal']))
-        elements.append(Spacer(1, 12))
-
-        data = [['SKU', 'Product', 'Batch', 'Warehouse', 'Qty', 'Reorder', 'Deficit', 'Unit']]
-        items = self.get_context_data()['low_stock_items']
-        for item in items:
-            data.append([
-                item.product.sku,
-                item.product.name[:30],
-                item.batch_number or '-',
-                item.warehouse.code,
-                f"{item.quantity:.2f}",
-                f"{item.reorder_threshold:.2f}",
-                f"{item.stock_deficit:.2f}",
-                item.product.unit_of_measure.symbol
-            ])
-
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-
-        doc.build(elements)
-        return response
+@method_decorator(login_required, name='dispatch')
+class StockLedgerReportView(ReportExportMixin, TemplateView):
+    template_name = 'reports/stock_ledger.html'
+    report_type = 'stock_ledger'
+    report_title = 'Stock Ledger'
+    export_filename = 'stock_ledger'
+    export_parameters = ['stock_item', 'warehouse', 'sku']
+    export_columns = [
+        ('Date', 1.7), ('SKU', 1.2), ('Warehouse', 1), ('Batch', 1.1), ('Type', 1.3),
+        ('Reference', 1.5), ('In', 0.9), ('Out', 0.9), ('Balance', 1),
+    ]
+    default_days = 30
+    preview_rows = 200
+
+    def get_dates(self):
+        today = timezone.localdate()
+        start = self.get_date_param('start') or today - timedelta(days=self.default_days)
+        end = self.get_date_param('end') or today
+        return start, end
+
+    def get_date_param(self, name):
+        try:
+            return parse_date(self.request.GET.get(name) or '')
+        except ValueError:
+            # Well formed but not a real date (e.g. 2020-13-45): use the default
+            return None
+
+    def get_id_param(self, name):
+        value = self.request.GET.get(name)
+        return int(value) if value and value.isdigit() else None
+
+    def get_report_parameters(self):
+        parameters = super().get_report_parameters()
+        start, end = self.get_dates()
+        parameters.update(start=start.isoformat(), end=end.isoformat())
+        return parameters
+
+    def iter_export_rows(self):
+        start, end = self.get_dates()
+        product = None
+        sku = self.request.GET.get('sku')
+        if sku:
+            # An unknown SKU must match nothing rather than drop the filter
+            product = Product.objects.filter(sku=sku).values_list('id', flat=True).first() or -1
+        return iter_stock_ledger(
+            timezone.make_aware(datetime.combine(start, time.min)),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+            stock_item=self.get_id_param('stock_item'),
+            warehouse=self.get_id_param('warehouse'),
+            product=product,
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rows = self.iter_export_rows()
+        try:
+            context['ledger_rows'] = list(islice(rows, self.preview_rows + 1))
+        finally:
+            rows.close()
+        context['truncated'] = len(context['ledger_rows']) > self.preview_rows
+        context['ledger_rows'] = context['ledger_rows'][:self.preview_rows]
+        context['start'], context['end'] = self.get_dates()
+        context['warehouses'] = Warehouse.objects.filter(is_active=True)
+        context['current_filters'] = self.request.GET.urlencode()
+        return context
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format')
+        if export_format in EXPORT_CONTENT_TYPES:
+            return self.export(export_format)
+        return super().get(request, *args, **kwargs)
+
+
+@method_decorator(login_required, name='dispatch')
+class TemplateQueryReportView(ReportExportMixin, TemplateView):
+    """Run the declarative query stored in a ReportTemplate's ``template_query``."""
+    template_name = 'reports/template_report.html'
+    reserved_parameters = {'format', 'explain'}
+
+    def dispatch(self, request, *args, **kwargs):
+        self.report_template = get_object_or_404(
+            ReportTemplate.objects.exclude(template_query=''), pk=kwargs['pk'], is_active=True
+        )
+        try:
+            self.plan = get_plan(self.report_template)
+        except QuerySpecError as exc:
+            self.plan, self.plan_error = None, str(exc)
+        return super().dispatch(request, *args, **kwargs)
+
+    @property
+    def report_title(self):
+        return self.report_template.name
+
+    @property
+    def export_filename(self):
+        return f"report_{self.report_template.pk}"
+
+    @property
+    def export_columns(self):
+        return [(column, 1) for column in self.plan.columns]
+
+    def get_report_parameters(self):
+        return {
+            name: values if len(values) > 1 else values[0]
+            for name, values in self.request.GET.lists()
+            if name not in self.reserved_parameters
+        }
+
+    def get_report_template(self, export_format):
+        return self.report_template
+
+    def get_report_sources(self):
+        return self.plan.sources
+
+    def iter_export_rows(self):
+        rows, _ = run_plan(self.plan, self.get_report_parameters())
+        return iter(rows)
+
+    def get(self, request, *args, **kwargs):
+        if self.plan is None:
+            raise Http404(self.plan_error)
+        try:
+            # Reject malformed parameters before anything is cached or rendered
+            self.plan.bind(self.get_report_parameters())
+            if request.GET.get('explain') and request.user.is_staff:
+                return JsonResponse(explain_plan(self.plan, self.get_report_parameters()))
+            if request.GET.get('format') == self.report_template.output_format:
+                return self.export(self.report_template.output_format)
+            return super().get(request, *args, **kwargs)
+        except QuerySpecError as exc:
+            return HttpResponse(str(exc), status=400)
+        except QueryTimeout as exc:
+            return HttpResponse(
+                f"This report took too long to run ({exc}). Narrow its filters and try again.", status=504
+            )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rows, truncated = run_plan(self.plan, self.get_report_parameters())
+        context.update({
+            'report_template': self.report_template,
+            'columns': self.plan.columns,
+            'rows': rows,
+            'truncated': truncated,
+            'current_filters': self.request.GET.urlencode(),
+        })
+        return context
@@ -1,3 +1,70 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from celery import shared_task
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from kombu.exceptions import OperationalError
+
+from .jobs import DEDUP_KEY, enqueue, fan_out, get_app
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+runs = []
+
+
+@shared_task(name='apps.tests.record')
+def record(value, **kwargs):
+    # The dedup key as the running task sees it
+    runs.append((value, kwargs, cache.get(DEDUP_KEY.format('apps.tests.record', value))))
+
+
+@shared_task(name='apps.tests.record_chunk')
+def record_chunk(ids, **kwargs):
+    runs.append((ids, kwargs))
+
+
+@override_settings(CACHES=LOCMEM)
+class JobTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        runs.clear()
+        conf = get_app().conf
+        # The app reads settings under the CELERY_ namespace, so overrides must use it too
+        previous = {
+            'CELERY_TASK_ALWAYS_EAGER': conf.task_always_eager,
+            'CELERY_TASK_EAGER_PROPAGATES': conf.task_eager_propagates,
+        }
+        conf.update(CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True)
+        self.addCleanup(conf.update, previous)
+
+    def test_enqueue_skips_a_task_already_queued_under_the_key(self):
+        with mock.patch.object(record, 'apply_async') as send:
+            self.assertIsNotNone(enqueue(record, 'P-1', dedup_key='P-1'))
+            self.assertIsNone(enqueue(record, 'P-1', dedup_key='P-1'))
+            enqueue(record, 'P-2', dedup_key='P-2')
+            enqueue(record, 'P-1')
+        self.assertEqual(send.call_count, 3)
+        task_id = send.call_args_list[0].kwargs['task_id']
+        self.assertEqual(cache.get(DEDUP_KEY.format(record.name, 'P-1')), task_id)
+
+    def test_key_is_released_when_the_task_starts(self):
+        enqueue(record, 'P-1', dedup_key='P-1', note='first')
+        enqueue(record, 'P-1', dedup_key='P-1', note='second')
+        # Each run found the key released, so a change arriving mid-run would queue another
+        self.assertEqual(runs, [('P-1', {'note': 'first'}, None), ('P-1', {'note': 'second'}, None)])
+
+    def test_key_is_released_when_publishing_fails(self):
+        with mock.patch.object(record, 'apply_async', side_effect=OperationalError("broker unreachable")):
+            with self.assertRaises(OperationalError):
+                enqueue(record, 'P-1', dedup_key='P-1')
+        self.assertIsNone(cache.get(DEDUP_KEY.format(record.name, 'P-1')))
+        enqueue(record, 'P-1', dedup_key='P-1')
+        self.assertEqual(len(runs), 1)
+
+    def test_fan_out_sends_one_task_per_chunk(self):
+        result = fan_out(record_chunk, range(1201), chunk_size=500, note='reindex')
+        self.assertEqual(len(result.results), 3)
+        self.assertEqual([len(ids) for ids, _ in runs], [500, 500, 201])
+        self.assertEqual(runs[-1][0][-1], 1200)
+        self.assertEqual({kwargs['note'] for _, kwargs in runs}, {'reindex'})
+        self.assertIsNone(fan_out(record_chunk, []))
@@ -1,7 +1,8 @@
 # users/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Role, AuditLog
+from .models import User, Role, AuditLog, AuditArchive, APIToken
+from .tokens import issue_token, revoke_token
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
@@ -24,3 +25,28 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_filter = ['action', 'model_name', 'timestamp']
     search_fields = ['user__username', 'model_name', 'object_id']
     readonly_fields = ['user', 'action', 'model_name', 'object_id', 'changes', 'timestamp', 'ip_address']
+
+@admin.register(AuditArchive)
+class AuditArchiveAdmin(admin.ModelAdmin):
+    list_display = ['period', 'row_count', 'updated_at']
+    readonly_fields = ['period', 'file_path', 'row_count', 'last_id', 'user_ids', 'model_names', 'created_at', 'updated_at']
+
+@admin.register(APIToken)
+class APITokenAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'key_prefix', 'scopes', 'expires_at', 'revoked_at', 'last_used_at']
+    list_filter = ['revoked_at']
+    search_fields = ['name', 'user__username', 'key_prefix']
+    readonly_fields = ['key_prefix', 'last_used_at', 'created_at']
+    actions = ['revoke']
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return super().save_model(request, obj, form, change)
+        token, key = issue_token(obj.user, obj.name, obj.scopes, obj.expires_at)
+        obj.pk = token.pk
+        messages.warning(request, f"API key for {token.name} (shown once): {key}")
+
+    @admin.action(description="Revoke selected tokens")
+    def revoke(self, request, queryset):
+        for token in queryset.filter(revoked_at__isnull=True):
+            revoke_token(token)
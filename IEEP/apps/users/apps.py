@@ -6,4 +6,13 @@ class UsersConfig(AppConfig):
     name = 'apps.users'
     verbose_name = 'User Management'
 
+    def ready(self):
+        from django.apps import apps
+        from .capture import connect_capture
+        from .permissions import connect_signals as connect_permission_signals
+        from .tokens import connect_signals as connect_token_signals
+        connect_capture(apps.get_models())
+        connect_permission_signals()
+        connect_token_signals()
+
 
@@ -0,0 +1,236 @@
+# users/archive.py
+"""
+Monthly archival of the audit log.
+
+``AuditLog`` only keeps the last ``AUDIT_LOG_HOT_MONTHS`` months. Older,
+closed months are written to ``AUDIT_ARCHIVE_ROOT/<YYYY-MM>.jsonl.gz``
+sorted by timestamp, recorded in ``AuditArchive`` (row count, highest
+archived id, and the users and models present, so searches can skip whole
+files), and only then deleted from the table in chunks, together with
+their ``AuditChange`` index rows. Re-running a
+period is safe: rows up to ``last_id`` are already in the file, and late
+arrivals are merged into it.
+
+``iter_audit_entries`` reads a time range across both the table and the
+archives, so callers do not need to know where a month lives;
+``archived_entries`` returns the archived rows next to a keyset boundary
+so paged searches can merge them with the table.
+"""
+import gzip
+import heapq
+import json
+import os
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AuditArchive, AuditChange, AuditLog
+
+ENTRY_FIELDS = [
+    'id', 'timestamp', 'user_id', 'user__username', 'action', 'model_name',
+    'object_id', 'object_repr', 'changes', 'ip_address',
+]
+CHUNK_SIZE = 5000
+COMPRESS_LEVEL = 6
+
+
+def _next_period(period):
+    return date(period.year + period.month // 12, period.month % 12 + 1, 1)
+
+
+def _period_bounds(period):
+    start = timezone.make_aware(datetime(period.year, period.month, 1))
+    return start, timezone.make_aware(datetime.combine(_next_period(period), datetime.min.time()))
+
+
+def _period_of(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def _sort_key(entry):
+    return entry['timestamp'], entry['id']
+
+
+def _entry(row):
+    row['username'] = row.pop('user__username')
+    return row
+
+
+def _read_file(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+        for line in archive_file:
+            entry = json.loads(line)
+            entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
+            yield entry
+
+
+def hot_cutoff():
+    """First period that stays in the AuditLog table."""
+    period = timezone.localdate().replace(day=1)
+    months = getattr(settings, 'AUDIT_LOG_HOT_MONTHS', 3)
+    index = period.year * 12 + period.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_period(period):
+    """Move one month of AuditLog rows into its archive file and return the AuditArchive."""
+    start, end = _period_bounds(period)
+    in_period = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    archive = AuditArchive.objects.filter(period=period).first()
+    archived_through = archive.last_id if archive else 0
+
+    pending = in_period.filter(id__gt=archived_through)
+    if pending.exists():
+        root = Path(settings.AUDIT_ARCHIVE_ROOT)
+        root.mkdir(parents=True, exist_ok=True)
+        path = Path(archive.file_path) if archive else root / f"{period:%Y-%m}.jsonl.gz"
+        new_entries = (
+            _entry(row) for row in
+            pending.order_by('timestamp', 'id').values(*ENTRY_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+        )
+        existing = _read_file(path) if path.exists() else iter(())
+
+        row_count, last_id, previous_id = 0, archived_through, None
+        user_ids, model_names = set(), set()
+        partial_path = path.with_name(path.name + '.part')
+        with gzip.open(partial_path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as archive_file:
+            for entry in heapq.merge(existing, new_entries, key=_sort_key):
+                # A run interrupted after the rename may have written these rows already
+                if entry['id'] == previous_id:
+                    continue
+                previous_id = entry['id']
+                archive_file.write(json.dumps(entry, default=str) + '\n')
+                row_count += 1
+                last_id = max(last_id, entry['id'])
+                user_ids.add(entry['user_id'])
+                model_names.add(entry['model_name'])
+        os.replace(partial_path, path)
+
+        archive, _ = AuditArchive.objects.update_or_create(period=period, defaults={
+            'file_path': str(path),
+            'row_count': row_count,
+            'last_id': last_id,
+            'user_ids': sorted(user_ids, key=lambda user_id: (user_id is None, user_id or 0)),
+            'model_names': sorted(model_names),
+        })
+
+    if archive is not None:
+        archived = in_period.filter(id__lte=archive.last_id)
+        while True:
+            ids = list(archived.values_list('id', flat=True)[:CHUNK_SIZE])
+            if not ids:
+                break
+            AuditLog.objects.filter(id__in=ids).delete()
+        indexed = AuditChange.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        while True:
+            ids = list(indexed.values_list('id', flat=True)[:CHUNK_SIZE])
+            if not ids:
+                break
+            AuditChange.objects.filter(id__in=ids).delete()
+    return archive
+
+
+def archive_closed_periods():
+    """Archive every month older than the hot window; returns the archives written."""
+    cutoff_start, _ = _period_bounds(hot_cutoff())
+    oldest = AuditLog.objects.filter(timestamp__lt=cutoff_start).order_by('timestamp').values_list('timestamp', flat=True).first()
+    archives = []
+    if oldest is None:
+        return archives
+    period = _period_of(oldest)
+    while period < hot_cutoff():
+        archive = archive_period(period)
+        if archive is not None:
+            archives.append(archive)
+        period = _next_period(period)
+    return archives
+
+
+def _archives(start, end, user_id=None, model_name=None):
+    """Archives that can hold entries in ``[start, end)`` for the user and model, oldest first."""
+    archives = AuditArchive.objects.all()
+    if start is not None:
+        archives = archives.filter(period__gte=_period_of(start))
+    if end is not None:
+        archives = archives.filter(period__lte=_period_of(end))
+    return [
+        archive for archive in archives
+        if (user_id is None or user_id in archive.user_ids)
+        and (model_name is None or model_name in archive.model_names)
+    ]
+
+
+def _matching(archive, start, end, filters, field):
+    for entry in _read_file(archive.file_path):
+        if end is not None and entry['timestamp'] >= end:
+            break
+        if start is not None and entry['timestamp'] < start:
+            continue
+        if all(entry[name] == value for name, value in filters.items()) \
+                and (field is None or field in (entry['changes'] or {})):
+            yield entry
+
+
+def iter_audit_entries(start, end, user_id=None, model_name=None, object_id=None, action=None, field=None):
+    """
+    Return an iterator over audit entries with ``start <= timestamp < end``,
+    oldest first.
+
+    Entries are dicts of ``ENTRY_FIELDS`` (with ``username`` in place of
+    ``user__username``), whether they come from the table or an archive.
+    ``field`` keeps entries whose ``changes`` touch that field.
+    """
+    filters = {}
+    for name, value in (('user_id', user_id), ('model_name', model_name), ('object_id', object_id), ('action', action)):
+        if value is not None:
+            filters[name] = value
+    lookups = dict(filters, timestamp__gte=start, timestamp__lt=end)
+    if field is not None:
+        lookups['changes__has_key'] = field
+
+    streams = [
+        (_entry(row) for row in
+         AuditLog.objects.filter(**lookups).order_by('timestamp', 'id').values(*ENTRY_FIELDS).iterator(chunk_size=CHUNK_SIZE))
+    ]
+    for archive in _archives(start, end, user_id, model_name):
+        streams.append(_matching(archive, start, end, filters, field))
+    return heapq.merge(*streams, key=_sort_key)
+
+
+def archived_entries(limit, before=None, after=None, newest_first=True, start=None, end=None, field=None, **filters):
+    """
+    Return up to ``limit`` archived entries keyed strictly between ``after``
+    and ``before`` (``(timestamp, id)`` keys, either may be None) with
+    ``start <= timestamp < end``: the newest of them, newest first, or the
+    oldest, oldest first, with ``newest_first=False``.
+
+    Files are read from the boundary outwards and reading stops once
+    ``limit`` entries are found. Keyword filters are ``user_id``,
+    ``model_name``, ``object_id`` and ``action``; None means any.
+    """
+    if before is not None:
+        ceiling = before[0] + timedelta(microseconds=1)
+        end = ceiling if end is None else min(end, ceiling)
+    if after is not None:
+        start = after[0] if start is None else max(start, after[0])
+    filters = {name: value for name, value in filters.items() if value is not None}
+    archives = _archives(start, end, filters.get('user_id'), filters.get('model_name'))
+
+    found = []
+    for archive in (reversed(archives) if newest_first else archives):
+        entries = (
+            entry for entry in _matching(archive, start, end, filters, field)
+            if (before is None or _sort_key(entry) < before) and (after is None or _sort_key(entry) > after)
+        )
+        wanted = limit - len(found)
+        if newest_first:
+            found.extend(reversed(deque(entries, maxlen=wanted)))
+        else:
+            found.extend(islice(entries, wanted))
+        if len(found) >= limit:
+            break
+    return found
@@ -0,0 +1,181 @@
+# users/audit.py
+"""
+Buffered audit log writer.
+
+Views record entries with ``audit_sink.log(...)`` instead of
+``AuditLog.objects.create``. Entries are queued in process once the
+surrounding transaction commits, and a background thread writes them with
+``bulk_create`` when ``AUDIT_LOG_BATCH_SIZE`` are waiting or
+``AUDIT_LOG_FLUSH_INTERVAL`` seconds after the first one arrived, so an
+audited request pays for a queue put instead of an INSERT. Anything still
+queued is written when the process exits; Celery worker processes, which
+exit without running atexit hooks, also flush after every task and shut
+the writer down on ``worker_process_shutdown`` (see ieep/celery.py).
+
+``changes`` is a ``{field: {'old': ..., 'new': ...}}`` dict; each field is
+also written as an ``AuditChange`` row for field-level search.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AuditChange, AuditLog
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+SHUTDOWN_TIMEOUT = 10
+
+
+def _display(value):
+    return None if value is None else str(value)
+
+
+def field_changes(entry):
+    """Build the AuditChange index rows for an entry's ``changes``."""
+    return [
+        AuditChange(
+            user_id=entry.user_id,
+            action=entry.action,
+            model_name=entry.model_name,
+            object_id=entry.object_id,
+            field=field,
+            old_value=_display(change.get('old')) if isinstance(change, dict) else None,
+            new_value=_display(change.get('new') if isinstance(change, dict) else change),
+            timestamp=entry.timestamp,
+        )
+        for field, change in (entry.changes or {}).items()
+    ]
+
+
+class AuditSink:
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 200)
+        self.flush_interval = flush_interval or getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 1.0)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._worker = None
+
+    def log(self, user, action, model_name, **fields):
+        """Queue an audit entry; it is dropped if the current transaction rolls back."""
+        fields.setdefault('timestamp', timezone.now())
+        entry = AuditLog(user=user, action=action, model_name=model_name, **fields)
+        transaction.on_commit(lambda: self.enqueue(entry))
+        return entry
+
+    def enqueue(self, entry):
+        self._ensure_worker().put(entry)
+
+    def _ensure_worker(self):
+        # Queues and threads do not survive a fork, so each worker process starts its own;
+        # a writer that died is replaced, and picks up what was queued meanwhile
+        if self._pid != os.getpid() or not self._worker.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    self._start_worker()
+                    self._pid = os.getpid()
+                elif not self._worker.is_alive():
+                    self._start_worker()
+        return self._queue
+
+    def _start_worker(self):
+        self._worker = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is STOP:
+                return
+            if isinstance(entry, threading.Event):
+                entry.set()
+                continue
+            batch, stopping, flushed = [entry], False, None
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is STOP:
+                    stopping = True
+                    break
+                if isinstance(entry, threading.Event):
+                    flushed = entry
+                    break
+                batch.append(entry)
+            try:
+                self.write(batch)
+            except Exception:
+                # Whatever went wrong, the writer must outlive it
+                logger.exception("Dropped a batch of %d audit entries", len(batch))
+            if flushed is not None:
+                flushed.set()
+            if stopping:
+                return
+
+    def write(self, batch):
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(batch)
+                AuditChange.objects.bulk_create(
+                    [change for entry in batch for change in field_changes(entry)]
+                )
+        except Exception:
+            # One bad row (e.g. a deleted user, an unserializable change) must not lose the rest of the batch
+            logger.exception("Bulk audit write failed; retrying %d entries one by one", len(batch))
+            for entry in batch:
+                try:
+                    with transaction.atomic():
+                        entry.save(force_insert=True)
+                        AuditChange.objects.bulk_create(field_changes(entry))
+                except Exception:
+                    logger.exception("Dropped audit entry %s %s %s", entry.action, entry.model_name, entry.object_id)
+
+    def flush(self, timeout=SHUTDOWN_TIMEOUT):
+        """Write everything queued so far and keep the writer running; False if it timed out."""
+        if self._pid != os.getpid() or not self._worker.is_alive():
+            return True
+        # The writer sets the event once every entry queued before it is written
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        if not flushed.wait(timeout):
+            logger.error("Audit log writer did not flush within %s seconds", timeout)
+            return False
+        return True
+
+    def shutdown(self):
+        """Write everything queued so far and stop the writer thread."""
+        if self._pid != os.getpid() or not self._worker.is_alive():
+            return
+        self._queue.put(STOP)
+        self._worker.join(SHUTDOWN_TIMEOUT)
+        if self._worker.is_alive():
+            logger.error("Audit log writer did not finish within %s seconds", SHUTDOWN_TIMEOUT)
+            return
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        entries = [entry for entry in leftovers if isinstance(entry, AuditLog)]
+        if entries:
+            self.write(entries)
+        for entry in leftovers:
+            if isinstance(entry, threading.Event):
+                entry.set()
+
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.shutdown)
@@ -0,0 +1,31 @@
+# users/authentication.py
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from .tokens import TokenInfo, authenticate_token, parse_authorization
+
+
+class APITokenAuthentication(BaseAuthentication):
+    """DRF authentication for ``Authorization: Token <key>`` headers."""
+
+    def authenticate(self, request):
+        key = parse_authorization(get_authorization_header(request).decode('latin-1'))
+        if key is None:
+            return None
+        info = authenticate_token(key)
+        if info is None:
+            raise AuthenticationFailed('Invalid or expired token')
+        return info.user, info
+
+    def authenticate_header(self, request):
+        return 'Token'
+
+
+class TokenScopePermission(BasePermission):
+    """Tokens without the 'write' scope may only make safe requests."""
+
+    def has_permission(self, request, view):
+        if isinstance(request.auth, TokenInfo) and request.method not in SAFE_METHODS:
+            return 'write' in request.auth.scopes
+        return True
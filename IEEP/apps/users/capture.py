@@ -0,0 +1,160 @@
+# users/capture.py
+"""
+Model-level change capture for the audit log.
+
+A model opts in by subclassing ``AuditedModel``; ``audit_exclude`` lists
+fields that are not worth auditing. Tracked values are snapshotted when a
+row is loaded (``from_db``), so a save is diffed against the snapshot
+without re-reading the row, and only changed fields are recorded.
+``QuerySet.update`` and ``bulk_update`` skip save signals and are captured
+by ``AuditedQuerySet`` instead. Entries go through the batched
+``audit_sink``; the acting user and IP come from ``AuditContextMiddleware``.
+"""
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .audit import audit_sink
+
+# The current request, set by AuditContextMiddleware
+current_request = ContextVar('audit_current_request', default=None)
+# Set while bulk_update runs, whose internal update() is captured from snapshots instead
+in_bulk_update = ContextVar('audit_in_bulk_update', default=False)
+
+
+@lru_cache(maxsize=None)
+def tracked_fields(model):
+    """``(name, attname)`` of the concrete fields audited for a model."""
+    return tuple(
+        (field.name, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in model.audit_exclude
+    )
+
+
+def _snapshot(instance):
+    values = instance.__dict__
+    # Deferred fields are absent and stay untracked until loaded
+    return {attname: values[attname] for _, attname in tracked_fields(type(instance)) if attname in values}
+
+
+def _diff(model, old, new, only=None):
+    changes = {}
+    for name, attname in tracked_fields(model):
+        if attname not in new or (only is not None and name not in only and attname not in only):
+            continue
+        if attname not in old:
+            changes[name] = {'old': None, 'new': new[attname]}
+        elif old[attname] != new[attname]:
+            changes[name] = {'old': old[attname], 'new': new[attname]}
+    return changes
+
+
+def _record(model, action, object_id, object_repr, changes=None):
+    request = current_request.get()
+    user, ip_address = None, None
+    if request is not None:
+        if request.user.is_authenticated:
+            user = request.user
+        ip_address = getattr(request, 'audit_ip', None)
+    audit_sink.log(
+        user=user,
+        action=action,
+        model_name=model.__name__,
+        object_id=str(object_id),
+        object_repr=object_repr,
+        changes=changes or None,
+        ip_address=ip_address,
+    )
+
+
+class AuditedQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        model = self.model
+        names = {name for name, _ in tracked_fields(model)} | {attname for _, attname in tracked_fields(model)}
+        audited = [name for name in kwargs if name in names]
+        if not audited or in_bulk_update.get():
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            # One read of the affected rows per update, not one per row
+            before = {row[0]: row[1:] for row in self.values_list('pk', *audited)}
+            rows = super().update(**kwargs)
+            if any(hasattr(value, 'resolve_expression') for value in kwargs.values()):
+                after = {
+                    row[0]: row[1:]
+                    for row in model._base_manager.using(self.db).filter(pk__in=list(before)).values_list('pk', *audited)
+                }
+            else:
+                after = dict.fromkeys(before, tuple(kwargs[name] for name in audited))
+            for pk, old_values in before.items():
+                changes = {
+                    model._meta.get_field(name).name: {'old': old, 'new': new}
+                    for name, old, new in zip(audited, old_values, after.get(pk, old_values))
+                    if old != new
+                }
+                if changes:
+                    _record(model, 'update', pk, None, changes)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs = list(objs)
+        token = in_bulk_update.set(True)
+        try:
+            rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        finally:
+            in_bulk_update.reset(token)
+        for obj in objs:
+            new = _snapshot(obj)
+            changes = _diff(self.model, getattr(obj, '_audit_snapshot', {}), new, only=fields)
+            obj._audit_snapshot = {**getattr(obj, '_audit_snapshot', {}), **new}
+            if changes:
+                _record(self.model, 'update', obj.pk, obj.audit_repr(), changes)
+        return rows
+
+
+class AuditedModel(models.Model):
+    audit_exclude = ('created_at', 'updated_at')
+
+    objects = AuditedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._audit_snapshot = _snapshot(instance)
+        return instance
+
+    def audit_repr(self):
+        """Text stored as ``object_repr``; override when ``__str__`` follows relations."""
+        return str(self)
+
+
+def record_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    new = _snapshot(instance)
+    old = {} if created else getattr(instance, '_audit_snapshot', {})
+    changes = _diff(sender, old, new, only=update_fields)
+    if update_fields is not None:
+        # Fields left out of update_fields are still unsaved
+        new = {**old, **{attname: new[attname] for name, attname in tracked_fields(sender)
+                         if attname in new and (name in update_fields or attname in update_fields)}}
+    instance._audit_snapshot = new
+    if created or changes:
+        _record(sender, 'create' if created else 'update', instance.pk, instance.audit_repr(), changes)
+
+
+def record_delete(sender, instance, **kwargs):
+    _record(sender, 'delete', instance.pk, instance.audit_repr())
+
+
+def connect_capture(all_models):
+    for model in all_models:
+        if issubclass(model, AuditedModel) and not model._meta.abstract:
+            label = model._meta.label
+            post_save.connect(record_save, sender=model, dispatch_uid=f'audit-save-{label}')
+            post_delete.connect(record_delete, sender=model, dispatch_uid=f'audit-delete-{label}')
@@ -0,0 +1,85 @@
+# users/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import JsonResponse
+
+from .capture import current_request
+from .tokens import authenticate_token, parse_authorization
+
+API_PREFIX = '/api/'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+class AuditContextMiddleware:
+    """Expose the current request to model change capture (see capture.py)."""
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.audit_ip = get_client_ip(request)
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        # Context variables follow the request into sync_to_async threads
+        request.audit_ip = get_client_ip(request)
+        token = current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+class TokenAuthenticationMiddleware:
+    """
+    Authenticate ``/api/`` requests that carry an ``Authorization: Token <key>``
+    header, so the plain Django API views accept tokens as well as sessions.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        error = self.authenticate(request)
+        return error if error is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        error = await sync_to_async(self.authenticate)(request)
+        return error if error is not None else await self.get_response(request)
+
+    def authenticate(self, request):
+        """Attach the token's user to the request; returns an error response for a bad token."""
+        key = parse_authorization(request.META.get('HTTP_AUTHORIZATION', ''))
+        if key is not None and request.path.startswith(API_PREFIX):
+            info = authenticate_token(key)
+            if info is None:
+                return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+            if request.method not in SAFE_METHODS and 'write' not in info.scopes:
+                return JsonResponse({'error': 'Token does not have the write scope'}, status=403)
+            request.user = info.user
+            request.auth = info
+            # Header credentials are not sent by browsers on their own, so CSRF does not apply
+            request._dont_enforce_csrf_checks = True
+        return None
@@ -2,6 +2,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 class Role(models.Model):
     ROLE_CHOICES = [
@@ -44,21 +46,84 @@ class AuditLog(models.Model):
         ('logout', 'Logout'),
     ]
     
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Null for changes made outside a request (tasks, shell)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     model_name = models.CharField(max_length=100)
     object_id = models.CharField(max_length=100, blank=True, null=True)
     object_repr = models.TextField(blank=True, null=True)
-    changes = models.TextField(blank=True, null=True)
+    # {field: {'old': ..., 'new': ...}}; each field is also indexed as an AuditChange
+    changes = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is recorded, not when the buffered write reaches the database
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['timestamp']),
             models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['model_name', 'object_id', 'timestamp']),
         ]
 
     def __str__(self):
         return f"{self.user} - {self.action} - {self.model_name}"
+
+class AuditChange(models.Model):
+    """One changed field of an AuditLog entry, denormalized for field-level search."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    action = models.CharField(max_length=20, choices=AuditLog.ACTION_CHOICES)
+    model_name = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=100, blank=True, null=True)
+    field = models.CharField(max_length=100)
+    old_value = models.TextField(blank=True, null=True)
+    new_value = models.TextField(blank=True, null=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_name', 'object_id', 'field', 'timestamp']),
+            models.Index(fields=['model_name', 'field', 'timestamp']),
+            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name}:{self.object_id}.{self.field}"
+
+class APIToken(models.Model):
+    """An API key for scanners and integrations; only a SHA-256 hash of the key is stored."""
+    SCOPE_CHOICES = [
+        ('read', 'Read'),
+        ('write', 'Write'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100)
+    key_prefix = models.CharField(max_length=8, editable=False)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    scopes = models.JSONField(default=list)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.key_prefix}...)"
+
+class AuditArchive(models.Model):
+    """A closed month of audit entries moved out of AuditLog into a gzipped JSON-lines file."""
+    period = models.DateField(unique=True)
+    file_path = models.CharField(max_length=500)
+    row_count = models.PositiveIntegerField(default=0)
+    last_id = models.BigIntegerField(default=0)
+    user_ids = models.JSONField(default=list)
+    model_names = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['period']
+
+    def __str__(self):
+        return f"{self.period:%Y-%m} ({self.row_count} entries)"
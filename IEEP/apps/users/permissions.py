@@ -0,0 +1,142 @@
+# users/permissions.py
+"""
+Cached permission resolution.
+
+A user's effective permissions are the union of their role's, their
+groups' and their direct permissions. The set is resolved with one query
+and cached under a global version stamp that is bumped after commit
+whenever a role, group or permission assignment changes, so a stale set
+is never served. Within a request the set is also memoised on the user
+object. ``RolePermissionBackend`` plugs the resolver into
+``user.has_perm``; ``users_with_permission`` and ``users_in_groups``
+answer the reverse question for bulk alerting.
+"""
+import hashlib
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import Role, User
+
+PERMISSION_VERSION_KEY = 'users:permission-version'
+PERMISSIONS_CACHE_KEY = 'users:permissions:{}:{}'
+HOLDERS_CACHE_KEY = 'users:permission-holders:{}:{}'
+GROUP_MEMBERS_CACHE_KEY = 'users:group-members:{}:{}'
+CACHE_TTL = 3600
+
+# User saves that touch only these fields cannot change permissions
+IRRELEVANT_USER_FIELDS = {'last_login', 'last_login_ip', 'password', 'updated_at'}
+
+
+def get_permission_version():
+    version = cache.get(PERMISSION_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a flushed cache never reissues an old version
+        cache.add(PERMISSION_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(PERMISSION_VERSION_KEY)
+    return version
+
+
+def bump_permission_version():
+    try:
+        cache.incr(PERMISSION_VERSION_KEY)
+    except ValueError:
+        cache.add(PERMISSION_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def _resolve_permissions(user):
+    fields = ('content_type__app_label', 'codename')
+    by_role = Permission.objects.filter(role__user=user).order_by().values_list(*fields)
+    by_group = Permission.objects.filter(group__user=user).order_by().values_list(*fields)
+    direct = Permission.objects.filter(user=user).order_by().values_list(*fields)
+    return frozenset(f"{app_label}.{codename}" for app_label, codename in by_role.union(by_group, direct))
+
+
+def get_user_permissions(user):
+    """Return the user's effective permissions as ``{'app_label.codename', ...}``."""
+    if user.is_anonymous or not user.is_active:
+        return frozenset()
+    permissions = getattr(user, '_resolved_perm_cache', None)
+    if permissions is None:
+        key = PERMISSIONS_CACHE_KEY.format(get_permission_version(), user.pk)
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = _resolve_permissions(user)
+            cache.set(key, permissions, CACHE_TTL)
+        user._resolved_perm_cache = permissions
+    return permissions
+
+
+def user_has_perm(user, perm):
+    return user.is_active and (user.is_superuser or perm in get_user_permissions(user))
+
+
+def users_with_permission(perm):
+    """Active users holding ``perm`` through a role, a group, directly, or as superuser."""
+    key = HOLDERS_CACHE_KEY.format(get_permission_version(), perm)
+    users = cache.get(key)
+    if users is None:
+        app_label, codename = perm.split('.', 1)
+        permission = Permission.objects.filter(content_type__app_label=app_label, codename=codename)
+        users = list(
+            User.objects.filter(is_active=True)
+            .filter(
+                Q(is_superuser=True)
+                | Q(role__permissions__in=permission)
+                | Q(groups__permissions__in=permission)
+                | Q(user_permissions__in=permission)
+            )
+            .distinct()
+        )
+        cache.set(key, users, CACHE_TTL)
+    return users
+
+
+def users_in_groups(names):
+    """Active members of any of the named groups."""
+    names = sorted(names)
+    digest = hashlib.sha1('\n'.join(names).encode()).hexdigest()
+    key = GROUP_MEMBERS_CACHE_KEY.format(get_permission_version(), digest)
+    users = cache.get(key)
+    if users is None:
+        users = list(User.objects.filter(is_active=True, groups__name__in=names).distinct())
+        cache.set(key, users, CACHE_TTL)
+    return users
+
+
+class RolePermissionBackend(ModelBackend):
+    """ModelBackend whose permission checks include role permissions and use the cache."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is not None:
+            return set()
+        return get_user_permissions(user_obj)
+
+
+def invalidate_permissions(sender, **kwargs):
+    if kwargs.get('action', '').startswith('pre_'):
+        return
+    if sender is User and kwargs.get('update_fields') and set(kwargs['update_fields']) <= IRRELEVANT_USER_FIELDS:
+        return
+    transaction.on_commit(bump_permission_version)
+
+
+def connect_signals():
+    for model in (User, Role, Group, Permission):
+        label = model._meta.label
+        post_save.connect(invalidate_permissions, sender=model, dispatch_uid=f'permissions-save-{label}')
+        post_delete.connect(invalidate_permissions, sender=model, dispatch_uid=f'permissions-delete-{label}')
+    for through in (
+        Role.permissions.through,
+        Group.permissions.through,
+        User.groups.through,
+        User.user_permissions.through,
+    ):
+        m2m_changed.connect(
+            invalidate_permissions, sender=through, dispatch_uid=f'permissions-m2m-{through._meta.label}'
+        )
@@ -0,0 +1,157 @@
+# users/search.py
+"""
+Audit search with keyset paging.
+
+Pages are ordered newest first on ``(timestamp, id)`` and addressed by an
+opaque cursor of the boundary row's key, so every page is an index range
+scan on one of the composite audit indexes instead of an OFFSET that
+reads and discards all earlier rows. Months already moved to archive files
+are merged into the same pages, so a search does not stop at the hot
+window.
+"""
+import heapq
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+
+from .archive import archived_entries
+from .audit import _display
+from .models import AuditChange, AuditLog
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+LOG_FIELDS = [
+    'id', 'timestamp', 'user_id', 'user__username', 'action', 'model_name',
+    'object_id', 'object_repr', 'changes', 'ip_address',
+]
+CHANGE_FIELDS = [
+    'id', 'timestamp', 'user_id', 'user__username', 'action', 'model_name',
+    'object_id', 'field', 'old_value', 'new_value',
+]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    micros = int(timestamp.timestamp()) * 1000000 + timestamp.microsecond
+    return f"{micros}.{pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor '{cursor}'")
+    timestamp = datetime.fromtimestamp(micros // 1000000, tz=dt_timezone.utc)
+    return timestamp.replace(microsecond=micros % 1000000), pk
+
+
+def _key(row):
+    if isinstance(row, dict):
+        return row['timestamp'], row['id']
+    return row.timestamp, row.pk
+
+
+def _merge(rows, extra, limit, newest_first):
+    # A row archived but not yet deleted from the table appears in both
+    merged, previous = [], None
+    for row in heapq.merge(rows, extra, key=_key, reverse=newest_first):
+        if _key(row) != previous:
+            merged.append(row)
+            previous = _key(row)
+        if len(merged) == limit:
+            break
+    return merged
+
+
+def keyset_page(queryset, before=None, after=None, size=PAGE_SIZE, archived=None):
+    """
+    Return ``(rows, newer_cursor, older_cursor)`` for one newest-first page.
+
+    ``before`` pages towards older rows, ``after`` towards newer ones; a
+    cursor is None when there is nothing further in that direction.
+
+    ``archived``, if given, is called like ``archived_entries`` (``limit``,
+    ``before``/``after`` keys, ``newest_first``) for rows outside the
+    queryset, which are merged into the page. Once the queryset fills the
+    page its last row bounds the call, so archive files are only read when
+    they can hold rows of this page.
+    """
+    if after:
+        key = decode_cursor(after)
+        rows = list(
+            queryset.filter(Q(timestamp__gt=key[0]) | Q(timestamp=key[0], id__gt=key[1]))
+            .order_by('timestamp', 'id')[:size + 1]
+        )
+        if archived is not None:
+            bound = _key(rows[size]) if len(rows) > size else None
+            rows = _merge(rows, archived(size + 1, after=key, before=bound, newest_first=False), size + 1, False)
+        has_newer, has_older = len(rows) > size, True
+        rows = rows[:size][::-1]
+    else:
+        key = decode_cursor(before) if before else None
+        if key:
+            queryset = queryset.filter(Q(timestamp__lt=key[0]) | Q(timestamp=key[0], id__lt=key[1]))
+        rows = list(queryset.order_by('-timestamp', '-id')[:size + 1])
+        if archived is not None:
+            bound = _key(rows[size]) if len(rows) > size else None
+            rows = _merge(rows, archived(size + 1, before=key, after=bound, newest_first=True), size + 1, True)
+        has_newer, has_older = bool(before), len(rows) > size
+        rows = rows[:size]
+    newer = encode_cursor(*_key(rows[0])) if rows and has_newer else None
+    older = encode_cursor(*_key(rows[-1])) if rows and has_older else None
+    return rows, newer, older
+
+
+def search_audit(user=None, model_name=None, object_id=None, field=None, action=None, start=None, end=None):
+    """
+    Return a values() queryset of matching audit records.
+
+    With ``field`` the search runs on the AuditChange index and yields one
+    row per changed field (``old_value``/``new_value``); otherwise it yields
+    AuditLog entries.
+    """
+    model, fields = (AuditChange, CHANGE_FIELDS) if field else (AuditLog, LOG_FIELDS)
+    filters = {}
+    for name, value in (
+        ('user_id', user), ('model_name', model_name), ('object_id', object_id),
+        ('field', field), ('action', action), ('timestamp__gte', start), ('timestamp__lt', end),
+    ):
+        if value not in (None, ''):
+            filters[name] = value
+    return model.objects.filter(**filters).values(*fields)
+
+
+def search_archives(user=None, model_name=None, object_id=None, field=None, action=None, start=None, end=None):
+    """
+    Return the ``archived`` source for ``keyset_page`` that matches
+    ``search_audit`` with the same filters, yielding rows of the same shape.
+    """
+    filters = {
+        'user_id': int(user) if user not in (None, '') else None,
+        'model_name': model_name or None,
+        'object_id': object_id or None,
+        'action': action or None,
+    }
+
+    def archived(limit, **boundary):
+        entries = archived_entries(limit, start=start, end=end, field=field or None, **boundary, **filters)
+        rows = []
+        for entry in entries:
+            row = {name: entry[name] for name in LOG_FIELDS if name in entry}
+            row['user__username'] = entry['username']
+            if field:
+                change = entry['changes'][field]
+                row = {name: row[name] for name in CHANGE_FIELDS if name in row}
+                row.update(
+                    field=field,
+                    old_value=_display(change.get('old')) if isinstance(change, dict) else None,
+                    new_value=_display(change.get('new') if isinstance(change, dict) else change),
+                )
+            rows.append(row)
+        return rows
+
+    return archived
@@ -0,0 +1,9 @@
+# users/tasks.py
+from celery import shared_task
+
+from .archive import archive_closed_periods
+
+
+@shared_task
+def archive_audit_logs():
+    return [str(archive.period) for archive in archive_closed_periods()]
@@ -1,3 +1,409 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+
+from apps.inventory.models import Warehouse
+from .archive import archive_period, iter_audit_entries
+from .audit import STOP, AuditSink, field_changes
+from .authentication import APITokenAuthentication, TokenScopePermission
+from .middleware import TokenAuthenticationMiddleware
+from .models import AuditArchive, AuditChange, AuditLog, Role, User
+from .permissions import users_with_permission
+from .tokens import LocalTokenCache, issue_token, revoke_token
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def entry(action='update', changes=None, **fields):
+    return AuditLog(action=action, model_name='Warehouse', object_id='1', changes=changes, **fields)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the audit writer")
+        time.sleep(0.02)
+
+
+class AuditSinkWriteTests(TestCase):
+    def test_batch_writes_entries_and_field_changes(self):
+        AuditSink().write([
+            entry(changes={'name': {'old': 'A', 'new': 'B'}, 'code': {'old': 'W1', 'new': 'W2'}}),
+            entry(action='delete'),
+        ])
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertEqual(
+            set(AuditChange.objects.values_list('field', 'old_value', 'new_value')),
+            {('name', 'A', 'B'), ('code', 'W1', 'W2')},
+        )
+
+    def test_bad_entry_does_not_lose_the_rest_of_the_batch(self):
+        with self.assertLogs('apps.users.audit', 'ERROR'):
+            AuditSink().write([entry(action='create'), entry(changes={'name': object()}), entry(action='delete')])
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)), ['create', 'delete'])
+
+
+class AuditSinkWorkerTests(TransactionTestCase):
+    # The writer thread uses its own connection, so entries must see committed data
+
+    def test_full_batch_is_written_without_waiting_for_the_interval(self):
+        sink = AuditSink(batch_size=2, flush_interval=60)
+        sink.enqueue(entry())
+        sink.enqueue(entry())
+        wait_for(lambda: AuditLog.objects.count() == 2)
+        sink.shutdown()
+
+    def test_shutdown_flushes_a_partial_batch(self):
+        sink = AuditSink(batch_size=100, flush_interval=60)
+        sink.enqueue(entry())
+        sink.shutdown()
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertFalse(sink._worker.is_alive())
+
+    def test_flush_writes_a_partial_batch_and_keeps_the_writer(self):
+        sink = AuditSink(batch_size=100, flush_interval=60)
+        self.assertTrue(sink.flush())
+        sink.enqueue(entry())
+        sink.enqueue(entry())
+        self.assertTrue(sink.flush())
+        self.assertEqual(AuditLog.objects.count(), 2)
+        sink.enqueue(entry(action='create'))
+        sink.shutdown()
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 1)
+
+    def test_celery_worker_signals_flush_and_stop_the_writer(self):
+        from celery.signals import task_postrun, worker_process_shutdown
+        import ieep.celery  # noqa: F401 - connects the receivers
+
+        with mock.patch('apps.users.audit.audit_sink') as sink:
+            task_postrun.send(sender=None, task_id='t-1', state='SUCCESS')
+            sink.flush.assert_called_once_with()
+            worker_process_shutdown.send(sender=None, pid=1, exitcode=0)
+            sink.shutdown.assert_called_once_with()
+
+    def test_writer_survives_errors_and_is_restarted_if_it_stops(self):
+        sink = AuditSink(batch_size=1, flush_interval=0.01)
+        with mock.patch.object(sink, 'write', side_effect=RuntimeError('connection lost')), \
+                self.assertLogs('apps.users.audit', 'ERROR'):
+            sink.enqueue(entry())
+            wait_for(lambda: sink.write.called)
+        self.assertTrue(sink._worker.is_alive())
+
+        sink._queue.put(STOP)
+        sink._worker.join(5)
+        sink.enqueue(entry(action='create'))
+        wait_for(lambda: AuditLog.objects.filter(action='create').exists())
+        sink.shutdown()
+
+
+@mock.patch('apps.users.capture.audit_sink')
+class ChangeCaptureTests(TestCase):
+    def setUp(self):
+        self.first = Warehouse.objects.create(code='W1', name='Main', location='Addis')
+        self.second = Warehouse.objects.create(code='W2', name='Annex', location='Addis')
+
+    def recorded(self, sink):
+        return [
+            (call.kwargs['action'], call.kwargs['object_id'], call.kwargs['changes'])
+            for call in sink.log.call_args_list
+        ]
+
+    def test_queryset_update_records_each_changed_row(self, sink):
+        Warehouse.objects.update(location='Adama', name='Main')
+        self.assertCountEqual(self.recorded(sink), [
+            ('update', str(self.first.pk), {'location': {'old': 'Addis', 'new': 'Adama'}}),
+            ('update', str(self.second.pk), {
+                'name': {'old': 'Annex', 'new': 'Main'}, 'location': {'old': 'Addis', 'new': 'Adama'},
+            }),
+        ])
+
+    def test_queryset_update_with_expressions_reads_the_new_values(self, sink):
+        Warehouse.objects.filter(pk=self.first.pk).update(name=Concat(F('name'), Value(' (old)')))
+        self.assertEqual(self.recorded(sink), [
+            ('update', str(self.first.pk), {'name': {'old': 'Main', 'new': 'Main (old)'}}),
+        ])
+
+    def test_untracked_fields_and_no_op_updates_are_not_recorded(self, sink):
+        Warehouse.objects.update(location='Addis')
+        Warehouse.objects.update(updated_at=self.first.updated_at)
+        self.assertEqual(sink.log.call_count, 0)
+
+    def test_bulk_update_records_changes_against_the_loaded_values(self, sink):
+        warehouses = list(Warehouse.objects.order_by('pk'))
+        warehouses[0].name = 'Central'
+        Warehouse.objects.bulk_update(warehouses, ['name'])
+        self.assertEqual(self.recorded(sink), [
+            ('update', str(self.first.pk), {'name': {'old': 'Main', 'new': 'Central'}}),
+        ])
+
+    def test_save_records_only_changed_fields(self, sink):
+        warehouse = Warehouse.objects.get(pk=self.first.pk)
+        warehouse.location = 'Bishoftu'
+        warehouse.save()
+        warehouse.save()
+        self.assertEqual(self.recorded(sink), [
+            ('update', str(self.first.pk), {'location': {'old': 'Addis', 'new': 'Bishoftu'}}),
+        ])
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class APITokenTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('apps.users.tokens.local_tokens', LocalTokenCache(16, 5))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('scanner', password='x')
+        self.middleware = TokenAuthenticationMiddleware(lambda request: HttpResponse('ok'))
+
+    def call(self, key, method='get', path='/api/v1/stock-items/'):
+        request = getattr(RequestFactory(), method)(path, HTTP_AUTHORIZATION=f'Token {key}')
+        return request, self.middleware(request)
+
+    def test_read_scope_allows_safe_requests_only(self, enqueue):
+        _, key = issue_token(self.user, 'scanner', scopes=['read'])
+        request, response = self.call(key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((request.user.pk, request.auth.scopes), (self.user.pk, ('read',)))
+        _, response = self.call(key, method='post')
+        self.assertEqual(response.status_code, 403)
+
+    def test_write_scope_allows_unsafe_requests(self, enqueue):
+        _, key = issue_token(self.user, 'integration', scopes=['read', 'write'])
+        request, response = self.call(key, method='post')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(request._dont_enforce_csrf_checks)
+
+    def test_scope_permission_for_drf_views(self, enqueue):
+        _, read_key = issue_token(self.user, 'read', scopes=['read'])
+        _, write_key = issue_token(self.user, 'write', scopes=['write'])
+        permission = TokenScopePermission()
+        for key, method, allowed in [(read_key, 'get', True), (read_key, 'delete', False), (write_key, 'delete', True)]:
+            request = Request(
+                getattr(RequestFactory(), method)('/api/v1/boms/', HTTP_AUTHORIZATION=f'Token {key}'),
+                authenticators=[APITokenAuthentication()],
+            )
+            with self.subTest(method=method, scopes=request.auth.scopes):
+                self.assertEqual(request.user.pk, self.user.pk)
+                self.assertEqual(permission.has_permission(request, None), allowed)
+
+    def test_unknown_expired_and_revoked_tokens_are_rejected(self, enqueue):
+        self.assertEqual(self.call('not-a-key')[1].status_code, 401)
+        _, expired = issue_token(self.user, 'old', expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.call(expired)[1].status_code, 401)
+
+        token, key = issue_token(self.user, 'lost')
+        self.assertEqual(self.call(key)[1].status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_token(token)
+        self.assertEqual(self.call(key)[1].status_code, 401)
+
+    def test_deactivating_the_owner_rejects_cached_tokens(self, enqueue):
+        _, key = issue_token(self.user, 'scanner')
+        self.assertEqual(self.call(key)[1].status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.call(key)[1].status_code, 401)
+
+    def test_tokens_are_ignored_outside_the_api(self, enqueue):
+        request, response = self.call('not-a-key', path='/inventory/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(request, 'auth'))
+
+
+@override_settings(CACHES=LOCMEM)
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class PermissionTests(TestCase):
+    def setUp(self):
+        self.view, self.add, self.change, self.delete = (
+            Permission.objects.get(content_type__app_label='inventory', codename=f'{action}_warehouse')
+            for action in ('view', 'add', 'change', 'delete')
+        )
+        self.role = Role.objects.create(name='inventory_clerk')
+        self.role.permissions.add(self.view)
+        self.group = Group.objects.create(name='Receiving')
+        self.group.permissions.add(self.add)
+
+    def fresh(self, user):
+        # The resolved set is memoised on the instance, as it would be for one request
+        return User.objects.get(pk=user.pk)
+
+    def test_role_group_and_direct_permissions_are_combined(self, enqueue):
+        user = User.objects.create_user('clerk', password='x', role=self.role)
+        user.groups.add(self.group)
+        user.user_permissions.add(self.change)
+        user = self.fresh(user)
+        self.assertTrue(user.has_perm('inventory.view_warehouse'))
+        self.assertTrue(user.has_perm('inventory.add_warehouse'))
+        self.assertTrue(user.has_perm('inventory.change_warehouse'))
+        self.assertFalse(user.has_perm('inventory.delete_warehouse'))
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('inventory.view_warehouse'))
+
+        user.is_active = False
+        self.assertFalse(user.has_perm('inventory.view_warehouse'))
+
+    def test_role_permission_edit_is_visible_once_committed(self, enqueue):
+        user = User.objects.create_user('clerk', password='x', role=self.role)
+        self.assertFalse(self.fresh(user).has_perm('inventory.delete_warehouse'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.role.permissions.add(self.delete)
+        # Until the edit commits, other requests keep the cached set
+        self.assertFalse(self.fresh(user).has_perm('inventory.delete_warehouse'))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.fresh(user).has_perm('inventory.delete_warehouse'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.role.permissions.remove(self.delete)
+        self.assertFalse(self.fresh(user).has_perm('inventory.delete_warehouse'))
+
+    def test_users_with_permission(self, enqueue):
+        by_role = User.objects.create_user('by-role', password='x', role=self.role)
+        by_group = User.objects.create_user('by-group', password='x')
+        by_group.groups.add(self.group)
+        direct = User.objects.create_user('direct', password='x')
+        direct.user_permissions.add(self.view, self.add)
+        User.objects.create_superuser('root', password='x')
+        User.objects.create_user('inactive', password='x', role=self.role, is_active=False)
+        User.objects.create_user('nobody', password='x')
+
+        def holders(perm):
+            return sorted(user.username for user in users_with_permission(perm))
+
+        self.assertEqual(holders('inventory.view_warehouse'), ['by-role', 'direct', 'root'])
+        self.assertEqual(holders('inventory.add_warehouse'), ['by-group', 'direct', 'root'])
+        self.assertEqual(holders('inventory.delete_warehouse'), ['root'])
+        with self.assertNumQueries(0):
+            holders('inventory.view_warehouse')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            by_group.groups.remove(self.group)
+        self.assertEqual(holders('inventory.add_warehouse'), ['direct', 'root'])
+
+
+@mock.patch('apps.users.audit.AuditSink.enqueue')
+class AuditArchiveTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(AUDIT_ARCHIVE_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('auditor', password='x')
+
+    def log(self, moment, action='update', changes=None):
+        entry = AuditLog.objects.create(
+            user=self.user, action=action, model_name='Warehouse', object_id='1',
+            changes=changes, timestamp=timezone.make_aware(moment),
+        )
+        AuditChange.objects.bulk_create(field_changes(entry))
+        return entry
+
+    def search(self, **params):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('audit-log-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_archive_moves_the_month_to_a_file(self, enqueue):
+        january = [self.log(datetime(2024, 1, day)) for day in (20, 3, 11)]
+        self.log(datetime(2024, 1, 5), changes={'name': {'old': 'A', 'new': 'B'}})
+        february = self.log(datetime(2024, 2, 1))
+
+        archive = archive_period(date(2024, 1, 1))
+        self.assertEqual((archive.row_count, archive.user_ids, archive.model_names), (4, [self.user.pk], ['Warehouse']))
+        self.assertEqual(list(AuditLog.objects.values_list('id', flat=True)), [february.pk])
+        self.assertFalse(AuditChange.objects.exists())
+
+        entries = list(iter_audit_entries(
+            timezone.make_aware(datetime(2024, 1, 1)), timezone.make_aware(datetime(2024, 3, 1)),
+        ))
+        self.assertEqual([timezone.localtime(entry['timestamp']).day for entry in entries], [3, 5, 11, 20, 1])
+        self.assertEqual(entries[0], {
+            'id': january[1].pk, 'timestamp': january[1].timestamp, 'user_id': self.user.pk,
+            'username': 'auditor', 'action': 'update', 'model_name': 'Warehouse', 'object_id': '1',
+            'object_repr': None, 'changes': None, 'ip_address': None,
+        })
+
+    def test_rearchiving_merges_late_rows_into_the_file(self, enqueue):
+        for day in (2, 9, 30):
+            self.log(datetime(2024, 1, day))
+        archive_period(date(2024, 1, 1))
+        late = self.log(datetime(2024, 1, 15), action='delete')
+
+        archive = archive_period(date(2024, 1, 1))
+        self.assertEqual((archive.row_count, archive.last_id), (4, late.pk))
+        self.assertEqual(AuditArchive.objects.count(), 1)
+        self.assertFalse(AuditLog.objects.exists())
+        entries = list(iter_audit_entries(
+            timezone.make_aware(datetime(2024, 1, 1)), timezone.make_aware(datetime(2024, 2, 1)),
+        ))
+        self.assertEqual([(timezone.localtime(entry['timestamp']).day, entry['action']) for entry in entries], [
+            (2, 'update'), (9, 'update'), (15, 'delete'), (30, 'update'),
+        ])
+
+    def test_search_pages_across_the_table_and_an_archived_month(self, enqueue):
+        archived = [self.log(datetime(2024, 1, day)) for day in range(1, 6)]
+        archive_period(date(2024, 1, 1))
+        # A late arrival for the archived month, still in the table
+        late = self.log(datetime(2024, 1, 3, 12))
+        recent = [self.log(datetime(2024, 2, day)) for day in range(1, 4)]
+        newest_first = [entry.pk for entry in sorted(archived + [late] + recent, key=lambda entry: entry.timestamp, reverse=True)]
+
+        pages, cursor = [], None
+        while True:
+            page = self.search(limit=3, **({'before': cursor} if cursor else {}))
+            pages.append([row['id'] for row in page['results']])
+            cursor = page['older']
+            if cursor is None:
+                break
+        self.assertEqual(sum(pages, []), newest_first)
+        self.assertEqual(page['results'][-1]['username'], 'auditor')
+
+        second = self.search(limit=3, before=self.search(limit=3)['older'])
+        back = self.search(limit=3, after=second['newer'])
+        self.assertEqual([row['id'] for row in back['results']], newest_first[:3])
+        self.assertIsNone(back['newer'])
+
+    def test_search_over_an_archived_month_only(self, enqueue):
+        self.log(datetime(2024, 1, 4), changes={'name': {'old': 'Main', 'new': 'Central'}})
+        self.log(datetime(2024, 1, 8), action='delete')
+        self.log(datetime(2024, 2, 2), changes={'name': {'old': 'Central', 'new': 'Annex'}})
+        archive_period(date(2024, 1, 1))
+
+        january = self.search(start='2024-01-01', end='2024-02-01')
+        self.assertEqual([row['action'] for row in january['results']], ['delete', 'update'])
+        self.assertIsNone(january['older'])
+        changes = self.search(field='name', model='Warehouse')
+        self.assertEqual(
+            [(row['field'], row['old_value'], row['new_value']) for row in changes['results']],
+            [('name', 'Central', 'Annex'), ('name', 'Main', 'Central')],
+        )
+        self.assertEqual(self.search(user=self.user.pk + 1)['results'], [])
+
+    def test_audit_log_list_shows_archived_entries(self, enqueue):
+        self.log(datetime(2024, 1, 4), action='delete')
+        self.log(datetime(2024, 2, 2))
+        archive_period(date(2024, 1, 1))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('audit-log-list'))
+        self.assertEqual(response.status_code, 200)
+        logs = response.context['audit_logs']
+        self.assertEqual([(log.action, log.user.username) for log in logs], [('update', 'auditor'), ('delete', 'auditor')])
+        response = self.client.get(reverse('audit-log-list'), {'date': '2024-01-04', 'action': 'delete'})
+        self.assertEqual(len(response.context['audit_logs']), 1)
@@ -0,0 +1,154 @@
+# users/tokens.py
+"""
+API token authentication.
+
+Keys are random 256-bit strings, so they are stored as a plain SHA-256
+hash: checking one is a hash and a dictionary lookup, not a PBKDF2 run.
+Validated tokens are cached in process for ``API_TOKEN_LOCAL_TTL``
+seconds and in the shared cache for ``SHARED_TTL``. Revoking a token, or
+changing its owner, deletes the shared entry at once; other processes
+drop their local copy within the local TTL.
+"""
+import copy
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import APIToken, User
+
+TOKEN_CACHE_KEY = 'users:api-token:{}'
+SHARED_TTL = 300
+LOCAL_SIZE = 1024
+KEYWORDS = ('Token', 'Bearer')
+
+TokenInfo = namedtuple('TokenInfo', ['id', 'user', 'scopes', 'expires_at'])
+
+
+class LocalTokenCache:
+    """Small thread-safe LRU of validated tokens with a per-entry TTL."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash):
+        with self._lock:
+            item = self._entries.get(key_hash)
+            if item is None:
+                return None
+            entry, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            return entry
+
+    def set(self, key_hash, entry):
+        with self._lock:
+            self._entries[key_hash] = (entry, time.monotonic())
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+
+local_tokens = LocalTokenCache(LOCAL_SIZE, getattr(settings, 'API_TOKEN_LOCAL_TTL', 5))
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(user, name, scopes=('read',), expires_at=None):
+    """Create a token and return ``(token, key)``; the key cannot be recovered later."""
+    key = secrets.token_urlsafe(32)
+    token = APIToken.objects.create(
+        user=user,
+        name=name,
+        key_prefix=key[:8],
+        key_hash=hash_key(key),
+        scopes=list(scopes),
+        expires_at=expires_at,
+    )
+    return token, key
+
+
+def revoke_token(token):
+    token.revoked_at = timezone.now()
+    token.save(update_fields=['revoked_at'])
+
+
+def forget_tokens(key_hashes):
+    """Drop cached validations so the next request re-reads the tokens."""
+    cache.delete_many([TOKEN_CACHE_KEY.format(key_hash) for key_hash in key_hashes])
+    for key_hash in key_hashes:
+        local_tokens.discard(key_hash)
+
+
+def parse_authorization(header):
+    """Return the key from an ``Authorization: Token <key>`` header, or None."""
+    parts = header.split()
+    if len(parts) == 2 and parts[0] in KEYWORDS:
+        return parts[1]
+    return None
+
+
+def authenticate_token(key):
+    """Return a ``TokenInfo`` for a valid, unexpired, unrevoked key, or None."""
+    key_hash = hash_key(key)
+    entry = local_tokens.get(key_hash)
+    if entry is None:
+        cache_key = TOKEN_CACHE_KEY.format(key_hash)
+        entry = cache.get(cache_key)
+        if entry is None:
+            token = (
+                APIToken.objects.select_related('user')
+                .filter(key_hash=key_hash, revoked_at__isnull=True, user__is_active=True)
+                .first()
+            )
+            if token is None:
+                return None
+            entry = TokenInfo(token.pk, token.user, tuple(token.scopes), token.expires_at)
+            cache.set(cache_key, entry, SHARED_TTL)
+            # Recorded at most once per shared-cache period instead of on every request
+            APIToken.objects.filter(pk=token.pk).update(last_used_at=timezone.now())
+        local_tokens.set(key_hash, entry)
+    if entry.expires_at is not None and entry.expires_at <= timezone.now():
+        return None
+    # Each request gets its own user object so per-request memos do not leak
+    user = copy.copy(entry.user)
+    user.__dict__.pop('_resolved_perm_cache', None)
+    return entry._replace(user=user)
+
+
+def invalidate_token(sender, instance, **kwargs):
+    key_hash = instance.key_hash
+    transaction.on_commit(lambda: forget_tokens([key_hash]))
+
+
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    from .permissions import IRRELEVANT_USER_FIELDS
+    if update_fields and set(update_fields) <= IRRELEVANT_USER_FIELDS:
+        return
+    key_hashes = list(APIToken.objects.filter(user_id=instance.pk).values_list('key_hash', flat=True))
+    if key_hashes:
+        transaction.on_commit(lambda: forget_tokens(key_hashes))
+
+
+def connect_signals():
+    post_save.connect(invalidate_token, sender=APIToken, dispatch_uid='api-token-save')
+    post_delete.connect(invalidate_token, sender=APIToken, dispatch_uid='api-token-delete')
+    post_save.connect(invalidate_user_tokens, sender=User, dispatch_uid='api-token-user-save')
@@ -23,4 +23,5 @@ urlpatterns = [
     ),
     path("roles/", views.RoleListView.as_view(), name="role-list"),
     path("audit-logs/", views.AuditLogListView.as_view(), name="audit-log-list"),
+    path("audit-logs/search/", views.AuditSearchView.as_view(), name="audit-log-search"),
 ]
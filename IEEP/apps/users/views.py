@@ -1,4 +1,7 @@
 # users/views.py
+import json
+from datetime import datetime, timedelta
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -7,7 +10,15 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.views import View
 from django.http import JsonResponse
+from django.core.exceptions import BadRequest
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from apps.polling import AsyncJsonView
 from .models import User, Role, AuditLog
+from .archive import ENTRY_FIELDS, archived_entries
+from .audit import audit_sink
+from .search import InvalidCursor, MAX_PAGE_SIZE, PAGE_SIZE, keyset_page, search_archives, search_audit
 from .forms import UserForm
 from django.contrib.auth.views import PasswordResetView
 from django.contrib.messages.views import SuccessMessageMixin
@@ -23,7 +34,7 @@ class LoginView(View):
         if user is not None:
             login(request, user)
             # Log the login action
-            AuditLog.objects.create(
+            audit_sink.log(
                 user=user,
                 action='login',
                 model_name='User',
@@ -52,7 +63,7 @@ class LogoutView(View):
     def post(self, request):
         if request.user.is_authenticated:
             # Log the logout action
-            AuditLog.objects.create(
+            audit_sink.log(
                 user=request.user,
                 action='logout',
                 model_name='User',
@@ -84,10 +95,11 @@ class AuthRootView(View):
             }
         })
 
-@method_decorator(login_required, name='dispatch')
-class UserProfileView(View):
-    def get(self, request):
-        user = request.user
+class UserProfileView(AsyncJsonView):
+    async def get(self, request):
+        user = await User.objects.select_related('role').filter(pk=request.user_id, is_active=True).afirst()
+        if user is None:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
         return JsonResponse({
             'id': user.id,
             'username': user.username,
@@ -117,13 +129,110 @@ class RoleListView(ListView):
     template_name = 'users/role_list.html'
     context_object_name = 'roles'
 
+def parse_moment(value):
+    """Parse an ISO date or datetime query parameter into an aware datetime."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date '{value}'")
+        moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
 @method_decorator(login_required, name='dispatch')
 class AuditLogListView(ListView):
+    """Newest-first audit log with keyset paging (``?before=``/``?after=`` cursors)."""
     model = AuditLog
     template_name = 'users/audit_log_list.html'
     context_object_name = 'audit_logs'
-    paginate_by = 50
-    ordering = ['-timestamp']
+    page_size = PAGE_SIZE
+
+    def get_queryset(self):
+        queryset = AuditLog.objects.select_related('user__role')
+        params = self.request.GET
+        # The same filters for months moved to archive files
+        self.archive_filters = {}
+        if params.get('action'):
+            queryset = queryset.filter(action=params['action'])
+            self.archive_filters['action'] = params['action']
+        if params.get('user'):
+            if not params['user'].isdigit():
+                raise BadRequest(f"Invalid user id '{params['user']}'")
+            queryset = queryset.filter(user_id=params['user'])
+            self.archive_filters['user_id'] = int(params['user'])
+        if params.get('date'):
+            try:
+                start = parse_moment(params['date'])
+            except ValueError as exc:
+                raise BadRequest(str(exc))
+            queryset = queryset.filter(timestamp__gte=start, timestamp__lt=start + timedelta(days=1))
+            self.archive_filters.update(start=start, end=start + timedelta(days=1))
+        return queryset
+
+    def archived_logs(self, limit, **boundary):
+        entries = archived_entries(limit, **boundary, **self.archive_filters)
+        logs = [
+            AuditLog(**{name: entry[name] for name in ENTRY_FIELDS if name in entry})
+            for entry in entries
+        ]
+        prefetch_related_objects(logs, 'user__role')
+        return logs
+
+    def get_context_data(self, **kwargs):
+        params = self.request.GET
+        try:
+            logs, newer, older = keyset_page(
+                self.object_list, params.get('before'), params.get('after'), self.page_size,
+                archived=self.archived_logs,
+            )
+        except InvalidCursor as exc:
+            raise BadRequest(str(exc))
+        for log in logs:
+            log.changes_json = json.dumps(log.changes or {}, default=str)
+        filters = params.copy()
+        for name in ('before', 'after'):
+            filters.pop(name, None)
+        kwargs.update({
+            'object_list': logs,
+            'newer_cursor': newer,
+            'older_cursor': older,
+            'current_filters': filters.urlencode(),
+            'users': User.objects.only('id', 'first_name', 'last_name', 'username').order_by('username'),
+        })
+        return super().get_context_data(**kwargs)
+
+@method_decorator(login_required, name='dispatch')
+class AuditSearchView(View):
+    """
+    JSON audit search by user, model, object, field, action and time range.
+
+    With ``field`` the results are individual field changes; otherwise
+    whole audit entries. Paged newest first with ``before``/``after`` cursors.
+    """
+    def get(self, request):
+        params = request.GET
+        try:
+            start = parse_moment(params['start']) if params.get('start') else None
+            end = parse_moment(params['end']) if params.get('end') else None
+            size = min(max(int(params.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            filters = {
+                'user': params.get('user'),
+                'model_name': params.get('model'),
+                'object_id': params.get('object_id'),
+                'field': params.get('field'),
+                'action': params.get('action'),
+                'start': start,
+                'end': end,
+            }
+            rows, newer, older = keyset_page(
+                search_audit(**filters), params.get('before'), params.get('after'), size,
+                archived=search_archives(**filters),
+            )
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        for row in rows:
+            row['username'] = row.pop('user__username')
+        return JsonResponse({'results': rows, 'newer': newer, 'older': older})
 
 class UserCreateView(LoginRequiredMixin, CreateView):
     model = User
@@ -133,7 +242,7 @@ class UserCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        AuditLog.objects.create(
+        audit_sink.log(
             user=self.request.user,
             action='create',
             model_name='User',
@@ -165,7 +274,7 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
                 'new': str(getattr(self.object, field))
             }
         if changes:
-            AuditLog.objects.create(
+            audit_sink.log(
                 user=self.request.user,
                 action='update',
                 model_name='User',
@@ -193,7 +302,7 @@ class UserToggleActiveView(LoginRequiredMixin, View):
         user.is_active = not user.is_active
         user.save()
 
-        AuditLog.objects.create(
+        audit_sink.log(
             user=request.user,
             action='update',
             model_name='User',
@@ -219,7 +328,7 @@ class UserResetPasswordView(LoginRequiredMixin, View):
         new_pass = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(12))
         user.set_password(new_pass)
         user.save()
-        AuditLog.objects.create(
+        audit_sink.log(
             user=request.user,
             action='update',
             model_name='User',
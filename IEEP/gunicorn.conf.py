@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+"""
+Production web server: gunicorn supervising uvicorn workers that serve
+``ieep.asgi``. Run from this directory with
+
+    gunicorn ieep.asgi:application -c gunicorn.conf.py
+
+Each worker is one process with one event loop. Idle long-polls (unread
+badge, stock deltas) wait as coroutines, so a worker holds thousands of
+them; sync views still run one at a time per request thread.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# The arbiter's heartbeat, not a per-request limit: long-polls may run past it
+timeout = 60
+# Longer than the 25 second long-poll (apps/polling.py), so a reload lets waiting polls answer
+graceful_timeout = 30
+# Above the proxy's upstream keepalive, so the proxy closes idle connections first
+keepalive = 75
+
+accesslog = '-'
+errorlog = '-'
@@ -6,6 +6,32 @@ app = Celery('IEEP')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# Task timings for the metrics endpoint; connected here so web processes do not load Celery for them
+from apps.monitoring.taskmetrics import connect_task_signals  # noqa: E402
+connect_task_signals()
+
+# Deduplication keys of enqueued tasks (apps/jobs.py) are released when the task starts
+from apps.jobs import connect_job_signals  # noqa: E402
+connect_job_signals()
+
+# Worker processes exit without running atexit hooks, so buffered audit entries
+# (apps/users/audit.py) are written after each task and when the process shuts down.
+# The audit module needs the app registry, which is not ready when this module loads.
+from celery.signals import task_postrun, worker_process_shutdown  # noqa: E402
+
+
+@task_postrun.connect(dispatch_uid='audit-flush-after-task')
+def flush_audit_log(**kwargs):
+    from apps.users.audit import audit_sink
+    audit_sink.flush()
+
+
+@worker_process_shutdown.connect(dispatch_uid='audit-shutdown-worker-process')
+def stop_audit_log(**kwargs):
+    from apps.users.audit import audit_sink
+    audit_sink.shutdown()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
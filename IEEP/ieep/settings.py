@@ -51,21 +51,24 @@ INSTALLED_APPS = [
     'apps.products',
     'apps.inventory',
     'apps.production',
-    'apps.maintenance',
     'apps.procurement',
-    'apps.quality',
-    'apps.finance',
     'apps.reports',
     'apps.notifications',
+    'apps.monitoring',
 ]
 
 MIDDLEWARE = [
+    'apps.monitoring.instrumentation.MetricsMiddleware',
+    'apps.monitoring.profiler.QueryProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.users.middleware.TokenAuthenticationMiddleware',
+    'apps.monitoring.sampling.SamplingProfilerMiddleware',
+    'apps.users.middleware.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -124,13 +127,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+AUTHENTICATION_BACKENDS = [
+    'apps.users.permissions.RolePermissionBackend',
+]
+
+# Seconds a validated API token is trusted in process before the shared cache is consulted again
+API_TOKEN_LOCAL_TTL = 5
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'apps.users.authentication.APITokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+        'apps.users.authentication.TokenScopePermission',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
@@ -145,17 +157,113 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = 'Inter Emirates Ethio Paint ERP <noreply@interemirates.com>'
 
+CACHES = {
+    'default': {
+        # RedisCache that counts hits and misses (apps/monitoring/cache.py)
+        'BACKEND': 'apps.monitoring.cache.InstrumentedRedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
+# Session reads (e.g. badge long-polls) are served from the cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 CELERY_TIMEZONE = TIME_ZONE
+# CELERY_EAGER=True runs every task inline in the sending process, with an in-memory
+# broker and result backend, so the task layer can be exercised without Redis
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_EAGER', 'False').lower() == 'true'
+if CELERY_TASK_ALWAYS_EAGER:
+    CELERY_TASK_EAGER_PROPAGATES = True
+    CELERY_BROKER_URL = 'memory://'
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+
+# Queues by task (apps/jobs.py); tasks not listed here run on the default queue
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'apps.users.tasks.archive_audit_logs': {'queue': 'bulk'},
+    'apps.monitoring.tasks.prune_request_profiles': {'queue': 'bulk'},
+    'apps.inventory.tasks.relay_stock_events': {'queue': 'alerts'},
+    'apps.inventory.tasks.prune_stock_events': {'queue': 'bulk'},
+    'apps.reports.tasks.prune_generated_reports': {'queue': 'bulk'},
+}
+# Worker settings per queue, used by `manage.py run_worker <queue>`. Long jobs prefetch
+# one task at a time so a busy worker does not hold queued tasks another could run.
+TASK_QUEUE_WORKERS = {
+    'alerts': {'concurrency': 4, 'prefetch_multiplier': 1},
+    'default': {'concurrency': 4, 'prefetch_multiplier': 4},
+    'reports': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'bulk': {'concurrency': 2, 'prefetch_multiplier': 1},
+}
+CELERY_BEAT_SCHEDULE = {
+    'snapshot-dashboard-metrics': {
+        'task': 'apps.reports.tasks.snapshot_dashboard_metrics',
+        'schedule': 3600,
+    },
+    'archive-audit-logs': {
+        'task': 'apps.users.tasks.archive_audit_logs',
+        'schedule': 86400,
+    },
+    'prune-request-profiles': {
+        'task': 'apps.monitoring.tasks.prune_request_profiles',
+        'schedule': 86400,
+    },
+    'relay-stock-events': {
+        'task': 'apps.inventory.tasks.relay_stock_events',
+        'schedule': 5,
+    },
+    'prune-stock-events': {
+        'task': 'apps.inventory.tasks.prune_stock_events',
+        'schedule': 86400,
+    },
+    'prune-generated-reports': {
+        'task': 'apps.reports.tasks.prune_generated_reports',
+        'schedule': 86400,
+    },
+}
+
+# Delivered stock events (apps/inventory/outbox.py) are kept this long for replays
+STOCK_EVENT_RETENTION_DAYS = 7
+# Failed deliveries before a stock event is set aside
+STOCK_EVENT_MAX_ATTEMPTS = 5
+
+# Generated report files (MEDIA_ROOT/reports) are re-rendered on demand after this long
+REPORT_RETENTION_DAYS = 7
+
+# Audit entries are written in batches by a background thread (apps/users/audit.py)
+AUDIT_LOG_BATCH_SIZE = 200
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+# Months kept in the AuditLog table; older months are moved to AUDIT_ARCHIVE_ROOT
+AUDIT_LOG_HOT_MONTHS = 3
+AUDIT_ARCHIVE_ROOT = BASE_DIR / 'archive' / 'audit'
+
+# Per-request query profiling (apps/monitoring/profiler.py); off unless QUERY_PROFILER=True
+QUERY_PROFILER_ENABLED = os.environ.get('QUERY_PROFILER', 'False').lower() == 'true'
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = 5
+QUERY_PROFILER_SAMPLES = 500
+
+# Per-request stack sampling (apps/monitoring/sampling.py): staff can ask with X-Profile: 1 or ?_profile=1
+REQUEST_PROFILER_ENABLED = True
+REQUEST_PROFILER_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILER_SAMPLE_RATE', '0'))
+REQUEST_PROFILER_INTERVAL = 0.005
+REQUEST_PROFILE_ROOT = MEDIA_ROOT / 'profiles'
+REQUEST_PROFILE_RETENTION_DAYS = 14
+
+# In-process metrics (apps/monitoring/metrics.py), scraped from /api/monitoring/metrics/
+METRICS_ENABLED = True
+# Each process pushes its counters and histograms to the cache so scrapes report all of them (sharedmetrics.py)
+METRICS_SHARED = True
+METRICS_PUSH_INTERVAL = 5
 
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
+        # Written by a background thread so disk I/O never blocks requests (apps/monitoring/logqueue.py)
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'apps.monitoring.logqueue.QueuedFileHandler',
             'filename': BASE_DIR / 'erp.log',
         },
     },
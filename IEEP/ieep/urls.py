@@ -15,22 +15,31 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from django.views.generic import TemplateView
-from django.contrib.auth.decorators import login_required
+from rest_framework.routers import SimpleRouter
+from apps.inventory.api import StockDeltaView, StockItemViewSet, StockLookupView, WarehouseViewSet
+from apps.products.api import BOMViewSet, ProductViewSet
+from apps.reports.views import DashboardView
+
+# Read-only JSON API (apps/api.py); names are prefixed to stay clear of the HTML views
+api = SimpleRouter()
+api.register('products', ProductViewSet, basename='api-product')
+api.register('boms', BOMViewSet, basename='api-bom')
+api.register('warehouses', WarehouseViewSet, basename='api-warehouse')
+api.register('stock-items', StockItemViewSet, basename='api-stock-item')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', login_required(TemplateView.as_view(template_name='dashboard.html')), name='dashboard'),
+    path('', DashboardView.as_view(), name='dashboard'),
     path('login/', TemplateView.as_view(template_name='users/login.html'), name='login'),
     path('api/auth/', include('apps.users.urls')),
     path('api/products/', include('apps.products.urls')),
     path('api/inventory/', include('apps.inventory.urls')),
-    path('api/production/', include('apps.production.urls')),
-    path('api/maintenance/', include('apps.maintenance.urls')),
-    path('api/procurement/', include('apps.procurement.urls')),
-    path('api/quality/', include('apps.quality.urls')),
-    path('api/finance/', include('apps.finance.urls')),
     path('api/reports/', include('apps.reports.urls')),
     path('api/notifications/', include('apps.notifications.urls')),
+    path('api/monitoring/', include('apps.monitoring.urls')),
+    path('api/v1/stock-deltas/', StockDeltaView.as_view(), name='api-stock-deltas'),
+    path('api/v1/lookup/<str:code>/', StockLookupView.as_view(), name='api-stock-lookup'),
+    path('api/v1/', include(api.urls)),
 ]